@@ -0,0 +1,159 @@
+"""
+Admission control in front of the expensive downstreams (Ollama, Gemini).
+
+UserRateLimiter keeps a token bucket per user, so one user cannot take more
+than their share. ConcurrencyLimiter caps in-flight calls to one downstream
+and lets a bounded number of requests wait, each no longer than its deadline.
+When a bucket is empty, the queue is full or the wait would pass the deadline,
+they raise Rejected right away with a Retry-After estimate. The server turns
+that into a 429 (rate limited) or 503 (saturated) instead of piling more work
+onto a backend that is already behind.
+
+Limits are per worker process.
+"""
+import math
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+
+class Rejected(Exception):
+    """
+    Request not admitted, or a downstream it needs is unavailable. status is the HTTP status
+    to answer with; retry_after is in whole seconds.
+    """
+
+    def __init__(self, reason, status, retry_after, downstream=None):
+        super().__init__(f"{reason} ({downstream or 'user'}), retry after {retry_after}s")
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+        self.downstream = downstream
+
+
+class UserRateLimiter:
+    """Token bucket per user: `rate_per_minute` sustained, bursts of up to `burst`. Least recently seen users are evicted."""
+
+    def __init__(self, rate_per_minute, burst, max_users=10000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at]
+        self.admitted = 0
+        self.rejected = 0
+
+    def acquire(self, key):
+        """Takes one token for key, or raises Rejected (429) with the time until one is available."""
+        now = time.monotonic()
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            bucket = [float(self.burst), now]
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        self._buckets[key] = bucket
+        if len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)
+
+        if tokens >= 1.0:
+            bucket[0], bucket[1] = tokens - 1.0, now
+            self.admitted += 1
+            return
+        bucket[0], bucket[1] = tokens, now
+        self.rejected += 1
+        retry_after = math.ceil((1.0 - tokens) / self.rate) if self.rate > 0 else 60
+        raise Rejected("rate_limited", 429, max(retry_after, 1))
+
+    def stats(self):
+        return {"users": len(self._buckets), "admitted": self.admitted, "rejected": self.rejected}
+
+
+class ConcurrencyLimiter:
+    """
+    At most `limit` concurrent holders of slot(); up to `max_queue` more wait in FIFO
+    order for at most `max_wait_seconds` (or the caller's deadline, if sooner).
+    """
+
+    def __init__(self, name, limit, max_queue, max_wait_seconds):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.in_flight = 0
+        self._waiters = OrderedDict()  # future -> None, in arrival order
+        self._mean_hold = 1.0  # EWMA of seconds a slot is held, for Retry-After
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+
+    def _retry_after(self):
+        backlog = (len(self._waiters) + 1) / max(self.limit, 1)
+        return max(math.ceil(backlog * self._mean_hold), 1)
+
+    async def _acquire(self, deadline):
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_full += 1
+            raise Rejected("queue_full", 503, self._retry_after(), self.name)
+
+        loop = asyncio.get_running_loop()
+        timeout = self.max_wait_seconds
+        if deadline is not None:
+            timeout = min(timeout, deadline - loop.time())
+        if timeout <= 0:
+            self.rejected_timeout += 1
+            raise Rejected("queue_timeout", 503, self._retry_after(), self.name)
+
+        waiter = loop.create_future()
+        self._waiters[waiter] = None
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ran out; keep it
+                return
+            waiter.cancel()
+            self.rejected_timeout += 1
+            raise Rejected("queue_timeout", 503, self._retry_after(), self.name)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            self._waiters.pop(waiter, None)
+
+    def _release(self):
+        # Hand the slot straight to the oldest live waiter, so in_flight never drops below a waiting queue
+        while self._waiters:
+            waiter, _ = self._waiters.popitem(last=False)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, deadline=None):
+        """Holds one of the downstream's slots; deadline is an event-loop time, or None for max_wait_seconds."""
+        await self._acquire(deadline)
+        self.admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._mean_hold = 0.9 * self._mean_hold + 0.1 * (time.monotonic() - started)
+            self._release()
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_full,
+            "rejected_queue_timeout": self.rejected_timeout,
+            "mean_hold_seconds": round(self._mean_hold, 3),
+        }
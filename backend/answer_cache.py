@@ -0,0 +1,111 @@
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Caches generated answers by query embedding.
+
+    A lookup returns a cached (answer, sources) pair when a stored query lies
+    within max_distance (cosine distance) of the new one. Entries expire after
+    ttl_seconds, the least recently used entry is evicted once max_entries is
+    reached, and everything is dropped whenever the index fingerprint changes.
+
+    Vectors live in one preallocated float32 matrix so a lookup is a single
+    matrix-vector product. Not thread-safe: call it from the event loop.
+    """
+
+    def __init__(self, max_entries=1024, max_distance=0.05, ttl_seconds=6 * 3600):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self._vectors = None
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._created_at = np.zeros(max_entries)
+        self._entries = OrderedDict()  # slot -> (answer, sources), in LRU order
+        self._fingerprint = None
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def lookup(self, embedding, fingerprint):
+        """Returns (answer, sources) for a near-duplicate cached query, else None."""
+        if not self.enabled:
+            return None
+        self._check_fingerprint(fingerprint)
+        # Drop expired entries first, so an expired nearest match does not hide a valid one behind it
+        for slot in np.flatnonzero(self._valid & (time.monotonic() - self._created_at > self.ttl_seconds)):
+            self._evict(int(slot))
+        if not self._entries:
+            self.misses += 1
+            return None
+
+        query = self._normalize(embedding)
+        similarities = self._vectors @ query
+        similarities[~self._valid] = -np.inf
+        slot = int(np.argmax(similarities))
+
+        if 1.0 - similarities[slot] > self.max_distance:
+            self.misses += 1
+            return None
+
+        answer, sources = self._entries[slot]
+        self._entries.move_to_end(slot)
+        self.hits += 1
+        return answer, sources
+
+    def store(self, embedding, answer, sources, fingerprint):
+        if not self.enabled:
+            return
+        self._check_fingerprint(fingerprint)
+        query = self._normalize(embedding)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, query.shape[0]), dtype=np.float32)
+
+        if len(self._entries) >= self.max_entries:
+            slot, _ = self._entries.popitem(last=False)
+        else:
+            slot = int(np.argmin(self._valid))  # first free slot
+
+        self._vectors[slot] = query
+        self._valid[slot] = True
+        self._created_at[slot] = time.monotonic()
+        self._entries[slot] = (answer, sources)
+
+    def clear(self):
+        self._entries.clear()
+        self._valid[:] = False
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _check_fingerprint(self, fingerprint):
+        if fingerprint != self._fingerprint:
+            if self._entries:
+                self.invalidations += 1
+            self.clear()
+            self._fingerprint = fingerprint
+
+    def _evict(self, slot):
+        del self._entries[slot]
+        self._valid[slot] = False
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
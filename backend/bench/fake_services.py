@@ -0,0 +1,121 @@
+"""
+Local stand-ins for the Ollama embed API and the Gemini REST API, for benchmarks.
+
+    python bench/fake_services.py --port 8090 --embed-latency-ms 15 --gemini-first-token-ms 400
+
+Point the server at it with OLLAMA_EMBED_URL=http://127.0.0.1:8090/api/embed and
+GEMINI_API_BASE=http://127.0.0.1:8090. Embeddings are deterministic: a text's
+vector is the normalized sum of per-word pseudo-random vectors, so texts that
+share words land close together and retrieval over a synthetic collection
+(bench/make_collection.py) behaves like the real thing.
+"""
+import json
+import random
+import asyncio
+import hashlib
+import argparse
+import functools
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+DIM = 1024  # bge-m3
+
+
+@functools.lru_cache(maxsize=65536)
+def _word_vector(word, dim):
+    seed = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed).standard_normal(dim, dtype=np.float32)
+
+
+def fake_embedding(text, dim=DIM):
+    words = text.lower().split() or [""]
+    vector = np.sum([_word_vector(word, dim) for word in words], axis=0)
+    return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+
+settings = {
+    "dim": DIM,
+    "embed_latency_ms": 15.0,
+    "embed_per_item_ms": 2.0,
+    "gemini_first_token_ms": 400.0,
+    "gemini_tokens": 60,
+    "gemini_token_interval_ms": 15.0,
+    "jitter": 0.2,
+    "error_rate": 0.0,
+}
+app = FastAPI()
+
+
+async def _sleep_ms(milliseconds):
+    jitter = settings["jitter"]
+    await asyncio.sleep(max(milliseconds * random.uniform(1 - jitter, 1 + jitter), 0) / 1000)
+
+
+def _fail():
+    return random.random() < settings["error_rate"]
+
+
+@app.post("/api/embed")
+async def embed(request: Request):
+    body = await request.json()
+    texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    await _sleep_ms(settings["embed_latency_ms"] + settings["embed_per_item_ms"] * len(texts))
+    if _fail():
+        return JSONResponse(status_code=503, content={"error": "injected failure"})
+    return {"model": body.get("model"), "embeddings": [fake_embedding(text, settings["dim"]) for text in texts]}
+
+
+def _answer_words(prompt):
+    words = [f"word{i}" for i in range(settings["gemini_tokens"])]
+    words[0] = f"({len(prompt)} prompt chars)"
+    return words
+
+
+def _candidate(text):
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}]}
+
+
+@app.post("/v1beta/models/{model_method}")
+async def generate(model_method: str, request: Request):
+    _, _, method = model_method.partition(":")
+    body = await request.json()
+    prompt = body["contents"][0]["parts"][0]["text"]
+    words = _answer_words(prompt)
+
+    if method == "generateContent":
+        await _sleep_ms(settings["gemini_first_token_ms"] + settings["gemini_token_interval_ms"] * len(words))
+        if _fail():
+            return JSONResponse(status_code=503, content={"error": {"message": "injected failure"}})
+        return _candidate(" ".join(words))
+
+    if method == "streamGenerateContent":
+        async def events():
+            await _sleep_ms(settings["gemini_first_token_ms"])
+            for i, word in enumerate(words):
+                if i:
+                    await _sleep_ms(settings["gemini_token_interval_ms"])
+                yield f"data: {json.dumps(_candidate(word + ' '))}\r\n\r\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return JSONResponse(status_code=404, content={"error": {"message": f"unknown method {method}"}})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama embed + Gemini REST server for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--dim", type=int, default=DIM)
+    parser.add_argument("--embed-latency-ms", type=float, default=settings["embed_latency_ms"])
+    parser.add_argument("--embed-per-item-ms", type=float, default=settings["embed_per_item_ms"])
+    parser.add_argument("--gemini-first-token-ms", type=float, default=settings["gemini_first_token_ms"])
+    parser.add_argument("--gemini-tokens", type=int, default=settings["gemini_tokens"])
+    parser.add_argument("--gemini-token-interval-ms", type=float, default=settings["gemini_token_interval_ms"])
+    parser.add_argument("--jitter", type=float, default=settings["jitter"], help="uniform +/- fraction applied to every delay")
+    parser.add_argument("--error-rate", type=float, default=settings["error_rate"], help="fraction of calls answered with 503")
+    args = parser.parse_args()
+    settings.update({key: value for key, value in vars(args).items() if key in settings})
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
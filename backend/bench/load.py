@@ -0,0 +1,302 @@
+"""
+Load driver for the API server.
+
+Seeds benchmark users straight into the server's database, signs session
+cookies with the server's SESSION_SECRET_KEY (bypassing Google OAuth), then
+runs virtual users that replay a question mix against /ask, /ask/stream,
+/conversations and /conversations/{id}. Reports throughput and p50/p95/p99
+per operation, optionally compared against a saved baseline. Admission
+rejections (429/503) are counted apart from errors and left out of the
+latencies.
+
+    DATABASE_URL=sqlite:////tmp/bench.db SESSION_SECRET_KEY=bench \\
+        python bench/load.py --base-url http://127.0.0.1:8000 --duration 30 --concurrency 32 \\
+        --output results.json [--baseline baseline.json --max-regression 0.15]
+
+Exits with status 1 when any operation's p95 regressed by more than
+--max-regression against the baseline, or its error rate exceeded --max-error-rate.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import random
+import asyncio
+import argparse
+
+import httpx
+import numpy as np
+from itsdangerous import TimestampSigner
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from make_collection import TOPICS, question_for
+
+CANNED_QUESTIONS = ["hello", "hi", "who are you", "what can you do", "thank you", "who is harry"]
+
+
+def session_cookie(secret, session):
+    """The value Starlette's SessionMiddleware would set for this session dict."""
+    data = base64.b64encode(json.dumps(session).encode('utf-8'))
+    return TimestampSigner(secret).sign(data).decode('utf-8')
+
+
+def seed_users(count):
+    """Creates (or reuses) bench users in DATABASE_URL and returns their session dicts."""
+    import database
+    database.init_db()
+    sessions = []
+    with database.SessionLocal() as db:
+        for i in range(count):
+            email = f"bench{i}@example.com"
+            user = db.query(database.User).filter(database.User.email == email).first()
+            if user is None:
+                user = database.User(email=email, name=f"Bench User {i}", picture="")
+                db.add(user)
+                db.flush()
+            sessions.append({"user": {"email": email, "name": user.name, "picture": ""}, "user_id": user.id})
+        db.commit()
+    return sessions
+
+
+# Admission-control answers (rate limited, queue full, circuit open): the server shedding load, not failing
+REJECTION_STATUSES = (429, 503)
+
+
+def outcome_for(status_code):
+    if status_code == 200:
+        return "ok"
+    return "rejected" if status_code in REJECTION_STATUSES else "error"
+
+
+class Recorder:
+    """Latencies of answered requests; rejections and errors are only counted, so fast 429/503s do not skew them."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.requests = {}
+        self.errors = {}
+        self.rejected = {}
+        self.first_token = []
+
+    def record(self, operation, seconds, outcome):
+        self.requests[operation] = self.requests.get(operation, 0) + 1
+        if outcome == "ok":
+            self.latencies.setdefault(operation, []).append(seconds)
+        elif outcome == "rejected":
+            self.rejected[operation] = self.rejected.get(operation, 0) + 1
+        else:
+            self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def summary(self, wall_seconds):
+        result = {}
+        for operation, requests in sorted(self.requests.items()):
+            ms = np.asarray(self.latencies.get(operation) or [0.0]) * 1000
+            result[operation] = {
+                "requests": requests,
+                "errors": self.errors.get(operation, 0),
+                "rejected": self.rejected.get(operation, 0),
+                "throughput_rps": round(len(self.latencies.get(operation, [])) / wall_seconds, 2),
+                "p50_ms": round(float(np.percentile(ms, 50)), 1),
+                "p95_ms": round(float(np.percentile(ms, 95)), 1),
+                "p99_ms": round(float(np.percentile(ms, 99)), 1),
+                "max_ms": round(float(ms.max()), 1),
+            }
+        if self.first_token:
+            ms = np.asarray(self.first_token) * 1000
+            result["ask_stream"]["first_token_p50_ms"] = round(float(np.percentile(ms, 50)), 1)
+            result["ask_stream"]["first_token_p95_ms"] = round(float(np.percentile(ms, 95)), 1)
+        return result
+
+
+class QuestionMix:
+    """canned greetings, popular questions repeated across users (cache-friendly) and one-off questions."""
+
+    def __init__(self, rng, canned_ratio, repeat_ratio, popular=20):
+        self.rng = rng
+        self.canned_ratio = canned_ratio
+        self.repeat_ratio = repeat_ratio
+        self.popular = [question_for(rng, rng.choice(list(TOPICS))) for _ in range(popular)]
+
+    def next(self):
+        roll = self.rng.random()
+        if roll < self.canned_ratio:
+            return self.rng.choice(CANNED_QUESTIONS)
+        if roll < self.canned_ratio + self.repeat_ratio:
+            return self.rng.choice(self.popular)
+        topic = self.rng.choice(list(TOPICS))
+        return f"{question_for(self.rng, topic)} {self.rng.randint(0, 10**6)}"
+
+
+async def ask(client, recorder, question, conversation_id):
+    started = time.perf_counter()
+    try:
+        response = await client.post("/ask", json={"query": question, "conversation_id": conversation_id})
+        outcome = outcome_for(response.status_code)
+        recorder.record("ask", time.perf_counter() - started, outcome)
+        return response.json().get("conversation_id") if outcome == "ok" else conversation_id
+    except httpx.HTTPError:
+        recorder.record("ask", time.perf_counter() - started, "error")
+        return conversation_id
+
+
+async def ask_stream(client, recorder, question, conversation_id):
+    started = time.perf_counter()
+    first_token_at = None
+    outcome = "error"
+    try:
+        async with client.stream("POST", "/ask/stream", json={"query": question, "conversation_id": conversation_id}) as response:
+            if response.status_code != 200:
+                outcome = outcome_for(response.status_code)
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    if event == "token" and first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    elif event == "done":
+                        outcome = "ok"
+                        conversation_id = json.loads(line[5:]).get("conversation_id", conversation_id)
+                    elif event == "error":
+                        # Rejections after the stream started carry their status in the event
+                        outcome = outcome_for(json.loads(line[5:]).get("status", 500))
+    except httpx.HTTPError:
+        outcome = "error"
+    recorder.record("ask_stream", time.perf_counter() - started, outcome)
+    if first_token_at is not None:
+        recorder.first_token.append(first_token_at - started)
+    return conversation_id
+
+
+async def timed_get(client, recorder, operation, url):
+    started = time.perf_counter()
+    try:
+        response = await client.get(url)
+        outcome = outcome_for(response.status_code)
+    except httpx.HTTPError:
+        outcome = "error"
+    recorder.record(operation, time.perf_counter() - started, outcome)
+
+
+async def virtual_user(base_url, cookie, mix, weights, deadline, recorder, rng, think_seconds, timeout):
+    async with httpx.AsyncClient(base_url=base_url, cookies={"session": cookie}, timeout=timeout) as client:
+        conversation_id = None
+        operations, probabilities = zip(*weights.items())
+        while time.perf_counter() < deadline:
+            operation = rng.choices(operations, probabilities)[0]
+            if operation in ("ask", "ask_stream"):
+                # Roughly one in four questions starts a new conversation
+                if rng.random() < 0.25:
+                    conversation_id = None
+                call = ask if operation == "ask" else ask_stream
+                conversation_id = await call(client, recorder, mix.next(), conversation_id)
+            elif operation == "conversations":
+                await timed_get(client, recorder, "conversations", "/conversations?limit=30")
+            elif operation == "history" and conversation_id:
+                await timed_get(client, recorder, "history", f"/conversations/{conversation_id}?limit=50")
+            if think_seconds:
+                await asyncio.sleep(rng.expovariate(1 / think_seconds))
+
+
+def parse_weights(text):
+    weights = {}
+    for part in text.split(","):
+        name, _, value = part.partition("=")
+        weights[name.strip()] = float(value)
+    return weights
+
+
+def compare(results, baseline, max_regression, max_error_rate):
+    """Prints a comparison and returns the list of failed checks."""
+    failures = []
+    for operation, current in results.items():
+        attempted = current["requests"] - current.get("rejected", 0)
+        error_rate = current["errors"] / attempted if attempted else 0.0
+        if error_rate > max_error_rate:
+            failures.append(f"{operation}: error rate {error_rate:.1%} > {max_error_rate:.1%}")
+        before = (baseline or {}).get(operation)
+        if not before:
+            continue
+        change = current["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        print(f"  {operation:<14} p95 {before['p95_ms']:8.1f} -> {current['p95_ms']:8.1f} ms ({change:+.1%})")
+        if change > max_regression:
+            failures.append(f"{operation}: p95 regressed {change:+.1%} (limit {max_regression:+.1%})")
+    return failures
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    sessions = seed_users(args.users)
+    cookies = [session_cookie(args.secret, session) for session in sessions]
+    weights = parse_weights(args.mix)
+    recorder = Recorder()
+
+    # Warm-up requests are not recorded
+    if args.warmup:
+        warmup = Recorder()
+        deadline = time.perf_counter() + args.warmup
+        await asyncio.gather(*(
+            virtual_user(args.base_url, cookies[i % len(cookies)], QuestionMix(random.Random(i), args.canned_ratio, args.repeat_ratio),
+                         weights, deadline, warmup, random.Random(i), args.think_ms / 1000, args.timeout)
+            for i in range(min(args.concurrency, 4))
+        ))
+
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*(
+        virtual_user(args.base_url, cookies[i % len(cookies)],
+                     QuestionMix(random.Random(args.seed + i), args.canned_ratio, args.repeat_ratio),
+                     weights, deadline, recorder, random.Random(rng.random()), args.think_ms / 1000, args.timeout)
+        for i in range(args.concurrency)
+    ))
+    wall_seconds = time.perf_counter() - started
+    results = recorder.summary(wall_seconds)
+
+    print(f"\n{args.concurrency} virtual users for {wall_seconds:.1f}s against {args.base_url}")
+    print(f"{'operation':<14} {'requests':>9} {'errors':>7} {'rejected':>9} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for operation, row in results.items():
+        print(f"{operation:<14} {row['requests']:>9} {row['errors']:>7} {row['rejected']:>9} {row['throughput_rps']:>8} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} {row['max_ms']:>9}")
+    if "ask_stream" in results and "first_token_p50_ms" in results["ask_stream"]:
+        row = results["ask_stream"]
+        print(f"ask_stream first token: p50 {row['first_token_p50_ms']} ms, p95 {row['first_token_p95_ms']} ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print("\nCompared with baseline:")
+    failures = compare(results, baseline, args.max_regression, args.max_error_rate)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a question mix against the API and report latency percentiles.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--secret", default=os.getenv("SESSION_SECRET_KEY"), help="the server's SESSION_SECRET_KEY")
+    parser.add_argument("--users", type=int, default=50, help="distinct bench users to seed")
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users running at once")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run (after warm-up)")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unrecorded seconds before the run")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between a user's requests")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--mix", default="ask=0.5,ask_stream=0.2,conversations=0.2,history=0.1",
+                        help="relative weights of ask, ask_stream, conversations and history")
+    parser.add_argument("--canned-ratio", type=float, default=0.1, help="share of greetings and other canned questions")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="share of popular questions shared by all users")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results as JSON (usable as a later --baseline)")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.15, help="allowed relative p95 increase per operation")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    args = parser.parse_args()
+    if not args.secret:
+        parser.error("--secret (or SESSION_SECRET_KEY) is required to sign session cookies")
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,110 @@
+"""
+Builds a small synthetic course index for benchmarks: a Chroma collection
+(plus, optionally, the BM25 index and the NumPy vector snapshot) whose chunks
+are embedded with the same deterministic function as bench/fake_services.py.
+
+    python bench/make_collection.py --out /tmp/bench_data --videos 40 --chunks-per-video 25
+"""
+import os
+import sys
+import uuid
+import random
+import argparse
+
+import chromadb
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bm25 import write_bm25_index
+from vector_index import write_vector_index
+from fake_services import fake_embedding, DIM
+
+
+COLLECTION_NAME = "sigma_web_dev_course"
+INDEX_VERSION_FILENAME = "index_version"
+
+# Topic -> words that chunks about it (and questions about it) draw from
+TOPICS = {
+    "flexbox": "flexbox flex container justify-content align-items flex-direction wrap gap axis",
+    "grid": "grid grid-template-columns rows areas fr gap layout track cell",
+    "box model": "margin padding border box-sizing content width height outline spacing",
+    "promises": "promise then catch async await resolve reject fetch callback chain",
+    "events": "event listener addEventListener click bubbling capturing target preventDefault dom",
+    "react state": "react useState state setState render component props hook rerender",
+    "react effects": "useEffect dependency cleanup effect mount unmount fetch side-effect hook",
+    "express routing": "express router route get post middleware request response params",
+    "mongodb": "mongodb mongoose schema model collection document query insert find",
+    "next.js routing": "next.js app router page layout dynamic route link navigation server",
+    "git": "git commit branch merge push pull clone repository github stash",
+    "tailwind": "tailwind utility classes responsive breakpoints dark hover config",
+}
+FILLER = "so now here we will see this that basically okay you can just like and then".split()
+
+
+def chunk_text(rng, topic_words):
+    words = [rng.choice(topic_words) if rng.random() < 0.35 else rng.choice(FILLER) for _ in range(rng.randint(60, 110))]
+    return " ".join(words)
+
+
+def question_for(rng, topic):
+    words = TOPICS[topic].split()
+    return f"where is {' '.join(rng.sample(words, 3))} taught"
+
+
+def build(out_dir, videos, chunks_per_video, seed=7, bm25=True, vector_index=True):
+    rng = random.Random(seed)
+    chroma_dir = os.path.join(out_dir, "chroma_db")
+    client = chromadb.PersistentClient(path=chroma_dir)
+    try:
+        client.delete_collection(COLLECTION_NAME)
+    except Exception:
+        pass
+    collection = client.create_collection(name=COLLECTION_NAME, metadata={"hnsw:space": "cosine"})
+
+    topics = list(TOPICS)
+    ids, documents, metadatas, embeddings = [], [], [], []
+    for number in range(1, videos + 1):
+        topic = topics[(number - 1) % len(topics)]
+        title = f"{topic.title()} Part {(number - 1) // len(topics) + 1}"
+        video_id = f"vid{number:04d}"
+        for i in range(chunks_per_video):
+            start = 45.0 * i
+            text = chunk_text(rng, TOPICS[topic].split())
+            ids.append(f"{video_id}:{int(start * 1000)}")
+            documents.append(text)
+            metadatas.append({
+                "video_title": title,
+                "video_number": number,
+                "start_time": start,
+                "end_time": start + 45.0,
+                "youtube_url": f"https://www.youtube.com/watch?v={video_id}&t={int(start)}s",
+                "hindi_text": text,
+            })
+            embeddings.append(fake_embedding(text, DIM))
+
+    for start in range(0, len(ids), 1000):
+        end = start + 1000
+        collection.add(ids=ids[start:end], documents=documents[start:end], metadatas=metadatas[start:end],
+                       embeddings=embeddings[start:end])
+    with open(os.path.join(chroma_dir, INDEX_VERSION_FILENAME), 'w', encoding='utf-8') as f:
+        f.write(uuid.uuid4().hex)
+
+    if bm25:
+        write_bm25_index(os.path.join(out_dir, "bm25_index"), ids, documents)
+    if vector_index:
+        write_vector_index(os.path.join(out_dir, "vector_index"), ids, embeddings, documents, metadatas)
+    return len(ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a synthetic course index for benchmarks.")
+    parser.add_argument("--out", required=True, help="directory for chroma_db/, bm25_index/ and vector_index/")
+    parser.add_argument("--videos", type=int, default=40)
+    parser.add_argument("--chunks-per-video", type=int, default=25)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--no-bm25", action="store_true")
+    parser.add_argument("--no-vector-index", action="store_true")
+    args = parser.parse_args()
+
+    count = build(args.out, args.videos, args.chunks_per_video, args.seed,
+                  bm25=not args.no_bm25, vector_index=not args.no_vector_index)
+    print(f"Wrote {count} chunks to {args.out}")
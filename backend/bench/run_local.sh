@@ -0,0 +1,49 @@
+#!/usr/bin/env bash
+# Runs the whole benchmark offline: fake Ollama/Gemini, a synthetic index, the
+# API server on SQLite, then bench/load.py. Extra arguments go to load.py, e.g.
+#
+#   bench/run_local.sh --duration 60 --concurrency 32 --output results.json
+#   bench/run_local.sh --baseline results.json --max-regression 0.15
+#
+# Run from backend/. WORK_DIR, API_PORT and FAKE_PORT can be overridden.
+set -euo pipefail
+
+cd "$(dirname "$0")/.."
+
+WORK_DIR="${WORK_DIR:-/tmp/rag-bench}"
+API_PORT="${API_PORT:-8000}"
+FAKE_PORT="${FAKE_PORT:-8090}"
+
+mkdir -p "$WORK_DIR"
+rm -f "$WORK_DIR/bench.db"
+
+if [ ! -d "$WORK_DIR/chroma_db" ]; then
+    python bench/make_collection.py --out "$WORK_DIR"
+fi
+
+export DATABASE_URL="sqlite:///$WORK_DIR/bench.db"
+export SESSION_SECRET_KEY="bench-secret"
+export GOOGLE_API_KEY="bench"
+export CHROMA_DB_DIR="$WORK_DIR/chroma_db"
+export BM25_INDEX_DIR="$WORK_DIR/bm25_index"
+export VECTOR_INDEX_DIR="$WORK_DIR/vector_index"
+export OLLAMA_EMBED_URL="http://127.0.0.1:$FAKE_PORT/api/embed"
+export GEMINI_API_BASE="http://127.0.0.1:$FAKE_PORT"
+# A few seeded users drive all the load; the per-user limit would turn most of it into 429s
+export USER_RATE_PER_MINUTE="${USER_RATE_PER_MINUTE:-1000000}"
+export USER_BURST="${USER_BURST:-1000000}"
+
+python bench/fake_services.py --port "$FAKE_PORT" ${FAKE_ARGS:-} &
+FAKE_PID=$!
+python -m uvicorn main:app --host 127.0.0.1 --port "$API_PORT" --log-level warning &
+API_PID=$!
+trap 'kill $API_PID $FAKE_PID 2>/dev/null; wait 2>/dev/null' EXIT
+
+for _ in $(seq 1 120); do
+    if curl -sf "http://127.0.0.1:$API_PORT/api/stats" > /dev/null; then
+        break
+    fi
+    sleep 0.5
+done
+
+python bench/load.py --base-url "http://127.0.0.1:$API_PORT" "$@"
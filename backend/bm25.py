@@ -0,0 +1,131 @@
+import os
+import re
+import json
+import uuid
+import shutil
+
+import numpy as np
+
+
+MANIFEST_FILE = "manifest.json"
+VOCAB_FILE = "vocab.json"
+IDS_FILE = "ids.json"
+TERM_OFFSETS_FILE = "term_offsets.npy"
+POSTING_DOCS_FILE = "posting_docs.npy"
+POSTING_WEIGHTS_FILE = "posting_weights.npy"
+
+# Words may contain Devanagari vowel signs (not matched by \w) and inner '-' or '.', e.g. "z-index", "array.map"
+TOKEN_RE = re.compile(r"[\w\u0900-\u097F]+(?:[-.][\w\u0900-\u097F]+)*")
+
+
+def tokenize(text):
+    """Lowercased word tokens; compound terms like "z-index" are kept whole and also split into parts."""
+    tokens = []
+    for token in TOKEN_RE.findall((text or "").lower()):
+        tokens.append(token)
+        if "-" in token or "." in token:
+            tokens.extend(part for part in re.split(r"[-.]", token) if part)
+    return tokens
+
+
+def write_bm25_index(index_dir, ids, texts, k1=1.2, b=0.75):
+    """
+    Builds a BM25 inverted index and writes it as flat arrays:
+      vocab.json           - terms, in term-id order
+      term_offsets.npy     - int64, postings of term t are [offsets[t], offsets[t + 1])
+      posting_docs.npy     - int32 document rows
+      posting_weights.npy  - float32 precomputed BM25 weight of the term in that document
+      ids.json             - chunk ids in document-row order
+    Weights are final BM25 contributions, so scoring a query is only gathers and adds.
+    """
+    doc_term_counts = []
+    doc_lengths = np.zeros(len(texts), dtype=np.float32)
+    vocab = {}
+    for row, text in enumerate(texts):
+        counts = {}
+        tokens = tokenize(text)
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+            if token not in vocab:
+                vocab[token] = len(vocab)
+        doc_term_counts.append(counts)
+        doc_lengths[row] = len(tokens)
+
+    postings = [[] for _ in range(len(vocab))]
+    for row, counts in enumerate(doc_term_counts):
+        for token, tf in counts.items():
+            postings[vocab[token]].append((row, tf))
+
+    n_docs = len(texts)
+    avg_length = float(doc_lengths.mean()) if n_docs else 0.0
+    term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    posting_docs = []
+    posting_weights = []
+    for term_id, plist in enumerate(postings):
+        df = len(plist)
+        idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        rows = np.fromiter((row for row, _ in plist), dtype=np.int32, count=df)
+        tfs = np.fromiter((tf for _, tf in plist), dtype=np.float32, count=df)
+        norm = k1 * (1 - b + b * doc_lengths[rows] / avg_length)
+        posting_docs.append(rows)
+        posting_weights.append((idf * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32))
+        term_offsets[term_id + 1] = term_offsets[term_id] + df
+
+    tmp_dir = f"{index_dir.rstrip('/')}.tmp-{uuid.uuid4().hex[:8]}"
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, TERM_OFFSETS_FILE), term_offsets)
+    np.save(os.path.join(tmp_dir, POSTING_DOCS_FILE), np.concatenate(posting_docs) if posting_docs else np.zeros(0, dtype=np.int32))
+    np.save(os.path.join(tmp_dir, POSTING_WEIGHTS_FILE), np.concatenate(posting_weights) if posting_weights else np.zeros(0, dtype=np.float32))
+    with open(os.path.join(tmp_dir, VOCAB_FILE), 'w', encoding='utf-8') as f:
+        json.dump(sorted(vocab, key=vocab.get), f, ensure_ascii=False)
+    with open(os.path.join(tmp_dir, IDS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(list(ids), f)
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump({"count": n_docs, "terms": len(vocab), "k1": k1, "b": b, "avg_length": avg_length}, f, indent=4)
+
+    if os.path.exists(index_dir):
+        old_dir = f"{index_dir.rstrip('/')}.old-{uuid.uuid4().hex[:8]}"
+        os.rename(index_dir, old_dir)
+        os.rename(tmp_dir, index_dir)
+        shutil.rmtree(old_dir)
+    else:
+        os.rename(tmp_dir, index_dir)
+
+
+class BM25Index:
+    """Read-only BM25 index written by write_bm25_index; the posting arrays are memory-mapped."""
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        with open(os.path.join(index_dir, VOCAB_FILE), 'r', encoding='utf-8') as f:
+            self.term_ids = {term: term_id for term_id, term in enumerate(json.load(f))}
+        with open(os.path.join(index_dir, IDS_FILE), 'r', encoding='utf-8') as f:
+            self.ids = json.load(f)
+        self.term_offsets = np.load(os.path.join(index_dir, TERM_OFFSETS_FILE), mmap_mode='r')
+        self.posting_docs = np.load(os.path.join(index_dir, POSTING_DOCS_FILE), mmap_mode='r')
+        self.posting_weights = np.load(os.path.join(index_dir, POSTING_WEIGHTS_FILE), mmap_mode='r')
+
+    def count(self):
+        return len(self.ids)
+
+    def search(self, query_text, n_results=10):
+        """Returns [(chunk_id, score), ...] for the n_results best-scoring chunks, best first."""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        matched = False
+        for term in set(tokenize(query_text)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            # A document appears at most once per term, so plain fancy-index addition is safe
+            scores[self.posting_docs[start:end]] += self.posting_weights[start:end]
+            matched = True
+        if not matched:
+            return []
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > n_results:
+            candidates = candidates[np.argpartition(-scores[candidates], n_results - 1)[:n_results]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(self.ids[row], float(scores[row])) for row in candidates]
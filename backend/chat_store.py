@@ -0,0 +1,227 @@
+import json
+import time
+import base64
+import asyncio
+import datetime
+
+from sqlalchemy import insert, select, and_, or_
+from sqlalchemy.orm import Session
+
+import database
+
+
+def conversation_title(query):
+    return query[:50] + "..." if len(query) > 50 else query
+
+
+def create_conversation(db: Session, query, user_id=None, email=None):
+    """
+    Adds a conversation titled after its first query and returns its id (looking the user up by email
+    if no id is given). Only flushed: the caller commits it together with the first turn.
+    """
+    if user_id is None:
+        user_id = db.query(database.User.id).filter(database.User.email == email).scalar()
+    conversation = database.Conversation(user_id=user_id, title=conversation_title(query))
+    db.add(conversation)
+    db.flush()
+    return conversation.id
+
+
+def save_turns(db: Session, turns):
+    """
+    Writes (conversation_id, query, answer, sources) turns, each as a user and
+    a bot message, in a single transaction and a single multi-row INSERT.
+    """
+    rows = []
+    for conversation_id, query, answer, sources in turns:
+        rows.append({"conversation_id": conversation_id, "role": "user", "content": query, "sources": None})
+        rows.append({"conversation_id": conversation_id, "role": "bot", "content": answer, "sources": json.dumps(sources)})
+    if rows:
+        db.execute(insert(database.Message), rows)
+        db.commit()
+
+
+def save_first_turn(db: Session, query, answer, sources, user_id=None, email=None):
+    """Creates a conversation with its first turn in one transaction and returns the conversation id."""
+    conversation_id = create_conversation(db, query, user_id=user_id, email=email)
+    save_turns(db, [(conversation_id, query, answer, sources)])
+    return conversation_id
+
+
+def encode_cursor(created_at, conversation_id):
+    payload = json.dumps([created_at.isoformat(), conversation_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for anything it did not produce."""
+    try:
+        created_at, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.datetime.fromisoformat(created_at), int(conversation_id)
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+
+
+def list_conversations(db: Session, user_id, limit, cursor=None, purged_up_to=None):
+    """
+    One page of a user's conversations, newest first, as ([{"id", "title"}], next cursor or None).
+    Keyset pagination on (created_at, id) walks ix_conversations_user_created, so a page costs
+    the same however far back it is. Conversations with ids up to purged_up_to are being purged and are left out.
+    """
+    Conversation = database.Conversation
+    query = select(Conversation.id, Conversation.title, Conversation.created_at).where(Conversation.user_id == user_id)
+    if purged_up_to is not None:
+        query = query.where(Conversation.id > purged_up_to)
+    if cursor:
+        created_at, conversation_id = decode_cursor(cursor)
+        query = query.where(or_(
+            Conversation.created_at < created_at,
+            and_(Conversation.created_at == created_at, Conversation.id < conversation_id),
+        ))
+    rows = db.execute(query.order_by(Conversation.created_at.desc(), Conversation.id.desc()).limit(limit + 1)).all()
+
+    next_cursor = encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+    return [{"id": row.id, "title": row.title} for row in rows[:limit]], next_cursor
+
+
+def owns_conversation(db: Session, user_id, conversation_id):
+    Conversation = database.Conversation
+    query = select(Conversation.id).where(Conversation.id == conversation_id, Conversation.user_id == user_id)
+    return db.execute(query).first() is not None
+
+
+def list_messages_json(db: Session, conversation_id, limit, before=None):
+    """
+    The newest `limit` messages of a conversation older than message id `before`, oldest first,
+    serialized as a JSON response body {"messages": [...], "next_cursor": id or null}.
+    Stored sources are already JSON, so they are spliced in as-is instead of parsed and re-encoded.
+    """
+    Message = database.Message
+    query = select(Message.id, Message.role, Message.content, Message.sources).where(Message.conversation_id == conversation_id)
+    if before is not None:
+        query = query.where(Message.id < before)
+    rows = db.execute(query.order_by(Message.id.desc()).limit(limit + 1)).all()
+
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    items = [
+        f'{{"role": {json.dumps(row.role)}, "content": {json.dumps(row.content)}, "sources": {row.sources or "[]"}}}'
+        for row in reversed(rows[:limit])
+    ]
+    return f'{{"messages": [{", ".join(items)}], "next_cursor": {json.dumps(next_cursor)}}}'
+
+
+class TurnWriter:
+    """
+    Write-behind queue for chat turns.
+
+    submit() enqueues a finished turn and returns immediately; a background
+    task drains the queue in batches of up to batch_size turns (waiting at most
+    flush_interval_seconds for a batch to fill) and writes each batch with
+    save_turns on the given executor, in its own session. If a batch fails, its
+    turns are retried one by one so a single bad turn (say, one whose
+    conversation was purged meanwhile) only loses itself. The queue is bounded:
+    when it is full, submit() returns False and the caller writes the turn
+    itself. close() flushes whatever is still queued.
+    """
+
+    def __init__(self, executor, session_factory=database.SessionLocal, max_queue_size=1000, batch_size=100,
+                 flush_interval_seconds=0.2):
+        self.executor = executor
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task = None
+
+        self.turns_queued = 0
+        self.turns_written = 0
+        self.turns_failed = 0
+        self.queue_full = 0
+        self.batches = 0
+        self.write_seconds = 0.0
+
+    def submit(self, turn):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        try:
+            self._queue.put_nowait(turn)
+        except asyncio.QueueFull:
+            self.queue_full += 1
+            return False
+        self.turns_queued += 1
+        return True
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            started = time.perf_counter()
+            try:
+                failed = await loop.run_in_executor(self.executor, self._write, batch)
+                self.turns_written += len(batch) - failed
+                self.turns_failed += failed
+            except Exception as e:
+                self.turns_failed += len(batch)
+                print(f"Failed to write {len(batch)} queued chat turns: {e}")
+            finally:
+                self.batches += 1
+                self.write_seconds += time.perf_counter() - started
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        """Writes a batch, falling back to one transaction per turn if it fails. Returns the number of turns dropped."""
+        db = self.session_factory()
+        try:
+            try:
+                save_turns(db, batch)
+                return 0
+            except Exception as e:
+                db.rollback()
+                if len(batch) == 1:
+                    raise
+                print(f"Failed to write a batch of {len(batch)} chat turns, retrying them one by one: {e}")
+            failed = 0
+            for turn in batch:
+                try:
+                    save_turns(db, [turn])
+                except Exception as e:
+                    db.rollback()
+                    failed += 1
+                    print(f"Dropped the chat turn for conversation {turn[0]}: {e}")
+            return failed
+        finally:
+            db.close()
+
+    async def close(self, timeout=10.0):
+        """Waits (up to timeout seconds) for queued turns to be written, then stops the background task."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Gave up flushing chat turns on shutdown; {self._queue.qsize()} turns were not written.")
+        self._task.cancel()
+        self._task = None
+
+    def stats(self):
+        return {
+            "queued": self.turns_queued,
+            "written": self.turns_written,
+            "failed": self.turns_failed,
+            "queue_full": self.queue_full,
+            "pending": self._queue.qsize(),
+            "batches": self.batches,
+            "mean_batch_turns": round(self.turns_written / self.batches, 2) if self.batches else 0.0,
+            "mean_write_ms": round(1000 * self.write_seconds / self.batches, 2) if self.batches else 0.0,
+        }
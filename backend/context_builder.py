@@ -0,0 +1,186 @@
+"""
+Assembles the prompt context from over-fetched retrieval results.
+
+build_context() takes a chromadb-shaped single-query result (ranked best
+first), then:
+  1. merges hits that are temporally adjacent in the same video into one
+     passage, dropping the words the overlapping chunks share;
+  2. picks passages with maximal marginal relevance, so near-duplicates and
+     several passages from one video give way to other videos;
+  3. packs the picks into a token budget with a compact one-line header each.
+
+Token counts are estimated (about four characters per token) since no
+Gemini tokenizer is available locally.
+"""
+import re
+
+
+CHARS_PER_TOKEN = 4
+# Similarity floor between two passages of the same video, so MMR prefers spreading across videos
+SAME_VIDEO_SIMILARITY = 0.5
+# Longest run of words two overlapping chunks can share
+MAX_OVERLAP_WORDS = 80
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _format_timestamp(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+def _join_overlapping(left, right):
+    """Concatenates two chunk texts, dropping the longest suffix of left that is a prefix of right."""
+    left_words, right_words = left.split(), right.split()
+    for size in range(min(len(left_words), len(right_words), MAX_OVERLAP_WORDS), 0, -1):
+        if left_words[-size:] == right_words[:size]:
+            return " ".join(left_words + right_words[size:])
+    return f"{left} {right}"
+
+
+def candidates_from_results(results):
+    """Flattens a single-query result into candidate dicts, keeping retrieval rank and distance."""
+    if not results or not results.get('documents') or not results['documents'][0]:
+        return []
+    distances = (results.get('distances') or [[]])[0] or []
+    candidates = []
+    for rank, (document, metadata) in enumerate(zip(results['documents'][0], results['metadatas'][0])):
+        metadata = metadata or {}
+        start = float(metadata.get('start_time', 0) or 0)
+        candidates.append({
+            "rank": rank,
+            "text": document or "",
+            "video_number": metadata.get('video_number'),
+            "video_title": metadata.get('video_title'),
+            "start_time": start,
+            "end_time": float(metadata.get('end_time', start) or start),
+            "url": metadata.get('youtube_url'),
+            "distance": distances[rank] if rank < len(distances) else None,
+            "chunks": 1,
+        })
+    return candidates
+
+
+def merge_adjacent(candidates, max_gap_seconds=5.0):
+    """
+    Merges candidates from the same video whose time ranges touch or overlap (within max_gap_seconds).
+    A merged passage keeps the best rank and smallest distance of its chunks and the URL of its first one.
+    """
+    by_video = {}
+    for candidate in candidates:
+        # Chunks without a video number are never merged
+        key = candidate["video_number"] if candidate["video_number"] is not None else ("rank", candidate["rank"])
+        by_video.setdefault(key, []).append(candidate)
+
+    passages = []
+    for chunks in by_video.values():
+        chunks.sort(key=lambda c: c["start_time"])
+        current = dict(chunks[0])
+        for chunk in chunks[1:]:
+            if chunk["start_time"] <= current["end_time"] + max_gap_seconds:
+                current["text"] = _join_overlapping(current["text"], chunk["text"])
+                current["end_time"] = max(current["end_time"], chunk["end_time"])
+                current["rank"] = min(current["rank"], chunk["rank"])
+                distances = [d for d in (current["distance"], chunk["distance"]) if d is not None]
+                current["distance"] = min(distances) if distances else None
+                current["chunks"] += chunk["chunks"]
+            else:
+                passages.append(current)
+                current = dict(chunk)
+        passages.append(current)
+    passages.sort(key=lambda p: p["rank"])
+    return passages
+
+
+def _similarity(a, b):
+    union = a["words"] | b["words"]
+    jaccard = len(a["words"] & b["words"]) / len(union) if union else 0.0
+    if a["video_number"] is not None and a["video_number"] == b["video_number"]:
+        return max(jaccard, SAME_VIDEO_SIMILARITY)
+    return jaccard
+
+
+def mmr_order(passages, lambda_=0.7, limit=None):
+    """
+    Orders passages by maximal marginal relevance:
+    lambda_ * relevance - (1 - lambda_) * max similarity to the passages already picked.
+
+    Relevance comes from the retrieval rank (1.0 for the best hit, falling linearly),
+    since hybrid results mix in lexical-only hits without a distance. Similarity is
+    word-set Jaccard, floored at SAME_VIDEO_SIMILARITY for passages of the same video.
+    """
+    if not passages:
+        return []
+    worst_rank = max(p["rank"] for p in passages) + 1
+    pool = []
+    for passage in passages:
+        pool.append(dict(
+            passage,
+            relevance=1.0 - passage["rank"] / worst_rank,
+            words=frozenset(w.lower() for w in _WORD_RE.findall(passage["text"])),
+        ))
+
+    picked = []
+    limit = len(pool) if limit is None else min(limit, len(pool))
+    while pool and len(picked) < limit:
+        best_index, best_score = 0, None
+        for i, candidate in enumerate(pool):
+            redundancy = max((_similarity(candidate, chosen) for chosen in picked), default=0.0)
+            score = lambda_ * candidate["relevance"] - (1 - lambda_) * redundancy
+            if best_score is None or score > best_score:
+                best_index, best_score = i, score
+        picked.append(pool.pop(best_index))
+    return picked
+
+
+def format_passage(number, passage):
+    return (
+        f"[{number}] Video {passage['video_number']}: {passage['video_title']} "
+        f"@ {_format_timestamp(passage['start_time'])}-{_format_timestamp(passage['end_time'])} "
+        f"({int(passage['start_time'])}s)\n{passage['text']}\n"
+    )
+
+
+def pack(passages, token_budget):
+    """
+    Formats passages in order until the estimated token budget is spent. A passage that
+    does not fit is skipped (a later, shorter one may); the first passage is truncated
+    to the budget rather than dropped, so the prompt always has some context.
+    """
+    blocks = []
+    used = 0
+    for passage in passages:
+        block = format_passage(len(blocks) + 1, passage)
+        cost = estimate_tokens(block)
+        if used + cost > token_budget:
+            if blocks:
+                continue
+            block = block[:token_budget * CHARS_PER_TOKEN].rsplit(" ", 1)[0] + " ...\n"
+            cost = estimate_tokens(block)
+        blocks.append((block, passage))
+        used += cost
+    return blocks
+
+
+def build_context(results, token_budget=1000, max_passages=5, mmr_lambda=0.7, merge_gap_seconds=5.0, max_sources=3):
+    """
+    Returns (context text, sources, chunks used) for the prompt. Sources are up to
+    max_sources unique video links, in the order their passages appear in the context.
+    """
+    candidates = candidates_from_results(results)
+    passages = merge_adjacent(candidates, max_gap_seconds=merge_gap_seconds)
+    ordered = mmr_order(passages, lambda_=mmr_lambda, limit=max_passages)
+    blocks = pack(ordered, token_budget)
+
+    unique_sources = {}
+    for _, passage in blocks:
+        if len(unique_sources) < max_sources and passage["url"] not in unique_sources:
+            unique_sources[passage["url"]] = {"title": passage["video_title"], "url": passage["url"]}
+
+    context = "".join(block for block, _ in blocks)
+    chunks_used = sum(passage["chunks"] for _, passage in blocks)
+    return context, list(unique_sources.values()), chunks_used
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, Text, ForeignKey, DateTime, Index
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 import datetime
 import os
@@ -8,10 +8,20 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
+# SQLite (used by the benchmark harness) is shared with the executor threads
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+if engine.dialect.name == "sqlite":
+    # SQLite only enforces foreign keys (and so ON DELETE CASCADE) when asked to, per connection
+    @event.listens_for(engine, "connect")
+    def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -27,16 +37,87 @@ class Conversation(Base):
     title = Column(String, default="New Chat")
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     user = relationship("User", back_populates="conversations")
-    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
+    # The database deletes messages with their conversation (ON DELETE CASCADE), so the ORM doesn't load them first
+    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan", passive_deletes=True)
+    # Serves the sidebar's newest-first, keyset-paginated listing per user
+    __table_args__ = (Index("ix_conversations_user_created", "user_id", "created_at", "id"),)
 
 class Message(Base):
     __tablename__ = "messages"
     id = Column(Integer, primary_key=True, index=True)
-    conversation_id = Column(Integer, ForeignKey("conversations.id"))
+    conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"))
     role = Column(String)  
     content = Column(Text)
     sources = Column(Text, nullable=True) 
     conversation = relationship("Conversation", back_populates="messages")
+    # Serves paginated history loads of one conversation in id order
+    __table_args__ = (Index("ix_messages_conversation_id_id", "conversation_id", "id"),)
+
+class PurgeJob(Base):
+    """A background deletion of a user's conversations up to (and including) id max_conversation_id."""
+    __tablename__ = "purge_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    max_conversation_id = Column(Integer)
+    status = Column(String, default="pending")  # pending, running, done, failed
+    # Process running the job, and when it last made progress; a running job whose heartbeat is older
+    # than the lease may be taken over (see purge.claim_purge_job)
+    owner = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    conversations_deleted = Column(Integer, default=0)
+    messages_deleted = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+def ensure_message_cascade():
+    """
+    Databases created before messages.conversation_id had ON DELETE CASCADE keep
+    the old constraint (create_all never alters tables), so swap it on Postgres.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+    for foreign_key in inspect(engine).get_foreign_keys("messages"):
+        if foreign_key["referred_table"] != "conversations":
+            continue
+        if (foreign_key.get("options") or {}).get("ondelete", "").upper() == "CASCADE":
+            return
+        name = foreign_key["name"]
+        with engine.begin() as connection:
+            connection.execute(text(f'ALTER TABLE messages DROP CONSTRAINT "{name}"'))
+            connection.execute(text(
+                f'ALTER TABLE messages ADD CONSTRAINT "{name}" FOREIGN KEY (conversation_id) '
+                f'REFERENCES conversations (id) ON DELETE CASCADE'
+            ))
+        print(f"Migrated {name} to ON DELETE CASCADE.")
+        return
+
+def ensure_purge_job_lease_columns():
+    """purge_jobs tables created before jobs were claimed with a lease lack owner/heartbeat_at; add them."""
+    columns = {column["name"] for column in inspect(engine).get_columns("purge_jobs")}
+    added = []
+    with engine.begin() as connection:
+        if "owner" not in columns:
+            connection.execute(text("ALTER TABLE purge_jobs ADD COLUMN owner VARCHAR"))
+            added.append("owner")
+        if "heartbeat_at" not in columns:
+            type_name = "TIMESTAMP" if engine.dialect.name == "postgresql" else "DATETIME"
+            connection.execute(text(f"ALTER TABLE purge_jobs ADD COLUMN heartbeat_at {type_name}"))
+            added.append("heartbeat_at")
+    if added:
+        print(f"Added purge_jobs columns: {', '.join(added)}.")
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add indexes introduced later explicitly
+    for table in (Conversation.__table__, Message.__table__):
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    ensure_message_cascade()
+    ensure_purge_job_lease_columns()
+
+
+def ping():
+    """Runs SELECT 1 on a pooled connection (opening it if needed); raises if the database is unreachable."""
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
@@ -0,0 +1,123 @@
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache for query embeddings, keyed by (model, normalized text).
+
+    Tier 1 is an in-process LRU bounded by max_entries.
+    Tier 2 is an optional sqlite file (WAL mode) that survives restarts and is
+    shared by every worker pointing at the same path. Lookups that hit tier 2
+    are promoted into tier 1.
+    """
+
+    def __init__(self, max_entries=4096, db_path=None, max_persistent_entries=200_000):
+        self.max_entries = max_entries
+        self.max_persistent_entries = max_persistent_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._puts_since_prune = 0
+
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS embeddings (
+                       model TEXT NOT NULL,
+                       text TEXT NOT NULL,
+                       vector BLOB NOT NULL,
+                       created_at REAL NOT NULL,
+                       PRIMARY KEY (model, text)
+                   )"""
+            )
+            self._db.commit()
+
+    @property
+    def persistent(self):
+        return self._db is not None
+
+    def get(self, model, text):
+        """Looks up the in-process tier only; cheap enough to call on the event loop."""
+        key = (model, text)
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            elif self._db is None:
+                self.misses += 1
+            return embedding
+
+    def get_persistent(self, model, text):
+        """Looks up the sqlite tier (blocking) and promotes a hit into memory."""
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT vector FROM embeddings WHERE model = ? AND text = ?", (model, text)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.persistent_hits += 1
+            embedding = array("f", row[0]).tolist()
+            self._remember(model, text, embedding)
+            return embedding
+
+    def put(self, model, text, embedding):
+        """Stores an embedding in both tiers (the sqlite write is blocking)."""
+        with self._lock:
+            self._remember(model, text, embedding)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings (model, text, vector, created_at) VALUES (?, ?, ?, ?)",
+                (model, text, array("f", embedding).tobytes(), time.time()),
+            )
+            self._db.commit()
+            self._puts_since_prune += 1
+            if self._puts_since_prune >= 256:
+                self._puts_since_prune = 0
+                self._prune()
+
+    def stats(self):
+        lookups = self.memory_hits + self.persistent_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.memory_hits + self.persistent_hits) / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, model, text, embedding):
+        key = (model, text)
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _prune(self):
+        # Keep only the newest max_persistent_entries rows
+        self._db.execute(
+            """DELETE FROM embeddings WHERE rowid IN (
+                   SELECT rowid FROM embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?
+               )""",
+            (self.max_persistent_entries,),
+        )
+        self._db.commit()
@@ -0,0 +1,119 @@
+import asyncio
+
+import httpx
+
+
+class EmbeddingClient:
+    """
+    Async client for the Ollama embed endpoint.
+    Keeps a pooled, keep-alive connection set so each query does not pay
+    for a new TCP handshake.
+    """
+
+    def __init__(self, url, model="bge-m3", timeout=10.0, max_connections=32):
+        self.url = url
+        self.model = model
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+
+    async def embed(self, texts):
+        """Returns one embedding per input text, in order."""
+        response = await self._client.post(
+            self.url, json={"model": self.model, "input": list(texts)}
+        )
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-text embedding requests into batched calls.
+
+    Requests arriving within max_wait_seconds of the first pending one (or
+    until max_batch_size texts are pending) are sent as one call to the
+    client, and each caller gets back its own embedding.
+    """
+
+    def __init__(self, client, max_batch_size=16, max_wait_seconds=0.005):
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._pending = []  # (text, future, enqueued_at)
+        self._timer = None
+        self._in_flight = set()
+
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self.batch_size_counts = {}
+        self.total_wait_seconds = 0.0
+        self.max_wait_seen = 0.0
+
+    async def embed(self, text):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, loop.time()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_seconds, self._flush)
+        return await future
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+            "mean_wait_ms": 1000 * self.total_wait_seconds / self.items if self.items else 0.0,
+            "max_wait_ms": 1000 * self.max_wait_seen,
+        }
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        now = asyncio.get_running_loop().time()
+        for _, _, enqueued_at in batch:
+            waited = now - enqueued_at
+            self.total_wait_seconds += waited
+            self.max_wait_seen = max(self.max_wait_seen, waited)
+        self.batches += 1
+        self.items += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self.batch_size_counts[len(batch)] = self.batch_size_counts.get(len(batch), 0) + 1
+
+        task = asyncio.ensure_future(self._send(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, batch):
+        try:
+            embeddings = await self.client.embed([text for text, _, _ in batch])
+            if len(embeddings) != len(batch):
+                raise ValueError(f"asked for {len(batch)} embeddings, got {len(embeddings)}")
+            for (_, future, _), embedding in zip(batch, embeddings):
+                # A caller that timed out has already cancelled its future
+                if not future.done():
+                    future.set_result(embedding)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            # Only reached with futures unresolved if this task was cancelled; no caller may be left waiting
+            for _, future, _ in batch:
+                future.cancel()
@@ -0,0 +1,72 @@
+import json
+
+import httpx
+
+
+class GeminiRestResponse:
+    """The part of a google.generativeai response the server reads: .text (ValueError when there is no text part)."""
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    @property
+    def text(self):
+        parts = []
+        for candidate in self.payload.get("candidates") or []:
+            for part in (candidate.get("content") or {}).get("parts") or []:
+                if "text" in part:
+                    parts.append(part["text"])
+        if not parts:
+            raise ValueError("response has no text parts")
+        return "".join(parts)
+
+
+class GeminiRestModel:
+    """
+    Stand-in for genai.GenerativeModel that calls the Gemini REST API
+    (generateContent / streamGenerateContent?alt=sse) with a pooled httpx client.
+
+    Used when GEMINI_API_BASE is set, which lets the server run against a local
+    fake (backend/bench/fake_services.py) as well as the real endpoint.
+    """
+
+    def __init__(self, model_name, api_key, base_url="https://generativelanguage.googleapis.com", timeout=60.0,
+                 max_connections=32):
+        self.model_name = model_name
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    def _url(self, method):
+        return f"{self.base_url}/v1beta/models/{self.model_name}:{method}"
+
+    def _body(self, prompt):
+        return {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+
+    async def generate_content_async(self, prompt, stream=False):
+        if not stream:
+            response = await self._client.post(
+                self._url("generateContent"), params={"key": self.api_key}, json=self._body(prompt)
+            )
+            response.raise_for_status()
+            return GeminiRestResponse(response.json())
+        return self._stream(prompt)
+
+    async def _stream(self, prompt):
+        request = self._client.build_request(
+            "POST", self._url("streamGenerateContent"), params={"key": self.api_key, "alt": "sse"}, json=self._body(prompt)
+        )
+        response = await self._client.send(request, stream=True)
+        try:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    yield GeminiRestResponse(json.loads(line[5:]))
+        finally:
+            await response.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
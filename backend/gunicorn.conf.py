@@ -0,0 +1,52 @@
+# Multi-worker serving: gunicorn -c gunicorn.conf.py main:app
+#
+# Workers are uvicorn (asyncio) workers, one per core by default (WEB_CONCURRENCY).
+# Before forking, the master creates the database tables (once, instead of in
+# every worker) and makes sure the memory-mapped vector snapshot is up to date
+# with the Chroma collection (serving.py). Every worker then serves that
+# snapshot read-only instead of opening Chroma, so the index is in memory once
+# per replica however many workers there are.
+import os
+import multiprocessing
+
+# Same defaults as main.py
+CHROMA_DB_DIR = os.getenv("CHROMA_DB_DIR", "/data/chroma_db")
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "/data/vector_index")
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR")
+COLLECTION_NAME = "sigma_web_dev_course"
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Generation can take up to GENERATION_TIMEOUT_SECONDS; leave headroom before a worker is killed
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+# Heartbeat files on tmpfs, so a slow container disk cannot stall workers
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+# Not preloaded: main.py opens DB connections and sqlite caches at import, which must not be shared across a fork.
+# The index is shared through the page cache instead.
+preload_app = False
+
+# Workers inherit these: retrieval runs from the shared snapshot, and each worker's
+# NumPy/BLAS stays single-threaded so N workers use N cores without oversubscription
+os.environ.setdefault("RETRIEVAL_BACKEND", "numpy")
+for variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(variable, "1")
+
+
+def on_starting(server):
+    from serving import prepare_workers
+    export_snapshot = not INDEX_SNAPSHOT_DIR and os.environ["RETRIEVAL_BACKEND"] == "numpy"
+    # In a child process, so the master keeps no DB connections, chromadb or exported rows around
+    process = multiprocessing.get_context("spawn").Process(
+        target=prepare_workers, args=(CHROMA_DB_DIR, COLLECTION_NAME, VECTOR_INDEX_DIR, export_snapshot)
+    )
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        # Workers fall back to creating the tables themselves
+        server.log.error(f"Preparing the database and vector index snapshot failed (exit code {process.exitcode}).")
+    else:
+        # Inherited by the workers forked after this hook, which then skip init_db()
+        os.environ["DATABASE_SCHEMA_READY"] = "1"
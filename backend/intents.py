@@ -0,0 +1,133 @@
+"""
+Intent router for canned answers (greetings, questions about the assistant or the instructor).
+
+Intents, their exemplar phrasings, answers and sources live in data/intents.json
+and are compiled once at startup. match() tries, in order:
+  1. an exact match of the normalized query (also with a leading greeting or
+     filler word from "strip_prefixes" removed, so "hey, who are you?" works);
+  2. a fuzzy match: character-trigram Dice similarity against every exemplar,
+     for short queries only, so typos match but course questions do not;
+and match_embedding() compares a query embedding with the exemplar vectors
+(set_exemplar_vectors, computed once at startup) when a distance threshold is
+configured. Both are pure in-memory work and take microseconds.
+"""
+import re
+import json
+
+import numpy as np
+
+
+def normalize_text(s: str) -> str:
+    """Normalize text for comparison:
+       - ensure it's a string
+       - strip leading/trailing whitespace
+       - lowercase
+       - remove punctuation
+       - collapse multiple spaces
+    """
+    if s is None:
+        return ""
+    s = str(s)
+    s = re.sub(r"[^\w\s]", "", s, flags=re.UNICODE)
+    s = re.sub(r"\s+", " ", s).strip().lower()
+    return s
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class IntentRouter:
+    def __init__(self, config, fuzzy_threshold=0.8, fuzzy_max_words=6, fuzzy_min_chars=6, embedding_max_distance=None):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_max_words = fuzzy_max_words
+        self.fuzzy_min_chars = fuzzy_min_chars
+        self.embedding_max_distance = embedding_max_distance
+        self.strip_prefixes = frozenset(normalize_text(p) for p in config.get("strip_prefixes", []))
+
+        self.intents = {}
+        self._exact = {}
+        self.exemplars = []  # (normalized text, intent name), in config order
+        for intent in config["intents"]:
+            self.intents[intent["name"]] = intent
+            for exemplar in intent["exemplars"]:
+                text = normalize_text(exemplar)
+                if text and text not in self._exact:
+                    self._exact[text] = intent["name"]
+                    self.exemplars.append((text, intent["name"]))
+        self._trigrams = [(trigrams(text), name) for text, name in self.exemplars]
+        self._vectors = None
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f), **kwargs)
+
+    def _result(self, name, method, score):
+        intent = self.intents[name]
+        return {"intent": name, "answer": intent["answer"], "sources": intent.get("sources", []), "method": method, "score": score}
+
+    def _candidates(self, text):
+        """The normalized query, then the query without leading greeting/filler words."""
+        yield text
+        words = text.split()
+        while len(words) > 1 and words[0] in self.strip_prefixes:
+            words = words[1:]
+            yield " ".join(words)
+
+    def match(self, query):
+        """Returns the matched intent as a dict (intent, answer, sources, method, score), or None."""
+        text = normalize_text(query)
+        if not text:
+            return None
+        candidates = list(self._candidates(text))
+        for candidate in candidates:
+            name = self._exact.get(candidate)
+            if name is not None:
+                return self._result(name, "exact", 1.0)
+
+        best_name, best_score = None, 0.0
+        for candidate in candidates:
+            if len(candidate) < self.fuzzy_min_chars or len(candidate.split()) > self.fuzzy_max_words:
+                continue
+            grams = trigrams(candidate)
+            for exemplar_grams, name in self._trigrams:
+                score = 2 * len(grams & exemplar_grams) / (len(grams) + len(exemplar_grams))
+                if score > best_score:
+                    best_name, best_score = name, score
+        if best_score >= self.fuzzy_threshold:
+            return self._result(best_name, "fuzzy", round(best_score, 3))
+        return None
+
+    @property
+    def embedding_enabled(self):
+        return self.embedding_max_distance is not None
+
+    def set_exemplar_vectors(self, vectors):
+        """Stores the exemplar embeddings (same order as self.exemplars), L2-normalized."""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._vectors = matrix / np.where(norms == 0, 1, norms)
+
+    def match_embedding(self, query_embedding):
+        """Nearest exemplar by cosine distance, if within embedding_max_distance; None when disabled or not ready."""
+        if self._vectors is None or self.embedding_max_distance is None:
+            return None
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not norm:
+            return None
+        similarities = self._vectors @ (query / norm)
+        row = int(np.argmax(similarities))
+        distance = 1.0 - float(similarities[row])
+        if distance <= self.embedding_max_distance:
+            return self._result(self.exemplars[row][1], "embedding", round(distance, 4))
+        return None
+
+    def stats(self):
+        return {
+            "intents": len(self.intents),
+            "exemplars": len(self.exemplars),
+            "embedding_ready": self._vectors is not None,
+        }
@@ -1,32 +1,163 @@
 import os
 import json
-import requests
+import math
+import time
+import asyncio
+import functools
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 import chromadb
 import google.generativeai as genai
 from fastapi import FastAPI, Request, Depends
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse, Response
 from dotenv import load_dotenv
 from authlib.integrations.starlette_client import OAuth
 from starlette.middleware.sessions import SessionMiddleware
 from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware  
 import database
-import re
+import metrics
+from profiling import SampledProfiler
+from embeddings import EmbeddingBatcher
+from embedding_cache import EmbeddingCache
+from answer_cache import SemanticAnswerCache
+from chat_store import save_first_turn, save_turns, list_conversations, list_messages_json, owns_conversation, TurnWriter
+from purge import create_purge_job, active_purge_cutoff, purge_job_status, unfinished_purge_jobs, run_purge_job
+from retrieval import ChromaRetriever, hybrid_query
+from context_builder import build_context
+from intents import IntentRouter, normalize_text
+from admission import Rejected, UserRateLimiter, ConcurrencyLimiter
+from resilience import CircuitBreaker, ResilientEmbeddingClient, is_retryable
+from relevance import load_calibration, is_relevant, best_distance, trim_by_distance
+from bm25 import BM25Index
+from vector_index import VectorIndex
+from gemini_rest import GeminiRestModel
 
 
 load_dotenv()
-database.init_db() 
 
 # Configuration
-CHROMA_DB_DIR = "/data/chroma_db"
+# Set by gunicorn.conf.py once the master has created the tables, so workers skip init_db()
+DATABASE_SCHEMA_READY = os.getenv("DATABASE_SCHEMA_READY") == "1"
+CHROMA_DB_DIR = os.getenv("CHROMA_DB_DIR", "/data/chroma_db")
+INDEX_VERSION_FILENAME = "index_version"  # written into CHROMA_DB_DIR by scripts/03_process_and_embed.py
+# "chroma" queries the Chroma collection; "numpy" does exact search over the snapshot from scripts/04_export_vector_index.py
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma")
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "/data/vector_index")
+# BM25 index built by scripts/03_process_and_embed.py; when present, lexical and vector hits are fused
+BM25_INDEX_DIR = os.getenv("BM25_INDEX_DIR", "/data/bm25_index")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# Context assembly: over-fetch this many chunks, merge adjacent ones, diversify with MMR
+# (1.0 = relevance only) and pack at most CONTEXT_MAX_PASSAGES passages into the token budget
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "20"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+CONTEXT_MAX_PASSAGES = int(os.getenv("CONTEXT_MAX_PASSAGES", "5"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_MERGE_GAP_SECONDS = float(os.getenv("CONTEXT_MERGE_GAP_SECONDS", "5"))
+# Relevance gate: when the best chunk is farther than the calibrated cosine distance the question gets the
+# insufficient-information answer without a Gemini call, and chunks more than the margin worse than the best
+# are dropped. Read from RELEVANCE_CALIBRATION_FILE (scripts/calibrate_relevance.py) unless set directly;
+# without a threshold the gate is off.
+RELEVANCE_CALIBRATION_FILE = os.getenv("RELEVANCE_CALIBRATION_FILE", "/data/relevance_calibration.json")
+RELEVANCE_MAX_DISTANCE = os.getenv("RELEVANCE_MAX_DISTANCE")
+RELEVANCE_MARGIN = os.getenv("RELEVANCE_MARGIN")
+DEFAULT_RELEVANCE_MARGIN = 0.15
+# Pre-built snapshot baked into the image (vector_index/ and optionally bm25_index/ from the export scripts);
+# when set it is served instead of opening the Chroma collection
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR")
 COLLECTION_NAME = "sigma_web_dev_course"
 OLLAMA_EMBED_URL = os.getenv("OLLAMA_EMBED_URL")
+# Comma-separated Ollama embed endpoints to spread query embeddings over (defaults to OLLAMA_EMBED_URL)
+OLLAMA_EMBED_URLS = [url.strip() for url in os.getenv("OLLAMA_EMBED_URLS", OLLAMA_EMBED_URL or "").split(",") if url.strip()]
+EMBED_MODEL = "bge-m3"
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+GEMINI_MODEL = "gemini-1.5-flash"
+# When set, Gemini is called over its REST API at this base URL (e.g. the local fake in bench/fake_services.py)
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE")
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 SESSION_SECRET_KEY = os.getenv("SESSION_SECRET_KEY")
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 
+# Per-stage deadlines (seconds) and the size of the pool used for blocking Chroma/DB work
+EMBED_TIMEOUT_SECONDS = float(os.getenv("EMBED_TIMEOUT_SECONDS", "10"))
+RETRIEVAL_TIMEOUT_SECONDS = float(os.getenv("RETRIEVAL_TIMEOUT_SECONDS", "5"))
+GENERATION_TIMEOUT_SECONDS = float(os.getenv("GENERATION_TIMEOUT_SECONDS", "60"))
+DB_TIMEOUT_SECONDS = float(os.getenv("DB_TIMEOUT_SECONDS", "5"))
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "16"))
+
+# Embedding calls: each attempt has its own deadline and failed ones are retried (within EMBED_TIMEOUT_SECONDS);
+# an attempt slower than the endpoint's recent EMBED_HEDGE_QUANTILE latency is hedged on another endpoint,
+# for at most EMBED_HEDGE_BUDGET of calls. After CIRCUIT_FAILURE_THRESHOLD consecutive failures a downstream's
+# circuit opens and calls fail fast with a 503 for CIRCUIT_RESET_SECONDS.
+EMBED_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("EMBED_ATTEMPT_TIMEOUT_SECONDS", "3"))
+EMBED_RETRIES = int(os.getenv("EMBED_RETRIES", "2"))
+EMBED_HEDGE_QUANTILE = float(os.getenv("EMBED_HEDGE_QUANTILE", "0.95"))
+EMBED_HEDGE_BUDGET = float(os.getenv("EMBED_HEDGE_BUDGET", "0.1"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Query embedding cache: in-process LRU size and an optional sqlite file shared across workers/restarts
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+EMBED_CACHE_DB = os.getenv("EMBED_CACHE_DB")
+
+# Micro-batching: concurrent query embeddings arriving within the window are sent to Ollama as one call
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "16"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+
+# Semantic answer cache: reuse an answer when a new query is within this cosine distance of a cached one
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_MAX_DISTANCE = float(os.getenv("ANSWER_CACHE_MAX_DISTANCE", "0.05"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(6 * 3600)))
+FINGERPRINT_CHECK_SECONDS = float(os.getenv("FINGERPRINT_CHECK_SECONDS", "30"))
+
+# "Delete all" purges run on one background thread, in batches with a pause between them
+PURGE_CONVERSATIONS_PER_BATCH = int(os.getenv("PURGE_CONVERSATIONS_PER_BATCH", "50"))
+PURGE_MESSAGES_PER_BATCH = int(os.getenv("PURGE_MESSAGES_PER_BATCH", "1000"))
+PURGE_PAUSE_MS = float(os.getenv("PURGE_PAUSE_MS", "50"))
+# A running purge whose worker has not written progress for this long may be taken over by another worker
+PURGE_LEASE_SECONDS = float(os.getenv("PURGE_LEASE_SECONDS", "60"))
+
+# Opt-in sampled profiling: this fraction of requests is run under cProfile and dumped to PROFILE_DIR
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/rag_profiles")
+
+# Canned answers for greetings and questions about the assistant: intents and exemplars in INTENTS_FILE.
+# Short queries within INTENT_FUZZY_THRESHOLD (trigram Dice similarity) of an exemplar match too, and when
+# INTENT_EMBEDDING_MAX_DISTANCE is set, so do query embeddings within that cosine distance of one.
+INTENTS_FILE = os.getenv("INTENTS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "intents.json"))
+INTENT_FUZZY_THRESHOLD = float(os.getenv("INTENT_FUZZY_THRESHOLD", "0.8"))
+INTENT_EMBEDDING_MAX_DISTANCE = os.getenv("INTENT_EMBEDDING_MAX_DISTANCE")
+
+# Admission control (per worker process): a token bucket per user, and for each downstream a cap on
+# concurrent calls plus a bounded FIFO queue. A request waits at most ADMISSION_MAX_WAIT_MS in total
+# across the queues, and otherwise gets a 429/503 with Retry-After.
+USER_RATE_PER_MINUTE = float(os.getenv("USER_RATE_PER_MINUTE", "20"))
+USER_BURST = int(os.getenv("USER_BURST", "10"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "32"))
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "16"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_MAX_WAIT_MS = float(os.getenv("ADMISSION_MAX_WAIT_MS", "3000"))
+# Retry-After sent when Gemini itself reports its quota is exhausted
+GEMINI_QUOTA_RETRY_AFTER_SECONDS = int(os.getenv("GEMINI_QUOTA_RETRY_AFTER_SECONDS", "30"))
+
+# Page sizes for the conversation list and message history
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Write-behind for chat turns: queue finished turns and write them in batches off the request path
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+CHAT_WRITE_QUEUE_SIZE = int(os.getenv("CHAT_WRITE_QUEUE_SIZE", "1000"))
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "100"))
+CHAT_WRITE_FLUSH_MS = float(os.getenv("CHAT_WRITE_FLUSH_MS", "200"))
+
+# Warm-up after startup: embed and retrieve a dummy query so the Ollama model, the index and a DB
+# connection are resident before /readyz reports ready
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "where is flexbox taught")
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "120"))
+
 app = FastAPI()
 
 origins = [FRONTEND_URL]
@@ -41,6 +172,29 @@ app.add_middleware(
 
 
 app.add_middleware(SessionMiddleware, secret_key=SESSION_SECRET_KEY)
+profiler = SampledProfiler(PROFILE_SAMPLE_RATE, PROFILE_DIR) if PROFILE_SAMPLE_RATE > 0 else None
+
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """Records request latency per route (for streams, until the headers are sent) and runs the sampled profiler."""
+    profile = profiler.start() if profiler else None
+    started = time.perf_counter()
+    # An exception escaping the app is answered with a 500 by the server error middleware
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        metrics.http_request_seconds.observe(
+            time.perf_counter() - started, method=request.method, route=route_path, status=status
+        )
+        if profile is not None:
+            profiler.stop(profile, f"{request.method} {route_path}")
+
 oauth = OAuth()
 oauth.register(
     name='google',
@@ -50,8 +204,34 @@ oauth.register(
     client_kwargs={'scope': 'openid email profile'}
 )
 
-collection = None
+retriever = None
+lexical_index = None
+intent_router = None
 gemini_model = None
+embedding_client = None
+embedding_batcher = None
+blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+purge_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="purge")
+embedding_cache = EmbeddingCache(max_entries=EMBED_CACHE_SIZE, db_path=EMBED_CACHE_DB)
+answer_cache = SemanticAnswerCache(
+    max_entries=ANSWER_CACHE_SIZE,
+    max_distance=ANSWER_CACHE_MAX_DISTANCE,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+)
+collection_fingerprint_state = {"value": None, "checked_at": 0.0}
+user_limiter = UserRateLimiter(USER_RATE_PER_MINUTE, USER_BURST)
+embed_limiter = ConcurrencyLimiter("ollama", EMBED_CONCURRENCY, ADMISSION_QUEUE_SIZE, ADMISSION_MAX_WAIT_MS / 1000)
+gemini_limiter = ConcurrencyLimiter("gemini", GEMINI_CONCURRENCY, ADMISSION_QUEUE_SIZE, ADMISSION_MAX_WAIT_MS / 1000)
+gemini_breaker = CircuitBreaker("gemini", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+relevance_settings = {"max_distance": None, "margin": DEFAULT_RELEVANCE_MARGIN}
+# Startup phase durations (seconds) and warm-up progress, reported by /readyz and /metrics
+startup_state = {"began_at": time.perf_counter(), "timings": {}, "warmup": "pending", "warmup_errors": []}
+turn_writer = TurnWriter(
+    blocking_executor,
+    max_queue_size=CHAT_WRITE_QUEUE_SIZE,
+    batch_size=CHAT_WRITE_BATCH_SIZE,
+    flush_interval_seconds=CHAT_WRITE_FLUSH_MS / 1000,
+) if CHAT_WRITE_BEHIND else None
 
 def get_db():
     db = database.SessionLocal()
@@ -60,59 +240,291 @@ def get_db():
     finally:
         db.close()
 
+@contextmanager
+def startup_phase(name):
+    """Records how long one startup phase took in startup_state['timings']."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_state["timings"][name] = round(time.perf_counter() - started, 3)
+
+
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
     """
-    Load ChromaDB and configure the Gemini client on startup.
+    Load the retrieval backend and configure the Gemini client on startup,
+    then warm the embedding and retrieval paths in the background.
     """
-    global collection, gemini_model
-    
-    # 1. Load ChromaDB collection
-    print("Loading ChromaDB collection...")
-    try:
-        client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
-        collection = client.get_collection(name=COLLECTION_NAME)
-        print("Collection loaded successfully.")
-    except Exception as e:
-        print(f"Error loading ChromaDB collection: {e}")
+    global retriever, lexical_index, intent_router, gemini_model, embedding_client, embedding_batcher
+
+    # 0. Create the tables (single-process servers; under gunicorn the master already did, once)
+    if not DATABASE_SCHEMA_READY:
+        with startup_phase("database"):
+            database.init_db()
+
+    if INDEX_SNAPSHOT_DIR:
+        retrieval_backend = "numpy"
+        vector_index_dir = os.path.join(INDEX_SNAPSHOT_DIR, "vector_index")
+        bm25_index_dir = os.path.join(INDEX_SNAPSHOT_DIR, "bm25_index")
+    else:
+        retrieval_backend, vector_index_dir, bm25_index_dir = RETRIEVAL_BACKEND, VECTOR_INDEX_DIR, BM25_INDEX_DIR
+
+    # 1. Load the retrieval backend
+    with startup_phase("retriever"):
+        if retrieval_backend == "numpy":
+            print(f"Loading vector index snapshot from {vector_index_dir}...")
+            try:
+                retriever = VectorIndex(vector_index_dir)
+                print(f"Vector index loaded successfully ({retriever.count()} chunks).")
+            except Exception as e:
+                print(f"Error loading vector index: {e}")
+        else:
+            print("Loading ChromaDB collection...")
+            try:
+                client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
+                collection = client.get_collection(name=COLLECTION_NAME)
+                retriever = ChromaRetriever(collection, CHROMA_DB_DIR, INDEX_VERSION_FILENAME)
+                print("Collection loaded successfully.")
+            except Exception as e:
+                print(f"Error loading ChromaDB collection: {e}")
+
+    with startup_phase("bm25"):
+        if os.path.isdir(bm25_index_dir):
+            try:
+                lexical_index = BM25Index(bm25_index_dir)
+                print(f"BM25 index loaded successfully ({lexical_index.count()} chunks), hybrid retrieval enabled.")
+            except Exception as e:
+                print(f"Error loading BM25 index: {e}")
+
+    configure_relevance_gate()
+
+    with startup_phase("intents"):
+        try:
+            intent_router = IntentRouter.from_file(
+                INTENTS_FILE,
+                fuzzy_threshold=INTENT_FUZZY_THRESHOLD,
+                embedding_max_distance=float(INTENT_EMBEDDING_MAX_DISTANCE) if INTENT_EMBEDDING_MAX_DISTANCE else None,
+            )
+            print(f"Intent router loaded ({intent_router.stats()['exemplars']} exemplars).")
+        except Exception as e:
+            print(f"Error loading intents from {INTENTS_FILE}: {e}")
 
     # 2. Configure the Gemini client
     print("Configuring Gemini client...")
+    with startup_phase("gemini"):
+        try:
+            if GEMINI_API_BASE:
+                gemini_model = GeminiRestModel(GEMINI_MODEL, GOOGLE_API_KEY, GEMINI_API_BASE, timeout=GENERATION_TIMEOUT_SECONDS)
+            else:
+                genai.configure(api_key=GOOGLE_API_KEY)
+                gemini_model = genai.GenerativeModel(GEMINI_MODEL)
+            print("Gemini client configured successfully.")
+        except Exception as e:
+            print(f"Error configuring Gemini client: {e}")
+
+    # Resume purges interrupted by a restart (each is claimed, so only one worker runs it)
     try:
-        genai.configure(api_key=GOOGLE_API_KEY)
-        gemini_model = genai.GenerativeModel('gemini-1.5-flash') 
-        print("Gemini client configured successfully.")
+        with database.SessionLocal() as db:
+            for job_id in unfinished_purge_jobs(db):
+                submit_purge_job(job_id)
     except Exception as e:
-        print(f"Error configuring Gemini client: {e}")
-
-
-def create_embedding(text):
-    """Creates an embedding using the local Ollama model."""
+        print(f"Error resuming purge jobs: {e}")
+
+    # 3. Open the embedding client (a connection pool per Ollama endpoint)
+    embedding_client = ResilientEmbeddingClient(
+        OLLAMA_EMBED_URLS,
+        model=EMBED_MODEL,
+        timeout=EMBED_TIMEOUT_SECONDS,
+        attempt_timeout=EMBED_ATTEMPT_TIMEOUT_SECONDS,
+        retries=EMBED_RETRIES,
+        hedge_quantile=EMBED_HEDGE_QUANTILE,
+        hedge_budget=EMBED_HEDGE_BUDGET,
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds=CIRCUIT_RESET_SECONDS,
+    )
+    embedding_batcher = EmbeddingBatcher(
+        embedding_client,
+        max_batch_size=EMBED_BATCH_MAX_SIZE,
+        max_wait_seconds=EMBED_BATCH_WAIT_MS / 1000,
+    )
+
+    startup_state["timings"]["startup"] = round(time.perf_counter() - startup_state["began_at"], 3)
+    print(f"Startup finished in {startup_state['timings']['startup']:.2f}s {startup_state['timings']}")
+
+    # 4. Warm up without holding the server: /healthz answers right away, /readyz once this is done
+    if WARMUP_ENABLED:
+        startup_state["warmup_task"] = asyncio.create_task(warm_up())
+    else:
+        startup_state["warmup"] = "skipped"
+        if intent_router is not None and intent_router.embedding_enabled:
+            startup_state["warmup_task"] = asyncio.create_task(embed_intent_exemplars())
+
+
+async def embed_intent_exemplars():
+    """Precomputes the intent exemplar vectors for embedding matching (once per process)."""
     try:
-        response = requests.post(
-            OLLAMA_EMBED_URL,
-            json={"model": "bge-m3", "input": [text]}
-        )
-        response.raise_for_status()
-        return response.json()["embeddings"][0]
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling embedding API: {e}")
+        vectors = await embedding_client.embed([text for text, _ in intent_router.exemplars])
+        intent_router.set_exemplar_vectors(vectors)
         return None
+    except (httpx.HTTPError, asyncio.TimeoutError, Rejected, KeyError, ValueError) as e:
+        return f"intent exemplars: {e!r}"
+
+
+def configure_relevance_gate():
+    """Takes the gate's threshold and margin from the environment, else from the calibration file."""
+    calibration = load_calibration(RELEVANCE_CALIBRATION_FILE) or {}
+    if calibration and calibration.get("model") != EMBED_MODEL:
+        print(f"Ignoring {RELEVANCE_CALIBRATION_FILE}: calibrated for {calibration.get('model')}, not {EMBED_MODEL}.")
+        calibration = {}
+    if RELEVANCE_MAX_DISTANCE:
+        relevance_settings["max_distance"] = float(RELEVANCE_MAX_DISTANCE)
+    else:
+        relevance_settings["max_distance"] = calibration.get("max_distance")
+    if RELEVANCE_MARGIN:
+        relevance_settings["margin"] = float(RELEVANCE_MARGIN)
+    else:
+        relevance_settings["margin"] = calibration.get("margin", DEFAULT_RELEVANCE_MARGIN)
+    if relevance_settings["max_distance"] is None:
+        print("Relevance gate disabled (no calibrated threshold).")
+    else:
+        print(f"Relevance gate: max distance {relevance_settings['max_distance']}, margin {relevance_settings['margin']}.")
+
+
+async def warm_up():
+    """
+    Runs a dummy query through the embedding, retrieval and database paths so the
+    Ollama model, the vector index (Chroma's HNSW segments or the mmapped snapshot)
+    and a pooled DB connection are loaded before real traffic. Embedding is retried
+    until WARMUP_TIMEOUT_SECONDS, since Ollama may still be loading the model.
+    Failures are recorded but do not keep the replica unready forever.
+    """
+    startup_state["warmup"] = "running"
+    deadline = time.perf_counter() + WARMUP_TIMEOUT_SECONDS
+    errors = startup_state["warmup_errors"]
+
+    query_embedding = None
+    with startup_phase("warmup_embedding"):
+        delay = 0.5
+        while True:
+            try:
+                query_embedding = (await embedding_client.embed([WARMUP_QUERY]))[0]
+                break
+            except (httpx.HTTPError, asyncio.TimeoutError, Rejected, KeyError, IndexError) as e:
+                if time.perf_counter() + delay > deadline:
+                    errors.append(f"embedding: {e!r}")
+                    break
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+
+    if query_embedding is not None and intent_router is not None and intent_router.embedding_enabled:
+        with startup_phase("warmup_intents"):
+            error = await embed_intent_exemplars()
+            if error:
+                errors.append(error)
+
+    if retriever is not None and query_embedding is not None:
+        with startup_phase("warmup_retrieval"):
+            try:
+                await query_retriever(WARMUP_QUERY, query_embedding, 7)
+            except Exception as e:
+                errors.append(f"retrieval: {e!r}")
+
+    with startup_phase("warmup_db"):
+        try:
+            await run_blocking(database.ping, timeout=DB_TIMEOUT_SECONDS)
+        except Exception as e:
+            errors.append(f"database: {e!r}")
+
+    startup_state["warmup"] = "failed" if errors else "done"
+    startup_state["timings"]["ready"] = round(time.perf_counter() - startup_state["began_at"], 3)
+    print(f"Warm-up {startup_state['warmup']} after {startup_state['timings']['ready']:.2f}s"
+          + (f": {'; '.join(errors)}" if errors else ""))
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    warmup_task = startup_state.get("warmup_task")
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    if turn_writer is not None:
+        await turn_writer.close()
+    if embedding_client is not None:
+        await embedding_client.aclose()
+    if isinstance(gemini_model, GeminiRestModel):
+        await gemini_model.aclose()
+    blocking_executor.shutdown(wait=False)
+    purge_executor.shutdown(wait=False, cancel_futures=True)
+    embedding_cache.close()
+
+
+async def run_blocking(func, *args, timeout=None, **kwargs):
+    """Runs a blocking call (Chroma, SQLAlchemy) on the bounded executor so the event loop stays free."""
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(blocking_executor, functools.partial(func, *args, **kwargs))
+    return await asyncio.wait_for(future, timeout)
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    Runs func(db, *args, **kwargs) on the executor with a session of its own, opened and closed inside the job
+    (a Session must not be used from two threads). Not timed out: a write abandoned by a timeout could still
+    commit after the client was told it failed, and a retry would then duplicate it.
+    """
+    def job():
+        with database.SessionLocal() as db:
+            return func(db, *args, **kwargs)
+    return await run_blocking(job)
 
-def normalize_text(s: str) -> str:
-    """Normalize text for comparison:
-       - ensure it's a string
-       - strip leading/trailing whitespace
-       - lowercase
-       - remove punctuation
-       - collapse multiple spaces
+
+async def create_embedding(text, deadline=None):
+    """
+    Creates an embedding using the local Ollama model, going through the query embedding cache first.
+    Cache misses wait for an Ollama slot until `deadline` (event-loop time); raises Rejected if none frees up.
+    Raises asyncio.TimeoutError (answered with 504) when the embedding takes longer than EMBED_TIMEOUT_SECONDS,
+    and Rejected (503) when every attempt failed or every endpoint's circuit is open.
     """
-    if s is None:
-        return ""
-    s = str(s)
-    s = re.sub(r"[^\w\s]", "", s, flags=re.UNICODE)
-    s = re.sub(r"\s+", " ", s).strip().lower()
-    return s
+    cache_key = normalize_text(text)
+    if cache_key:
+        embedding = embedding_cache.get(EMBED_MODEL, cache_key)
+        if embedding is not None:
+            metrics.cache_lookups.inc(cache="embedding", result="memory_hit")
+            return embedding
+        if embedding_cache.persistent:
+            with metrics.stage("embedding_cache"):
+                embedding = await run_blocking(embedding_cache.get_persistent, EMBED_MODEL, cache_key, timeout=DB_TIMEOUT_SECONDS)
+            if embedding is not None:
+                metrics.cache_lookups.inc(cache="embedding", result="persistent_hit")
+                return embedding
+        metrics.cache_lookups.inc(cache="embedding", result="miss")
+
+    try:
+        async with embed_limiter.slot(deadline):
+            with metrics.stage("embedding"):
+                embedding = await asyncio.wait_for(embedding_batcher.embed(text), EMBED_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        print("Embedding API timed out.")
+        raise
+    except httpx.HTTPError as e:
+        print(f"Error calling embedding API: {e!r}")
+        raise Rejected("unavailable", 503, math.ceil(EMBED_ATTEMPT_TIMEOUT_SECONDS), "ollama") from e
+
+    if cache_key:
+        await run_blocking(embedding_cache.put, EMBED_MODEL, cache_key, embedding, timeout=DB_TIMEOUT_SECONDS)
+    return embedding
+
+def ensure_user(db: Session, user_info):
+    """Creates the user on first login. Returns the user's id."""
+    user = db.query(database.User).filter(database.User.email == user_info['email']).first()
+    if not user:
+        user = database.User(email=user_info['email'], name=user_info['name'], picture=user_info['picture'])
+        db.add(user)
+        db.flush()
+        user_id = user.id
+        db.commit()
+        return user_id
+    return user.id
+
 
 @app.get("/api/me")
 async def read_user_me(request: Request):
@@ -123,260 +535,308 @@ async def read_user_me(request: Request):
     return JSONResponse(content=user)
 
 
+@app.get("/healthz")
+def liveness():
+    """Liveness: the process is up and serving. Does not touch downstream services."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readiness():
+    """
+    Readiness: 200 once the retrieval backend and Gemini client are loaded and
+    warm-up has finished (a failed warm-up is reported but does not block), 503 before.
+    """
+    checks = {
+        "retriever": retriever is not None,
+        "gemini": gemini_model is not None,
+        "embedding_client": embedding_client is not None,
+        "warmup": startup_state["warmup"] in ("done", "failed", "skipped"),
+    }
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "checks": checks,
+            "warmup": startup_state["warmup"],
+            "warmup_errors": startup_state["warmup_errors"],
+            "startup_seconds": startup_state["timings"],
+        },
+    )
+
+
+@app.get("/api/stats")
+def read_stats():
+    """Cache and pipeline counters for operators."""
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "embedding_batcher": embedding_batcher.stats() if embedding_batcher else None,
+        "embedding_client": embedding_client.stats() if embedding_client else None,
+        "embedding_endpoints": embedding_client.endpoint_stats() if embedding_client else None,
+        "gemini_circuit": gemini_breaker.stats(),
+        "answer_cache": answer_cache.stats(),
+        "turn_writer": turn_writer.stats() if turn_writer else None,
+        "intent_router": intent_router.stats() if intent_router else None,
+        "admission": {
+            "users": user_limiter.stats(),
+            "embedding": embed_limiter.stats(),
+            "gemini": gemini_limiter.stats(),
+        },
+    }
+
+
+@app.get("/metrics")
+def read_metrics():
+    """Prometheus text exposition of the pipeline metrics plus the cache and batcher counters."""
+    extra = []
+    extra += metrics.stats_gauges("rag_embedding_cache", embedding_cache.stats())
+    extra += metrics.stats_gauges("rag_answer_cache", answer_cache.stats())
+    if embedding_batcher is not None:
+        extra += metrics.stats_gauges("rag_embedding_batcher", embedding_batcher.stats())
+    if embedding_client is not None:
+        extra += metrics.stats_gauges("rag_embedding_client", embedding_client.stats())
+        extra += metrics.labeled_gauges("rag_embedding_endpoint", "url", embedding_client.endpoint_stats())
+    extra += metrics.stats_gauges("rag_gemini_circuit", gemini_breaker.stats())
+    if turn_writer is not None:
+        extra += metrics.stats_gauges("rag_turn_writer", turn_writer.stats())
+    extra += metrics.stats_gauges("rag_startup_seconds", startup_state["timings"])
+    extra += metrics.stats_gauges("rag_admission_user", user_limiter.stats())
+    extra += metrics.stats_gauges("rag_admission_embed", embed_limiter.stats())
+    extra += metrics.stats_gauges("rag_admission_gemini", gemini_limiter.stats())
+    return Response(content=metrics.render(extra), media_type="text/plain; version=0.0.4")
+
+
 @app.get('/login')
 async def login(request: Request):
       redirect_uri = request.url_for('auth') 
       return await oauth.google.authorize_redirect(request, redirect_uri)
 
 @app.get('/auth')
-async def auth(request: Request, db: Session = Depends(get_db)):
+async def auth(request: Request):
     token = await oauth.google.authorize_access_token(request)
     user_info = token.get('userinfo')
     request.session['user'] = dict(user_info)
 
-    # Check if user exists, if not, create them
-    user = db.query(database.User).filter(database.User.email == user_info['email']).first()
-    if not user:
-        new_user = database.User(email=user_info['email'], name=user_info['name'], picture=user_info['picture'])
-        db.add(new_user)
-        db.commit()
+    # Check if user exists, if not, create them; the id saves a lookup by email on every new conversation
+    request.session['user_id'] = await run_db(ensure_user, user_info)
 
     return RedirectResponse(url=FRONTEND_URL)
 
 @app.get('/logout')
 async def logout(request: Request):
     request.session.pop('user', None)
+    request.session.pop('user_id', None)
     return RedirectResponse(url=FRONTEND_URL)
 
+def session_user_id(request: Request, db: Session):
+    """The logged-in user's id: from the session, or looked up once by email for sessions created before it was stored."""
+    user_id = request.session.get('user_id')
+    if user_id is None:
+        user_id = db.query(database.User.id).filter(database.User.email == request.session['user']['email']).scalar()
+        if user_id is not None:
+            request.session['user_id'] = user_id
+    return user_id
+
+
 @app.get("/conversations")
-async def get_conversations(request: Request, db: Session = Depends(get_db)):
+def get_conversations(request: Request, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None, db: Session = Depends(get_db)):
+    """One page of the user's conversations, newest first. Pass next_cursor back as cursor for the next page."""
     user_info = request.session.get('user')
     if not user_info:
         return JSONResponse(status_code=401, content={"error": "Not authenticated"})
-    
-    user = db.query(database.User).filter(database.User.email == user_info['email']).first()
-    if not user:
+
+    user_id = session_user_id(request, db)
+    if user_id is None:
         return JSONResponse(status_code=404, content={"error": "User not found"})
-        
-    conversations = db.query(database.Conversation).filter(database.Conversation.user_id == user.id).order_by(database.Conversation.created_at.desc()).all()
-    return [{"id": c.id, "title": c.title} for c in conversations]
+
+    try:
+        conversations, next_cursor = list_conversations(
+            db, user_id, max(1, min(limit, MAX_PAGE_SIZE)), cursor, purged_up_to=active_purge_cutoff(db, user_id)
+        )
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "Invalid cursor"})
+    return {"conversations": conversations, "next_cursor": next_cursor}
 
 @app.get("/conversations/{conversation_id}")
-async def get_conversation_messages(conversation_id: int, request: Request, db: Session = Depends(get_db)):
+def get_conversation_messages(conversation_id: int, request: Request, limit: int = DEFAULT_PAGE_SIZE, before: int = None,
+                              db: Session = Depends(get_db)):
+    """The latest messages of a conversation (oldest first); pass next_cursor back as before for earlier ones."""
     user_info = request.session.get('user')
     if not user_info:
         return JSONResponse(status_code=401, content={"error": "Not authenticated"})
-    
-    messages = db.query(database.Message).filter(database.Message.conversation_id == conversation_id).order_by(database.Message.id).all()
-    return [{"role": m.role, "content": m.content, "sources": json.loads(m.sources) if m.sources else []} for m in messages]
+
+    user_id = session_user_id(request, db)
+    if user_id is None or not owns_conversation(db, user_id, conversation_id):
+        return JSONResponse(status_code=404, content={"error": "Conversation not found or access denied"})
+
+    body = list_messages_json(db, conversation_id, max(1, min(limit, MAX_PAGE_SIZE)), before)
+    return Response(content=body, media_type="application/json")
 
 
 @app.delete("/conversations/{conversation_id}")
-async def delete_conversation(conversation_id: int, request: Request, db: Session = Depends(get_db)):
+def delete_conversation(conversation_id: int, request: Request, db: Session = Depends(get_db)):
     user_info = request.session.get('user')
     if not user_info:
         return JSONResponse(status_code=401, content={"error": "Not authenticated"})
 
-    user = db.query(database.User).filter(database.User.email == user_info['email']).first()
-    if not user:
+    user_id = session_user_id(request, db)
+    if user_id is None:
         return JSONResponse(status_code=404, content={"error": "User not found"})
 
-    conversation = db.query(database.Conversation).filter(database.Conversation.id == conversation_id, database.Conversation.user_id == user.id).first()
-    if not conversation:
-        return JSONResponse(status_code=404, content={"error": "Conversation not found or access denied"})
-
-    db.query(database.Message).filter(database.Message.conversation_id == conversation_id).delete()
-    db.delete(conversation)
+    # Messages go with it through ON DELETE CASCADE
+    deleted = db.query(database.Conversation).filter(
+        database.Conversation.id == conversation_id, database.Conversation.user_id == user_id
+    ).delete(synchronize_session=False)
     db.commit()
+    if not deleted:
+        return JSONResponse(status_code=404, content={"error": "Conversation not found or access denied"})
 
     return JSONResponse(status_code=200, content={"message": "Conversation deleted successfully"})
 
 
+def submit_purge_job(job_id):
+    purge_executor.submit(
+        run_purge_job, job_id,
+        conversations_per_batch=PURGE_CONVERSATIONS_PER_BATCH,
+        messages_per_batch=PURGE_MESSAGES_PER_BATCH,
+        pause_seconds=PURGE_PAUSE_MS / 1000,
+        lease_seconds=PURGE_LEASE_SECONDS,
+    )
+
+
 @app.delete("/conversations")
-async def delete_all_conversations(request: Request, db: Session = Depends(get_db)):
+def delete_all_conversations(request: Request, db: Session = Depends(get_db)):
+    """
+    Starts a background purge of all of the user's conversations and returns its job at once (202).
+    The conversations disappear from /conversations immediately; GET /purge-jobs/{job_id} reports progress.
+    """
     user_info = request.session.get('user')
     if not user_info:
         return JSONResponse(status_code=401, content={"error": "Not authenticated"})
 
-    user = db.query(database.User).filter(database.User.email == user_info['email']).first()
-    if not user:
+    user_id = session_user_id(request, db)
+    if user_id is None:
         return JSONResponse(status_code=404, content={"error": "User not found"})
 
-    conversation_ids = [c.id for c in db.query(database.Conversation).filter(database.Conversation.user_id == user.id).all()]
-
-    if conversation_ids:
-        db.query(database.Message).filter(database.Message.conversation_id.in_(conversation_ids)).delete(synchronize_session=False)
-        db.query(database.Conversation).filter(database.Conversation.user_id == user.id).delete(synchronize_session=False)
-        db.commit()
-
-    return JSONResponse(status_code=200, content={"message": "All conversations deleted successfully"})
+    job_id = create_purge_job(db, user_id)
+    status = purge_job_status(db, user_id, job_id)
+    if status["status"] == "pending":
+        submit_purge_job(job_id)
+    return JSONResponse(status_code=202, content={"message": "Deleting all conversations", **status})
 
 
-@app.post("/ask")
-async def ask_question(request: Request, db: Session = Depends(get_db)):
-    
+@app.get("/purge-jobs/{job_id}")
+def get_purge_job(job_id: int, request: Request, db: Session = Depends(get_db)):
     user_info = request.session.get('user')
     if not user_info:
         return JSONResponse(status_code=401, content={"error": "Not authenticated"})
 
+    status = purge_job_status(db, session_user_id(request, db), job_id)
+    if status is None:
+        return JSONResponse(status_code=404, content={"error": "Purge job not found"})
+    return status
 
-    if collection is None or gemini_model is None:
-        return JSONResponse(status_code=503, content={"error": "Server is not ready. Please check logs."})
-
-    try:
-        data = await request.json()
-        query = data.get("query")
-        if not query:
-            return JSONResponse(status_code=400, content={"error": "Query not provided"})
-        
-        general_questions = {
-            "who are you": "Hi, I am a virtual assistant designed to help students with their coursework in the Sigma Web Development course. If you have any questions about the course, like wanting to find where a particular topic is taught, I will try my best to find it for you. Thank You.",
-            "what can you do": "I can help you find specific topics within the Sigma Web Development course videos. Just ask me a question about a topic, and I'll try to point you to the right video and timestamp. I can also answer general questions about myself.",
-            "hello": "Hello there! How can I help you with the Sigma course today?",
-            "hi": "Hi! How can I help you with the Sigma course today?",
-            "thank you": "You're welcome! Let me know if you have any other questions.",
-        }
-
-        modified_query = normalize_text(query)
-        if modified_query in general_questions:
-            answer = general_questions[modified_query]
-
-            conversation_id = data.get("conversation_id")
-            user = db.query(database.User).filter(database.User.email == user_info['email']).first()
-
-            if not conversation_id:
-                title = query[:50] + "..." if len(query) > 50 else query
-                new_convo = database.Conversation(user_id=user.id, title=title)
-                db.add(new_convo)
-                db.commit()
-                db.refresh(new_convo)
-                conversation_id = new_convo.id
-            
-            user_message = database.Message(conversation_id=conversation_id, role="user", content=query)
-            bot_message = database.Message(conversation_id=conversation_id, role="bot", content=answer, sources=json.dumps([])) # Empty sources
-            db.add(user_message)
-            db.add(bot_message)
-            db.commit()
-            
-            return {
-                "answer": answer,
-                "sources": [], 
-                "conversation_id": conversation_id
-            }
-        
-        person_aliases = {
-            "who is harry",
-            "who is codewithharry",
-            "who is haris ali khan",
-            "who is haris",
-            "who is code with harry",
-         }
-
-        if modified_query in person_aliases:
-            profile_text = (
-                "Haris Ali Khan, known as CodeWithHarry, is an Indian software developer and educator who creates programming tutorials and courses. He runs the CodeWithHarry website and YouTube channel, and he is the instructor behind the Sigma Web Development course/playlist. If you want the course materials, check the Sigma playlist link in the sources below."
-            )
-
-            sources_list = [
-                {"title": "CodeWithHarry — Official site", "url": "https://www.codewithharry.com/"},
-                {"title": "Sigma Web Development Course — YouTube playlist", "url": "https://www.youtube.com/playlist?list=PLu0W_9lII9agq5TrH9XLIKQvv0iaF2X3w"},
-                {"title": "Sigma course repo / materials (GitHub)", "url": "https://github.com/CodeWithHarry/Sigma-Web-Dev-Course"},
-                {"title": "CodeWithHarry — Udemy / instructor page", "url": "https://www.udemy.com/user/harry-3642/"},
-                {"title": "CodeWithHarry — social / profile", "url": "https://x.com/codewithharry"}
-            ]
-
-            conversation_id = data.get("conversation_id")
-            user = db.query(database.User).filter(database.User.email == user_info['email']).first()
-
-            if not conversation_id:
-                title = query[:50] + "..." if len(query) > 50 else query
-                new_convo = database.Conversation(user_id=user.id, title=title)
-                db.add(new_convo)
-                db.commit()
-                db.refresh(new_convo)
-                conversation_id = new_convo.id
-
-            user_message = database.Message(conversation_id=conversation_id, role="user", content=query)
-            bot_message = database.Message(
-            conversation_id=conversation_id,
-            role="bot",
-            content=profile_text,
-            sources=json.dumps(sources_list)
-              )
-            db.add(user_message)
-            db.add(bot_message)
-            db.commit()
-
-            return {
-                "answer": profile_text,
-                "sources": sources_list,
-                "conversation_id": conversation_id
-            }
 
-        
-        conversation_id = data.get("conversation_id")
+INSUFFICIENT_INFO_MESSAGE = "I'm sorry, but I don't have enough information from the course videos to answer that question."
 
-        user = db.query(database.User).filter(database.User.email == user_info['email']).first()
 
-        # Save user message
+async def persist_turn(session, conversation_id, query, answer, sources):
+    """
+    Saves the user's query and the answer together and returns the conversation id. A new conversation
+    is created with its first turn in one transaction, so a request that fails before it has an answer
+    leaves nothing behind. Turns of existing conversations are queued for the write-behind writer,
+    or written in one transaction now.
+    """
+    with metrics.stage("db_turn"):
         if not conversation_id:
-            # Create a new conversation
-            title = query[:50] + "..." if len(query) > 50 else query
-            new_convo = database.Conversation(user_id=user.id, title=title)
-            db.add(new_convo)
-            db.commit()
-            db.refresh(new_convo)
-            conversation_id = new_convo.id
-    
-        user_message = database.Message(conversation_id=conversation_id, role="user", content=query)
-        db.add(user_message)
-        db.commit()
-
-        print(f"Creating embedding for query: '{query}'")
-        query_embedding = create_embedding(query)
-        if query_embedding is None:
-            return JSONResponse(status_code=500, content={"error": "Failed to create query embedding."})
-
-        
-        print("Querying database for 7 chunks...")
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=7  
+            return await run_db(save_first_turn, query, answer, sources,
+                                user_id=session.get('user_id'), email=session['user']['email'])
+        turn = (conversation_id, query, answer, sources)
+        if turn_writer is None or not turn_writer.submit(turn):
+            await run_db(save_turns, [turn])
+        return conversation_id
+
+
+async def save_canned_turn(session, conversation_id, query, answer, sources):
+    conversation_id = await persist_turn(session, conversation_id, query, answer, sources)
+    return {
+        "answer": answer,
+        "sources": sources,
+        "conversation_id": conversation_id
+    }
+
+
+async def collection_fingerprint():
+    """Returns the retrieval index fingerprint, re-reading it at most every FINGERPRINT_CHECK_SECONDS."""
+    state = collection_fingerprint_state
+    now = time.monotonic()
+    if state["value"] is None or now - state["checked_at"] > FINGERPRINT_CHECK_SECONDS:
+        state["value"] = await run_blocking(retriever.fingerprint, timeout=RETRIEVAL_TIMEOUT_SECONDS)
+        state["checked_at"] = now
+    return state["value"]
+
+
+async def retrieve_context(query, query_embedding, n_results=CONTEXT_CANDIDATES):
+    """
+    Over-fetches from the retrieval backend off the event loop, then builds the prompt
+    context (adjacent chunks merged, MMR-diversified, packed into the token budget)
+    plus the list of unique sources.
+    Returns (None, []) when the relevance gate finds nothing close enough to answer from.
+    """
+    print(f"Querying database for {n_results} chunks...")
+    with metrics.stage("retrieval"):
+        results = await query_retriever(query, query_embedding, n_results)
+
+    best = best_distance(results)
+    if best is not None:
+        metrics.best_distances.observe(best)
+    max_distance = relevance_settings["max_distance"]
+    if not is_relevant(results, max_distance):
+        metrics.relevance_gated.inc()
+        return None, []
+    results = trim_by_distance(results, relevance_settings["margin"], max_distance)
+
+    with metrics.stage("context"):
+        context_for_prompt, sources, chunks_used = build_context(
+            results,
+            token_budget=CONTEXT_TOKEN_BUDGET,
+            max_passages=CONTEXT_MAX_PASSAGES,
+            mmr_lambda=CONTEXT_MMR_LAMBDA,
+            merge_gap_seconds=CONTEXT_MERGE_GAP_SECONDS,
+        )
+    metrics.retrieved_chunks.observe(chunks_used)
+    return context_for_prompt, sources
+
+
+async def query_retriever(query, query_embedding, n_results):
+    """Hybrid (BM25 + vector) retrieval when the lexical index is loaded, else vector search alone."""
+    if lexical_index is not None:
+        return await run_blocking(
+            hybrid_query,
+            retriever,
+            lexical_index,
+            query,
+            query_embedding,
+            n_results=n_results,
+            candidates=HYBRID_CANDIDATES,
+            timeout=RETRIEVAL_TIMEOUT_SECONDS,
         )
+    return await run_blocking(
+        retriever.query,
+        query_embeddings=[query_embedding],
+        n_results=n_results,
+        timeout=RETRIEVAL_TIMEOUT_SECONDS,
+    )
 
-        unique_sources = {}
-        context_for_prompt = "" 
-        if results and results['documents']:
-            for i, doc in enumerate(results['documents'][0]):
-                metadata = results['metadatas'][0][i]
-                start_seconds = int(metadata.get('start_time', 0))
-                minutes = start_seconds // 60
-                seconds = start_seconds % 60
-                timestamp = f"{minutes:02d}:{seconds:02d}"
-                video_url_with_timestamp = metadata.get('youtube_url')
-
-                context_for_prompt += f"""---
-                Video Title: {metadata.get('video_title')}
-                Video Number: {metadata.get('video_number')}
-                Timestamp: {timestamp} ({start_seconds}s)
-                Content: {doc}
-                ---\n"""
-
-                if len(unique_sources) < 3:
-                    if video_url_with_timestamp not in unique_sources:
-                        unique_sources[video_url_with_timestamp] = {
-                            "title": metadata.get('video_title'),
-                            "url": video_url_with_timestamp
-                       }
-        
-        # Convert the dictionary of sources to a list
-        sources_list = list(unique_sources.values())
-
-        prompt = f"""
+
+def build_prompt(context_for_prompt, query):
+    return f"""
         You are an expert teaching assistant for the "Sigma Web Development" course.
         Your primary goal is to help users find where specific topics are taught by analyzing the provided video transcript chunks.
 
-        Here are the relevant transcript chunks retrieved for the user's question:
+        Here are the relevant transcript passages retrieved for the user's question, each headed
+        "[n] Video <number>: <title> @ <start>-<end> (<start in seconds>s)":
         {context_for_prompt}
 
         Here is the user's question: "{query}"
@@ -387,38 +847,325 @@ async def ask_question(request: Request, db: Session = Depends(get_db)):
         3.  Explicitly mention the video title and the start time (e.g., "at around 5 minutes and 30 seconds").
         4.  Provide a brief, one or two-sentence summary of what is discussed in that segment.
         5.  If the context suggests the topic is only briefly mentioned, state that and guide the user appropriately (e.g., "it is only a brief introduction").
-        6.  If the provided context does not contain enough information to answer the question, you MUST respond with: "I'm sorry, but I don't have enough information from the course videos to answer that question." Do not make up information.
+        6.  If the provided context does not contain enough information to answer the question, you MUST respond with: "{INSUFFICIENT_INFO_MESSAGE}" Do not make up information.
         """
 
-        print("Sending refined prompt to Gemini API...")
-        response = gemini_model.generate_content(prompt)
-        answer = response.text
-        
-        
-
-        print("Gemini response received.")
-        insufficient_msg = "I'm sorry, but I don't have enough information from the course videos to answer that question."
-        if answer.strip() == insufficient_msg:
-            bot_message = database.Message(conversation_id=conversation_id, role="bot", content=answer, sources=json.dumps([]))
-            db.add(bot_message)
-            db.commit()
-            return {
-            "answer": answer.strip(),
-            "sources": [],
-            "conversation_id": conversation_id
-        } 
-         
-        else:
-            bot_message = database.Message(conversation_id=conversation_id, role="bot", content=answer, sources=json.dumps(sources_list))
-            db.add(bot_message)
-            db.commit() 
-            
-            return {
-                "answer": answer.strip(),
-                "sources": sources_list,
-                "conversation_id": conversation_id
-            } 
 
+def match_intent(query):
+    """Returns (answer, sources) when the intent router matches the query text, else None."""
+    intent = intent_router.match(query) if intent_router is not None else None
+    if intent is None:
+        return None
+    metrics.canned_answers.inc(intent=intent["intent"], method=intent["method"])
+    return intent["answer"], intent["sources"]
+
+
+def match_intent_embedding(query_embedding):
+    """Returns (answer, sources) when the query embedding is close to an intent exemplar, else None."""
+    intent = intent_router.match_embedding(query_embedding) if intent_router is not None else None
+    if intent is None:
+        return None
+    metrics.canned_answers.inc(intent=intent["intent"], method=intent["method"])
+    return intent["answer"], intent["sources"]
+
+
+async def lookup_answer_cache(query_embedding):
+    """Semantic answer cache lookup against the current index fingerprint; counts hits and misses."""
+    cached = answer_cache.lookup(query_embedding, await collection_fingerprint())
+    metrics.cache_lookups.inc(cache="answer", result="hit" if cached is not None else "miss")
+    return cached
+
+
+def json_response(payload):
+    with metrics.stage("serialization"):
+        return JSONResponse(content=payload)
+
+
+async def read_json_object(request: Request):
+    """The request body as a JSON object, or None when it is malformed or not an object."""
+    try:
+        data = await request.json()
+    except ValueError:  # includes json.JSONDecodeError and undecodable bytes
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def admission_deadline():
+    """Event-loop time by which a request must have cleared the downstream queues."""
+    return asyncio.get_running_loop().time() + ADMISSION_MAX_WAIT_MS / 1000
+
+
+def is_quota_error(error):
+    """True for Gemini's own rate-limit/quota responses (REST client or SDK)."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429
+    return type(error).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+
+def rejection(error):
+    """(status, payload, headers) for a Rejected admission or a Gemini quota error."""
+    if isinstance(error, Rejected):
+        reason, status, retry_after, downstream = error.reason, error.status, error.retry_after, error.downstream or "user"
+    else:
+        reason, status, retry_after, downstream = "quota_exhausted", 503, GEMINI_QUOTA_RETRY_AFTER_SECONDS, "gemini"
+    metrics.admission_rejections.inc(reason=reason, downstream=downstream)
+    message = "Too many questions, please wait a moment." if status == 429 else "The assistant is busy right now. Please try again shortly."
+    return status, {"error": message, "retry_after": retry_after}, {"Retry-After": str(retry_after)}
+
+
+def rejection_response(error):
+    status, payload, headers = rejection(error)
+    return JSONResponse(status_code=status, content=payload, headers=headers)
+
+
+@app.post("/ask")
+async def ask_question(request: Request):
+    
+    user_info = request.session.get('user')
+    if not user_info:
+        return JSONResponse(status_code=401, content={"error": "Not authenticated"})
+
+
+    if retriever is None or gemini_model is None:
+        return JSONResponse(status_code=503, content={"error": "Server is not ready. Please check logs."})
+
+    try:
+        data = await read_json_object(request)
+        if data is None:
+            return JSONResponse(status_code=400, content={"error": "Request body must be a JSON object"})
+        query = data.get("query")
+        if not query:
+            return JSONResponse(status_code=400, content={"error": "Query not provided"})
+
+        with metrics.stage("intent"):
+            canned = match_intent(query)
+        if canned is not None:
+            answer, sources_list = canned
+            return json_response(await save_canned_turn(request.session, data.get("conversation_id"), query, answer, sources_list))
+
+        user_limiter.acquire(user_info['email'])
+        deadline = admission_deadline()
+
+        print(f"Creating embedding for query: '{query}'")
+        query_embedding = await create_embedding(query, deadline)
+        intent = match_intent_embedding(query_embedding)
+        cached = await lookup_answer_cache(query_embedding) if intent is None else None
+        if intent is not None:
+            print("Intent matched by embedding, skipping retrieval and Gemini.")
+            answer, sources_list = intent
+        elif cached is not None:
+            print("Semantic answer cache hit, skipping retrieval and Gemini.")
+            answer, sources_list = cached
+        else:
+            fingerprint = await collection_fingerprint()
+            context_for_prompt, sources_list = await retrieve_context(query, query_embedding)
+            if context_for_prompt is None:
+                print("No relevant chunks, skipping Gemini.")
+                answer = INSUFFICIENT_INFO_MESSAGE
+            else:
+                prompt = build_prompt(context_for_prompt, query)
+                metrics.prompt_characters.observe(len(prompt))
+
+                print("Sending refined prompt to Gemini API...")
+                async with gemini_limiter.slot(deadline):
+                    with metrics.stage("generation"):
+                        answer = (await generate(prompt)).strip()
+                metrics.answer_characters.observe(len(answer))
+
+                print("Gemini response received.")
+                if answer == INSUFFICIENT_INFO_MESSAGE:
+                    sources_list = []
+            answer_cache.store(query_embedding, answer, sources_list, fingerprint)
+
+        conversation_id = await persist_turn(request.session, data.get("conversation_id"), query, answer, sources_list)
+        return json_response({
+            "answer": answer,
+            "sources": sources_list,
+            "conversation_id": conversation_id
+        })
+
+    except Rejected as e:
+        print(f"/ask not admitted: {e}")
+        return rejection_response(e)
+    except asyncio.TimeoutError:
+        print("A stage of the /ask pipeline timed out.")
+        return JSONResponse(status_code=504, content={"error": "The request took too long. Please try again."})
     except Exception as e:
+        if is_quota_error(e):
+            print(f"Gemini quota exhausted: {e}")
+            return rejection_response(e)
         print(f"An error occurred in /ask endpoint: {e}")
-        return JSONResponse(status_code=500, content={"error": "An internal server error occurred."})
\ No newline at end of file
+        return JSONResponse(status_code=500, content={"error": "An internal server error occurred."})
+
+
+def sse_event(event, payload):
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def record_generation_error(error):
+    """Timeouts, connection errors, 5xx and quota errors count against the Gemini circuit; anything else was an answer."""
+    if is_retryable(error) or is_quota_error(error):
+        gemini_breaker.record_failure()
+    else:
+        gemini_breaker.record_success()
+
+
+async def generate(prompt):
+    """Gemini answer text, within GENERATION_TIMEOUT_SECONDS. Fails fast with Rejected while the circuit is open."""
+    gemini_breaker.check()
+    try:
+        response = await asyncio.wait_for(gemini_model.generate_content_async(prompt), GENERATION_TIMEOUT_SECONDS)
+        text = response.text
+    except asyncio.CancelledError:
+        gemini_breaker.record_abandoned()
+        raise
+    except Exception as e:
+        record_generation_error(e)
+        raise
+    gemini_breaker.record_success()
+    return text
+
+
+async def stream_generation(prompt):
+    """Yields answer text fragments from Gemini as they arrive, enforcing the overall generation deadline."""
+    gemini_breaker.check()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + GENERATION_TIMEOUT_SECONDS
+
+    try:
+        response = await asyncio.wait_for(gemini_model.generate_content_async(prompt, stream=True), GENERATION_TIMEOUT_SECONDS)
+        chunks = response.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), max(deadline - loop.time(), 0))
+            except StopAsyncIteration:
+                break
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. only safety ratings) carry nothing to show
+                continue
+            if text:
+                yield text
+    except Exception as e:
+        record_generation_error(e)
+        raise
+    except BaseException:
+        # Client went away or the request was cancelled mid-stream
+        gemini_breaker.record_abandoned()
+        raise
+    gemini_breaker.record_success()
+
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: Request):
+    """
+    Streaming variant of /ask. Emits Server-Sent Events:
+      sources -> the retrieved sources, sent as soon as retrieval finishes
+      token   -> answer text fragments as Gemini produces them
+      done    -> the final answer, sources and conversation id (once the turn is saved)
+      error   -> a message if any stage fails
+    """
+    user_info = request.session.get('user')
+    if not user_info:
+        return JSONResponse(status_code=401, content={"error": "Not authenticated"})
+
+    if retriever is None or gemini_model is None:
+        return JSONResponse(status_code=503, content={"error": "Server is not ready. Please check logs."})
+
+    data = await read_json_object(request)
+    if data is None:
+        return JSONResponse(status_code=400, content={"error": "Request body must be a JSON object"})
+    query = data.get("query")
+    if not query:
+        return JSONResponse(status_code=400, content={"error": "Query not provided"})
+
+    # Canned answers are free; everything else is admitted before the stream starts, so a
+    # rate-limited client gets a real 429 instead of an error event inside a 200.
+    with metrics.stage("intent"):
+        canned = match_intent(query)
+    if canned is None:
+        try:
+            user_limiter.acquire(user_info['email'])
+        except Rejected as e:
+            print(f"/ask/stream not admitted: {e}")
+            return rejection_response(e)
+        deadline = admission_deadline()
+
+    async def event_stream():
+        try:
+            if canned is not None:
+                answer, sources_list = canned
+                result = await save_canned_turn(request.session, data.get("conversation_id"), query, answer, sources_list)
+                yield sse_event("sources", {"sources": sources_list})
+                yield sse_event("token", {"text": answer})
+                yield sse_event("done", result)
+                return
+
+            print(f"Creating embedding for query: '{query}'")
+            query_embedding = await create_embedding(query, deadline)
+            intent = match_intent_embedding(query_embedding)
+            cached = await lookup_answer_cache(query_embedding) if intent is None else None
+            if intent is not None or cached is not None:
+                print("Intent or semantic answer cache hit, skipping retrieval and Gemini.")
+                answer, sources_list = intent or cached
+                yield sse_event("sources", {"sources": sources_list})
+                yield sse_event("token", {"text": answer})
+            else:
+                fingerprint = await collection_fingerprint()
+                context_for_prompt, sources_list = await retrieve_context(query, query_embedding)
+                yield sse_event("sources", {"sources": sources_list})
+                if context_for_prompt is None:
+                    print("No relevant chunks, skipping Gemini.")
+                    answer = INSUFFICIENT_INFO_MESSAGE
+                    yield sse_event("token", {"text": answer})
+                else:
+                    prompt = build_prompt(context_for_prompt, query)
+                    metrics.prompt_characters.observe(len(prompt))
+
+                    print("Streaming refined prompt to Gemini API...")
+                    parts = []
+                    # Includes the time the client takes to accept each event
+                    async with gemini_limiter.slot(deadline):
+                        with metrics.stage("generation"):
+                            async for text in stream_generation(prompt):
+                                parts.append(text)
+                                yield sse_event("token", {"text": text})
+                    answer = "".join(parts).strip()
+                    metrics.answer_characters.observe(len(answer))
+
+                    print("Gemini stream finished.")
+                    if answer == INSUFFICIENT_INFO_MESSAGE:
+                        sources_list = []
+                answer_cache.store(query_embedding, answer, sources_list, fingerprint)
+
+            conversation_id = await persist_turn(request.session, data.get("conversation_id"), query, answer, sources_list)
+            yield sse_event("done", {
+                "answer": answer,
+                "sources": sources_list,
+                "conversation_id": conversation_id
+            })
+
+        except Rejected as e:
+            # Headers are already sent, so the status and Retry-After travel in the event
+            print(f"/ask/stream not admitted: {e}")
+            status, payload, _ = rejection(e)
+            yield sse_event("error", {**payload, "status": status})
+        except asyncio.TimeoutError:
+            print("A stage of the /ask/stream pipeline timed out.")
+            yield sse_event("error", {"error": "The request took too long. Please try again.", "status": 504})
+        except Exception as e:
+            if is_quota_error(e):
+                print(f"Gemini quota exhausted: {e}")
+                status, payload, _ = rejection(e)
+                yield sse_event("error", {**payload, "status": status})
+                return
+            print(f"An error occurred in /ask/stream endpoint: {e}")
+            yield sse_event("error", {"error": "An internal server error occurred."})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
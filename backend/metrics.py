@@ -0,0 +1,156 @@
+"""
+Minimal in-process metrics in the Prometheus text exposition format.
+
+Counters and histograms are kept per label set behind one lock; render()
+produces the /metrics body. stage() times one pipeline stage into the
+shared stage histogram and counts its errors and timeouts. stats_gauges()
+turns the existing stats() dictionaries of the caches and batchers into
+gauges at scrape time.
+"""
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+
+
+# Seconds; covers cache hits (sub-millisecond) through slow Gemini generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_metrics = []
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., count, sum]
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += 1
+            state[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, state in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames + ('le',), key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames + ('le',), key + ('+Inf',))} {state[-2]}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {state[-2]}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+stage_seconds = Histogram("rag_stage_seconds", "Time spent in each stage of the question pipeline.", ["stage"])
+stage_errors = Counter("rag_stage_errors_total", "Stage failures by kind (timeout or error).", ["stage", "kind"])
+http_request_seconds = Histogram("http_request_seconds", "HTTP request latency by route.", ["method", "route", "status"])
+cache_lookups = Counter("rag_cache_lookups_total", "Cache lookups by cache and result.", ["cache", "result"])
+canned_answers = Counter("rag_canned_answers_total", "Queries answered by the intent router, by intent and match method.",
+                         ["intent", "method"])
+retrieved_chunks = Histogram("rag_retrieved_chunks", "Chunks placed in the prompt per query.",
+                             buckets=(0, 1, 2, 3, 5, 7, 10, 15, 20, 30))
+prompt_characters = Histogram("rag_prompt_characters", "Size of the prompt sent to Gemini, in characters.",
+                              buckets=(1000, 2000, 4000, 6000, 8000, 12000, 16000, 24000, 32000, 64000))
+best_distances = Histogram("rag_best_distance", "Cosine distance of the best retrieved chunk per query.",
+                           buckets=(0.1, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.5, 0.6, 0.7, 0.8, 1.0))
+relevance_gated = Counter("rag_relevance_gated_total", "Queries answered as off-topic without calling Gemini.")
+answer_characters = Histogram("rag_answer_characters", "Size of generated answers, in characters.",
+                              buckets=(100, 250, 500, 1000, 2000, 4000, 8000))
+admission_rejections = Counter("rag_admission_rejections_total",
+                               "Requests turned away with 429/503, by reason and downstream (user for rate limits).",
+                               ["reason", "downstream"])
+
+
+@contextmanager
+def stage(name):
+    """Times the enclosed block as one pipeline stage; timeouts and errors are counted and re-raised."""
+    started = time.perf_counter()
+    try:
+        yield
+    except asyncio.TimeoutError:
+        stage_errors.inc(stage=name, kind="timeout")
+        raise
+    except Exception:
+        stage_errors.inc(stage=name, kind="error")
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage=name)
+
+
+def stats_gauges(prefix, stats):
+    """Gauge lines for the numeric entries of a stats() dictionary (nested and non-numeric values are skipped)."""
+    lines = []
+    for key, value in (stats or {}).items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        name = f"{prefix}_{key}"
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return lines
+
+
+def labeled_gauges(prefix, label, stats_by_value):
+    """Like stats_gauges, for one stats() dictionary per label value (e.g. per endpoint)."""
+    series = {}
+    for value, stats in stats_by_value.items():
+        for key, number in (stats or {}).items():
+            if isinstance(number, bool) or not isinstance(number, (int, float)):
+                continue
+            series.setdefault(f"{prefix}_{key}", []).append(f'{prefix}_{key}{{{label}="{_escape(value)}"}} {number}')
+    lines = []
+    for name, samples in series.items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(samples)
+    return lines
+
+
+def render(extra_lines=()):
+    with _lock:
+        lines = [line for metric in _metrics for line in metric.render()]
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,59 @@
+import os
+import re
+import time
+import random
+import cProfile
+import threading
+
+
+class SampledProfiler:
+    """
+    Opt-in cProfile sampling for production requests.
+
+    start() decides (with probability sample_rate, and only if no other request
+    is being profiled, since cProfile sees the whole event-loop thread) whether
+    to profile; stop() writes the profile as a .prof file named after the route
+    and its duration, keeping at most max_files of them. Open the files with
+    pstats or snakeviz.
+    """
+
+    def __init__(self, sample_rate, output_dir, max_files=200):
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._active = False
+        os.makedirs(output_dir, exist_ok=True)
+
+    def start(self):
+        if random.random() >= self.sample_rate:
+            return None
+        with self._lock:
+            if self._active:
+                return None
+            self._active = True
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile, time.perf_counter()
+
+    def stop(self, handle, label):
+        profile, started = handle
+        profile.disable()
+        elapsed_ms = 1000 * (time.perf_counter() - started)
+        with self._lock:
+            self._active = False
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_")
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{elapsed_ms:.0f}ms.prof")
+        try:
+            profile.dump_stats(path)
+            self._prune()
+        except OSError as e:
+            print(f"Could not write profile {path}: {e}")
+
+    def _prune(self):
+        files = sorted(
+            (os.path.join(self.output_dir, f) for f in os.listdir(self.output_dir) if f.endswith(".prof")),
+            key=os.path.getmtime,
+        )
+        for path in files[:-self.max_files]:
+            os.remove(path)
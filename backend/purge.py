@@ -0,0 +1,159 @@
+"""
+Background purges of a user's conversations.
+
+A purge is recorded as a PurgeJob row and then deleted in bounded batches,
+each in its own short transaction with a pause in between, so removing a
+very long history never holds locks long enough to slow down other users.
+Messages are removed in batches first; deleting the (by then empty)
+conversations is backed by ON DELETE CASCADE on messages.conversation_id.
+Jobs left unfinished by a restart are resumed at startup. Every worker of
+every replica sees the same unfinished jobs, so a job is first claimed with a
+conditional UPDATE: only a pending job, or a running one whose owner has not
+sent a heartbeat within the lease, can be taken, and only one claimant wins.
+"""
+import os
+import time
+import uuid
+import socket
+import datetime
+
+from sqlalchemy import select, delete, update, func, or_, and_
+from sqlalchemy.orm import Session
+
+import database
+
+
+ACTIVE_STATUSES = ("pending", "running")
+# Identifies this process as the owner of the jobs it claims
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaseLost(Exception):
+    """Another process took the job over (our heartbeat had expired)."""
+
+
+def create_purge_job(db: Session, user_id):
+    """Records a purge of every conversation the user has right now (later ones are kept). Returns the job id."""
+    max_conversation_id = db.execute(
+        select(func.max(database.Conversation.id)).where(database.Conversation.user_id == user_id)
+    ).scalar()
+    job = database.PurgeJob(
+        user_id=user_id,
+        max_conversation_id=max_conversation_id or 0,
+        status="pending" if max_conversation_id else "done",
+        finished_at=None if max_conversation_id else datetime.datetime.utcnow(),
+    )
+    db.add(job)
+    db.flush()
+    job_id = job.id
+    db.commit()
+    return job_id
+
+
+def active_purge_cutoff(db: Session, user_id):
+    """Highest conversation id an unfinished purge of this user will delete, or None; such conversations are hidden."""
+    PurgeJob = database.PurgeJob
+    return db.execute(
+        select(func.max(PurgeJob.max_conversation_id)).where(PurgeJob.user_id == user_id, PurgeJob.status.in_(ACTIVE_STATUSES))
+    ).scalar()
+
+
+def purge_job_status(db: Session, user_id, job_id):
+    PurgeJob = database.PurgeJob
+    job = db.execute(select(
+        PurgeJob.id, PurgeJob.status, PurgeJob.conversations_deleted, PurgeJob.messages_deleted,
+        PurgeJob.error, PurgeJob.created_at, PurgeJob.finished_at,
+    ).where(PurgeJob.id == job_id, PurgeJob.user_id == user_id)).first()
+    if job is None:
+        return None
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "conversations_deleted": job.conversations_deleted,
+        "messages_deleted": job.messages_deleted,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def unfinished_purge_jobs(db: Session):
+    PurgeJob = database.PurgeJob
+    return list(db.execute(select(PurgeJob.id).where(PurgeJob.status.in_(ACTIVE_STATUSES)).order_by(PurgeJob.id)).scalars())
+
+
+def claim_purge_job(db: Session, job_id, lease_seconds, owner=OWNER):
+    """Marks the job as running under `owner` if it is pending or its lease has expired. True if this call won it."""
+    PurgeJob = database.PurgeJob
+    now = datetime.datetime.utcnow()
+    expired = or_(PurgeJob.heartbeat_at.is_(None), PurgeJob.heartbeat_at < now - datetime.timedelta(seconds=lease_seconds))
+    result = db.execute(
+        update(PurgeJob)
+        .where(PurgeJob.id == job_id, or_(PurgeJob.status == "pending", and_(PurgeJob.status == "running", expired)))
+        .values(status="running", owner=owner, heartbeat_at=now)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def _owned(job_id, owner):
+    PurgeJob = database.PurgeJob
+    return update(PurgeJob).where(PurgeJob.id == job_id, PurgeJob.owner == owner)
+
+
+def _heartbeat(db: Session, job_id, owner, **values):
+    """Writes progress with a fresh heartbeat in the current transaction and commits it, unless the job changed owner."""
+    result = db.execute(_owned(job_id, owner).values(heartbeat_at=datetime.datetime.utcnow(), **values))
+    if result.rowcount != 1:
+        db.rollback()
+        raise LeaseLost(job_id)
+    db.commit()
+
+
+def run_purge_job(job_id, session_factory=database.SessionLocal, conversations_per_batch=50, messages_per_batch=1000,
+                  pause_seconds=0.05, lease_seconds=60.0, owner=OWNER):
+    """
+    Runs one purge to completion (blocking), if it can be claimed. Safe to re-run after an interruption.
+    Progress is written together with a heartbeat; if another process took the job over meanwhile, this run stops.
+    """
+    Conversation, Message, PurgeJob = database.Conversation, database.Message, database.PurgeJob
+    db = session_factory()
+    try:
+        job = db.execute(select(PurgeJob.user_id, PurgeJob.max_conversation_id).where(PurgeJob.id == job_id)).first()
+        if job is None or not claim_purge_job(db, job_id, lease_seconds, owner):
+            return
+
+        while True:
+            conversation_ids = list(db.execute(
+                select(Conversation.id)
+                .where(Conversation.user_id == job.user_id, Conversation.id <= job.max_conversation_id)
+                .order_by(Conversation.id).limit(conversations_per_batch)
+            ).scalars())
+            if not conversation_ids:
+                break
+
+            while True:
+                message_ids = list(db.execute(
+                    select(Message.id).where(Message.conversation_id.in_(conversation_ids)).limit(messages_per_batch)
+                ).scalars())
+                if not message_ids:
+                    break
+                deleted = db.execute(delete(Message).where(Message.id.in_(message_ids))).rowcount
+                _heartbeat(db, job_id, owner, messages_deleted=PurgeJob.messages_deleted + deleted)
+                time.sleep(pause_seconds)
+
+            deleted = db.execute(delete(Conversation).where(Conversation.id.in_(conversation_ids))).rowcount
+            _heartbeat(db, job_id, owner, conversations_deleted=PurgeJob.conversations_deleted + deleted)
+            time.sleep(pause_seconds)
+
+        _heartbeat(db, job_id, owner, status="done", finished_at=datetime.datetime.utcnow())
+    except LeaseLost:
+        print(f"Purge job {job_id} was taken over by another process; stopping.")
+    except Exception as e:
+        db.rollback()
+        print(f"Purge job {job_id} failed: {e}")
+        db.execute(_owned(job_id, owner).values(status="failed", error=str(e), finished_at=datetime.datetime.utcnow()))
+        db.commit()
+    finally:
+        db.close()
+
@@ -0,0 +1,64 @@
+"""
+Relevance gate over retrieval distances.
+
+The best (smallest) cosine distance of a result decides whether the question
+is about the course at all: above max_distance the server answers with the
+insufficient-information message without calling Gemini. Below it, chunks
+scoring much worse than the best one (best + margin) are dropped, so a sharp
+match sends few chunks to the prompt and a flat distribution keeps more.
+
+Hybrid results carry a distance of None for chunks found only by BM25; those
+are neither used to judge relevance nor dropped.
+
+The threshold comes from scripts/calibrate_relevance.py, which writes
+load_calibration()'s JSON file.
+"""
+import json
+
+
+def load_calibration(path):
+    """Returns the calibration dict written by scripts/calibrate_relevance.py, or None if the file is missing."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def best_distance(results):
+    """Smallest known distance in a single-query result, or None when no chunk has one."""
+    if not results or not results.get('distances') or not results['distances'][0]:
+        return None
+    known = [d for d in results['distances'][0] if d is not None]
+    return min(known) if known else None
+
+
+def is_relevant(results, max_distance):
+    """
+    False when the result is empty or its best distance is above max_distance.
+    Without a threshold, or when only lexical hits (no distances) came back, the result passes.
+    """
+    if not results or not results.get('ids') or not results['ids'][0]:
+        return False
+    best = best_distance(results)
+    return max_distance is None or best is None or best <= max_distance
+
+
+def trim_by_distance(results, margin, max_distance=None, min_results=1):
+    """
+    Drops chunks whose distance is more than `margin` above the best one (or above
+    max_distance), keeping at least min_results chunks and every lexical-only chunk.
+    Returns a new single-query result in the same shape.
+    """
+    best = best_distance(results)
+    if best is None or margin is None:
+        return results
+    cutoff = best + margin
+    if max_distance is not None:
+        cutoff = min(cutoff, max_distance)
+
+    keep = [
+        i for i, distance in enumerate(results['distances'][0])
+        if distance is None or distance <= cutoff or i < min_results
+    ]
+    return {key: [[results[key][0][i] for i in keep]] for key in ("ids", "documents", "metadatas", "distances")}
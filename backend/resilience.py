@@ -0,0 +1,297 @@
+"""
+Failure handling for the downstream clients (Ollama embeddings, Gemini generation).
+
+CircuitBreaker counts consecutive failures of one downstream. After
+`failure_threshold` of them it opens: calls fail at once with a 503 Rejected
+(see admission.py) instead of waiting out another timeout. After
+`reset_seconds` one trial call is let through, and its outcome closes or
+re-opens the circuit.
+
+ResilientEmbeddingClient has the same embed(texts) interface as
+EmbeddingClient and spreads calls over one or more Ollama endpoints:
+  - every attempt has its own deadline (attempt_timeout), and all attempts
+    of one call together stay within `timeout`;
+  - an attempt is sent to the least-loaded endpoint whose circuit allows it
+    (fewest calls in flight plus consecutive failures, then lowest recent
+    median latency), avoiding endpoints an earlier attempt already used;
+  - when an attempt is still running after the endpoint's recent p95 latency,
+    a hedge (second copy) goes to the next best endpoint and the first answer
+    wins; hedges are capped at `hedge_budget` of all calls so a general
+    slowdown does not double the load;
+  - failed attempts (timeouts, connection errors, 5xx) are retried with full
+    jitter backoff, since embedding a text is idempotent.
+
+Generation is not hedged or retried: a second Gemini call costs quota and a
+partially streamed answer cannot be replayed. It only gets a breaker.
+"""
+import math
+import time
+import random
+import asyncio
+from collections import deque
+
+import httpx
+
+from admission import Rejected
+from embeddings import EmbeddingClient
+
+# Circuit states, numeric so they can be exported as gauges
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+
+def is_retryable(error):
+    """Timeouts, connection failures and 5xx responses; other 4xx responses would fail the same way again."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    # The Gemini SDK raises google.api_core errors: ServerError covers 500/503/504 (DeadlineExceeded included)
+    return any(cls.__name__ == "ServerError" for cls in type(error).__mro__)
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_seconds=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+        self.short_circuited = 0
+
+    def allows(self):
+        """True if a call may go out now. In half-open state only one trial call is allowed at a time."""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = HALF_OPEN
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def retry_after(self):
+        return max(math.ceil(self.opened_at + self.reset_seconds - time.monotonic()), 1)
+
+    def check(self):
+        """Raises Rejected (503) when the circuit does not allow a call."""
+        if not self.allows():
+            self.short_circuited += 1
+            raise Rejected("circuit_open", 503, self.retry_after(), self.name)
+
+    def record_success(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def record_abandoned(self):
+        """The call was cancelled before it finished, which says nothing about the downstream."""
+        self._probing = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.opened += 1
+                print(f"Circuit '{self.name}' opened after {self.consecutive_failures} consecutive failures.")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened": self.opened,
+            "short_circuited": self.short_circuited,
+        }
+
+
+class LatencyWindow:
+    """The last `size` successful call durations, for the hedge delay and endpoint ranking."""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def quantile(self, q):
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class Endpoint:
+    def __init__(self, url, client, breaker):
+        self.url = url
+        self.client = client
+        self.breaker = breaker
+        self.latency = LatencyWindow()
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "failures": self.failures,
+            "p50_seconds": round(self.latency.quantile(0.5) or 0.0, 4),
+            "p95_seconds": round(self.latency.quantile(0.95) or 0.0, 4),
+            "circuit_state": self.breaker.state,
+            "circuit_opened": self.breaker.opened,
+        }
+
+
+class ResilientEmbeddingClient:
+    def __init__(self, urls, model="bge-m3", timeout=10.0, max_connections=32, attempt_timeout=3.0, retries=2,
+                 backoff_seconds=0.1, hedge_quantile=0.95, hedge_min_delay=0.05, hedge_budget=0.1, hedge_min_samples=20,
+                 failure_threshold=5, reset_seconds=30.0):
+        self.endpoints = [
+            Endpoint(url, EmbeddingClient(url, model=model, timeout=timeout, max_connections=max_connections),
+                     CircuitBreaker(f"ollama:{url}", failure_threshold, reset_seconds))
+            for url in urls
+        ]
+        self.timeout = timeout
+        self.attempt_timeout = attempt_timeout
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_budget = hedge_budget
+        self.hedge_min_samples = hedge_min_samples
+
+        self.calls = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failed = 0
+
+    def _pick(self, exclude=None, avoid=()):
+        """Least-loaded endpoint whose circuit allows a call, or None. Endpoints in `avoid` only if nothing else is left."""
+        ranked = sorted(
+            (e for e in self.endpoints if e is not exclude),
+            # Each recent failure counts like one more call in flight
+            key=lambda e: (e in avoid, e.in_flight + e.breaker.consecutive_failures, e.latency.quantile(0.5) or 0.0),
+        )
+        for endpoint in ranked:
+            if endpoint.breaker.allows():
+                return endpoint
+        return None
+
+    def _hedge_delay(self, endpoint):
+        if len(endpoint.latency) < self.hedge_min_samples:
+            return None
+        return max(endpoint.latency.quantile(self.hedge_quantile), self.hedge_min_delay)
+
+    async def _attempt(self, endpoint, texts, timeout):
+        endpoint.in_flight += 1
+        endpoint.calls += 1
+        started = time.monotonic()
+        try:
+            embeddings = await asyncio.wait_for(endpoint.client.embed(texts), timeout)
+        except asyncio.CancelledError:
+            # Lost a hedge race, or the caller gave up
+            endpoint.breaker.record_abandoned()
+            raise
+        except Exception as e:
+            endpoint.failures += 1
+            if is_retryable(e):
+                endpoint.breaker.record_failure()
+            else:
+                # The endpoint answered; the request itself was bad
+                endpoint.breaker.record_success()
+            raise
+        finally:
+            endpoint.in_flight -= 1
+        endpoint.latency.add(time.monotonic() - started)
+        endpoint.breaker.record_success()
+        return embeddings
+
+    async def _hedged(self, texts, timeout, tried):
+        """One attempt, plus a hedge if it is slow. Adds the endpoints it used to `tried`."""
+        primary = self._pick(avoid=tried)
+        if primary is None:
+            retry_after = min((e.breaker.retry_after() for e in self.endpoints), default=self.attempt_timeout)
+            raise Rejected("circuit_open", 503, retry_after, "ollama")
+        tried.add(primary)
+        deadline = time.monotonic() + timeout
+        first = asyncio.ensure_future(self._attempt(primary, texts, timeout))
+        attempts = [first]
+        # Whichever way this returns (an answer, an error, or the caller being cancelled), no attempt is left running
+        try:
+            delay = self._hedge_delay(primary)
+            if delay is None or delay >= timeout or self.hedged >= self.hedge_budget * self.calls:
+                return await first
+
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done:
+                return first.result()
+            # With a single endpoint the hedge goes to the same instance: a new connection can still beat a stuck one
+            backup = self._pick(exclude=primary) or (primary if primary.breaker.allows() else None)
+            if backup is None:
+                return await first
+            self.hedged += 1
+            tried.add(backup)
+            second = asyncio.ensure_future(self._attempt(backup, texts, max(deadline - time.monotonic(), 0)))
+            attempts.append(second)
+            pending = {first, second}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+            # Both failed: report the first request's error
+            return first.result()
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+
+    async def embed(self, texts):
+        """
+        Returns one embedding per input text, in order. Raises the last error once
+        retries or the overall timeout are used up, or Rejected if every circuit is open.
+        """
+        texts = list(texts)
+        self.calls += 1
+        deadline = time.monotonic() + self.timeout
+        tried = set()
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._hedged(texts, min(self.attempt_timeout, deadline - time.monotonic()), tried)
+            except Exception as e:
+                pause = random.uniform(0, self.backoff_seconds * 2 ** attempt)
+                # Leave the next attempt at least a tenth of its usual time
+                if (attempt == self.retries or not is_retryable(e)
+                        or deadline - time.monotonic() - pause < self.attempt_timeout / 10):
+                    self.failed += 1
+                    raise
+                self.retried += 1
+                await asyncio.sleep(pause)
+
+    def stats(self):
+        return {
+            "endpoints": len(self.endpoints),
+            "calls": self.calls,
+            "retried": self.retried,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "failed": self.failed,
+        }
+
+    def endpoint_stats(self):
+        return {endpoint.url: endpoint.stats() for endpoint in self.endpoints}
+
+    async def aclose(self):
+        for endpoint in self.endpoints:
+            await endpoint.client.aclose()
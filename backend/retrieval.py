@@ -0,0 +1,75 @@
+import os
+
+
+def read_index_version(version_path):
+    """The version marker scripts/03_process_and_embed.py writes next to the collection ("" if absent)."""
+    try:
+        with open(version_path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+class ChromaRetriever:
+    """
+    Retrieval backend over a chromadb collection.
+    Exposes the same query/get/count/fingerprint surface as vector_index.VectorIndex.
+    """
+
+    def __init__(self, collection, chroma_dir, version_filename="index_version"):
+        self.collection = collection
+        self.version_path = os.path.join(chroma_dir, version_filename)
+
+    def count(self):
+        return self.collection.count()
+
+    def fingerprint(self):
+        """Identifies the indexed content: the chunk count plus the version marker the ingest script writes."""
+        return f"{self.collection.count()}:{read_index_version(self.version_path)}"
+
+    def query(self, query_embeddings, n_results=10, include=None):
+        if include is None:
+            return self.collection.query(query_embeddings=query_embeddings, n_results=n_results)
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, include=include)
+
+    def get(self, ids):
+        return self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+
+
+def hybrid_query(retriever, lexical_index, query_text, query_embedding, n_results=10, candidates=20, rrf_k=60):
+    """
+    Fuses vector and BM25 results with reciprocal-rank fusion (score = sum of 1 / (rrf_k + rank)).
+
+    Both sides are over-fetched to `candidates` hits. Chunks found only lexically are
+    fetched from the retriever by id and carry a distance of None.
+    Returns a single-query result in chromadb's Collection.query shape.
+    """
+    vector_results = retriever.query(query_embeddings=[query_embedding], n_results=candidates)
+    lexical_hits = lexical_index.search(query_text, n_results=candidates)
+
+    fused = {}
+    chunks = {}
+    for rank, chunk_id in enumerate(vector_results['ids'][0]):
+        fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+        chunks[chunk_id] = (
+            vector_results['documents'][0][rank],
+            vector_results['metadatas'][0][rank],
+            vector_results['distances'][0][rank],
+        )
+    for rank, (chunk_id, _) in enumerate(lexical_hits):
+        fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+
+    top_ids = sorted(fused, key=fused.get, reverse=True)[:n_results]
+    missing = [chunk_id for chunk_id in top_ids if chunk_id not in chunks]
+    if missing:
+        fetched = retriever.get(missing)
+        for chunk_id, document, metadata in zip(fetched['ids'], fetched['documents'], fetched['metadatas']):
+            chunks[chunk_id] = (document, metadata, None)
+    top_ids = [chunk_id for chunk_id in top_ids if chunk_id in chunks]
+
+    return {
+        "ids": [top_ids],
+        "documents": [[chunks[chunk_id][0] for chunk_id in top_ids]],
+        "metadatas": [[chunks[chunk_id][1] for chunk_id in top_ids]],
+        "distances": [[chunks[chunk_id][2] for chunk_id in top_ids]],
+    }
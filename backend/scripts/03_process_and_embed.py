@@ -1,89 +1,259 @@
 import os
+import sys
 import json
+import time
+import uuid
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import requests
 import chromadb
 from dotenv import load_dotenv
 from google.cloud import translate
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bm25 import write_bm25_index
+from ingest_pipeline import split_batches, with_retries, StageStats, BatchingWriter
+from transcript_store import Transcript
+from chunking import chunk_transcript, chunk_word_dicts
+from translation_cache import TranslationCache
+from embedding_store import EmbeddingStore
+
 load_dotenv()
 
 # --- Configuration (remains the same) ---
 METADATA_FILE = "data/video_metadata.json"
 TRANSCRIPTS_DIR = "data/transcripts_hindi"
+TRANSCRIPTS_STORE_DIR = "data/transcripts_columnar"  # written by scripts/convert_transcripts.py
 CHROMA_DB_DIR = "data/chroma_db"
+INDEX_VERSION_FILE = os.path.join(CHROMA_DB_DIR, "index_version")
+BM25_INDEX_DIR = "data/bm25_index"
+MANIFEST_FILE = "data/index_manifest.json"
+TRANSLATION_CACHE_FILE = "data/translation_cache.sqlite"
+EMBEDDING_STORE_DIR = "data/embedding_store"
+COLLECTION_NAME = "sigma_web_dev_course"
 OLLAMA_EMBED_URL = os.getenv("OLLAMA_EMBED_URL")
+EMBED_MODEL = "bge-m3"
 GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID")
+SOURCE_LANGUAGE = "hi-IN"
+TARGET_LANGUAGE = "en"
+TRANSLATE_MODEL = os.getenv("TRANSLATE_MODEL", "general/nmt")  # part of the translation cache key
+
+# API limits and pipeline sizing
+TRANSLATE_MAX_ITEMS = 128        # segments per Cloud Translation request
+TRANSLATE_MAX_CHARS = 30000      # recommended maximum code points per request
+EMBED_MAX_ITEMS = 64             # texts per Ollama embed request
+EMBED_TIMEOUT_SECONDS = 120
+WRITE_BATCH_SIZE = 1000          # rows per collection.upsert call
+
+translate_stats = StageStats("translate")
+embed_stats = StageStats("embed")
+write_stats = StageStats("write")
 
 parent = f"projects/{GCP_PROJECT_ID}/locations/global"
 translate_client = translate.TranslationServiceClient()
+translation_cache = None  # TranslationCache, opened in __main__ unless --no-translation-cache
+embedding_store = None    # EmbeddingStore, opened in __main__ unless --no-embedding-store
 
 
-def translate_text_batch(texts, target_language="en"):
-    try:
-        response = translate_client.translate_text(
-            request={
-                "parent": parent, "contents": texts, "mime_type": "text/plain",
-                "source_language_code": "hi-IN", "target_language_code": target_language,
-            }
-        )
-        return [translation.translated_text for translation in response.translations]
-    except Exception as e:
-        print(f"  Error during batch translation: {e}")
-        return None
+def translate_text_batch(texts):
+    response = translate_client.translate_text(
+        request={
+            "parent": parent, "contents": texts, "mime_type": "text/plain",
+            "source_language_code": SOURCE_LANGUAGE, "target_language_code": TARGET_LANGUAGE,
+            "model": f"{parent}/models/{TRANSLATE_MODEL}",
+        }
+    )
+    return [translation.translated_text for translation in response.translations]
 
 def create_embeddings_batch(text_list):
-    try:
-        print(f"  Creating embeddings for {len(text_list)} chunks...")
-        response = requests.post(
-            OLLAMA_EMBED_URL, json={"model": "bge-m3", "input": text_list}
-        )
-        response.raise_for_status()
-        print("  Embeddings created successfully.")
-        return response.json().get("embeddings")
-    except requests.exceptions.RequestException as e:
-        print(f"  Error creating embeddings: {e}")
+    response = requests.post(
+        OLLAMA_EMBED_URL, json={"model": EMBED_MODEL, "input": text_list}, timeout=EMBED_TIMEOUT_SECONDS
+    )
+    response.raise_for_status()
+    embeddings = response.json().get("embeddings")
+    if not embeddings or len(embeddings) != len(text_list):
+        raise ValueError(f"expected {len(text_list)} embeddings, got {len(embeddings or [])}")
+    return embeddings
+
+def translate_texts(texts):
+    """
+    Translates any number of texts. Cached translations are reused; only the
+    distinct misses go to the API, in API-sized batches that are each retried.
+    """
+    translations = translation_cache.get_many(texts) if translation_cache else {}
+    misses = list(dict.fromkeys(text for text in texts if text not in translations))
+    for batch in split_batches(misses, TRANSLATE_MAX_ITEMS, TRANSLATE_MAX_CHARS):
+        started = time.perf_counter()
+        english = with_retries(translate_text_batch, batch, label="Translation")
+        translate_stats.record(len(batch), time.perf_counter() - started)
+        if translation_cache:
+            translation_cache.put_many(zip(batch, english))
+        translations.update(zip(batch, english))
+    return [translations[text] for text in texts]
+
+def embed_texts(texts):
+    """
+    Embeds any number of texts. Stored vectors are reused; only the distinct
+    misses go to the embed endpoint, in batches it accepts, each retried.
+    """
+    embeddings = embedding_store.get_many(texts) if embedding_store else {}
+    misses = list(dict.fromkeys(text for text in texts if text not in embeddings))
+    for batch in split_batches(misses, EMBED_MAX_ITEMS):
+        started = time.perf_counter()
+        vectors = with_retries(create_embeddings_batch, batch, label="Embedding")
+        embed_stats.record(len(batch), time.perf_counter() - started)
+        if embedding_store:
+            embedding_store.put_many(batch, vectors)
+        embeddings.update(zip(batch, vectors))
+    return [embeddings[text] for text in texts]
+
+def build_lexical_index(collection):
+    """Rebuilds the BM25 index over every chunk's English text and its original Hindi text."""
+    data = collection.get(include=["documents", "metadatas"])
+    texts = [
+        f"{document} {metadata.get('hindi_text', '')}"
+        for document, metadata in zip(data['documents'], data['metadatas'])
+    ]
+    write_bm25_index(BM25_INDEX_DIR, data['ids'], texts)
+    print(f"BM25 index written to {BM25_INDEX_DIR} ({len(texts)} chunks).")
+
+
+def mark_index_version():
+    """
+    Writes a fresh version marker next to the collection.
+    The server folds it into its collection fingerprint, so cached answers are dropped after every ingest run.
+    """
+    with open(INDEX_VERSION_FILE, 'w', encoding='utf-8') as f:
+        f.write(uuid.uuid4().hex)
+
+
+
+def chunk_id(video, chunk_data):
+    """Deterministic chunk ID: the video ID plus the chunk's start time in milliseconds."""
+    return f"{video['video_id']}:{int(round(chunk_data['start'] * 1000))}"
+
+def chunk_metadata(video, chunk_data):
+    start_time_seconds = int(chunk_data['start'])
+    video_url_with_timestamp = f"{video['url']}&t={start_time_seconds}s"
+    return {
+        "video_title": video['title'],
+        "video_number": video['number'],
+        "start_time": chunk_data['start'],
+        "end_time": chunk_data['end'],
+        "youtube_url": video_url_with_timestamp,
+        "hindi_text": chunk_data['text']
+    }
+
+def content_hash(metadata):
+    """Hash of everything stored for a chunk except its translation and embedding (which derive from it)."""
+    payload = json.dumps(metadata, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {"collection": COLLECTION_NAME, "chunks": {}, "videos": {}}
+    with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    tmp_path = f"{MANIFEST_FILE}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_FILE)
+
+def video_of_chunk(cid):
+    """Video ID a chunk ID belongs to, or None for legacy numeric IDs."""
+    video_id, separator, _ = cid.rpartition(':')
+    return video_id if separator else None
+
+
+def load_video_chunks(video, chunk_options):
+    """Returns the Hindi time-based chunks for one video, or None if it has no usable transcript."""
+    base_filename = video['audio_filename'].removesuffix('.mp3')
+    store_path = os.path.join(TRANSCRIPTS_STORE_DIR, f"{base_filename}.tsc")
+    transcript_path = os.path.join(TRANSCRIPTS_DIR, f"{base_filename}.json")
+
+    # Prefer the columnar copy; fall back to the original JSON
+    if os.path.exists(store_path):
+        hindi_chunks_data = chunk_transcript(Transcript(store_path), **chunk_options)
+    elif os.path.exists(transcript_path):
+        with open(transcript_path, 'r', encoding='utf-8') as f:
+            hindi_chunks_data = chunk_word_dicts(json.load(f)['word_chunks_hindi'], **chunk_options)
+    else:
+        print(f"  [{video['number']}] Transcript not found, skipping.")
         return None
 
-def create_time_based_chunks(word_chunks, max_duration_seconds=45):
+    if not hindi_chunks_data:
+        print(f"  [{video['number']}] No chunks found in this file, skipping.")
+        return None
+    return hindi_chunks_data
+
+def plan_video(video, indexed_hashes, chunk_options):
     """
-    Groups word chunks into larger chunks based on a maximum time duration.
+    Chunks one video and compares it against what is already indexed.
+    Returns (all chunk IDs, [(id, hash, metadata), ...] for new or changed chunks), or None without a transcript.
     """
-    if not word_chunks:
-        return []
-
-    chunks = []
-    current_chunk_text = ""
-    current_chunk_start = word_chunks[0]['start']
-    
-    for word in word_chunks:
-        current_duration = word['end'] - current_chunk_start
-        
-        # If adding the next word exceeds the max duration, finalize the current chunk
-        if current_duration > max_duration_seconds and current_chunk_text:
-            chunks.append({
-                "start": current_chunk_start,
-                "end": word_chunks[len(chunks)]['end'], # Use the previous word's end time
-                "text": current_chunk_text.strip()
-            })
-            # Start a new chunk
-            current_chunk_text = ""
-            current_chunk_start = word['start']
-        
-        current_chunk_text += word['text'] + " "
-
-    # Add the last remaining chunk
-    if current_chunk_text:
-        chunks.append({
-            "start": current_chunk_start,
-            "end": word_chunks[-1]['end'],
-            "text": current_chunk_text.strip()
+    hindi_chunks_data = load_video_chunks(video, chunk_options)
+    if hindi_chunks_data is None:
+        return None
+
+    chunk_ids, changed = [], []
+    for chunk_data in hindi_chunks_data:
+        cid = chunk_id(video, chunk_data)
+        metadata = chunk_metadata(video, chunk_data)
+        digest = content_hash(metadata)
+        metadata["content_hash"] = digest
+        chunk_ids.append(cid)
+        if indexed_hashes.get(cid) != digest:
+            changed.append((cid, digest, metadata))
+    return chunk_ids, changed
+
+def translate_video(video, changed):
+    """Pipeline stage 1 (translation pool): translate the new or changed chunks of one video."""
+    english_texts = translate_texts([metadata['hindi_text'] for _, _, metadata in changed])
+    return video, changed, english_texts
+
+def embed_video(video, changed, english_texts):
+    """Pipeline stage 2 (embedding pool): embed the English chunks and build the rows to write."""
+    embeddings = embed_texts(english_texts)
+
+    rows = []
+    for (cid, digest, metadata), english_text, embedding in zip(changed, english_texts, embeddings):
+        rows.append({
+            "id": cid,
+            "content_hash": digest,
+            "embedding": embedding,
+            "document": english_text,
+            "metadata": metadata,
         })
-        
-    return chunks
+    return video, rows
 
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally chunk, translate, embed and upsert the course transcripts into Chroma.")
+    parser.add_argument("--translate-workers", type=int, default=4)
+    parser.add_argument("--embed-workers", type=int, default=2)
+    parser.add_argument("--chunk-window", type=float, default=45.0, help="maximum seconds of speech per chunk")
+    parser.add_argument("--chunk-overlap", type=float, default=0.0, help="seconds shared by consecutive chunks")
+    parser.add_argument("--boundary-slack", type=float, default=5.0,
+                        help="how far before the window end a sentence end or pause may move the cut")
+    parser.add_argument("--translation-cache", default=TRANSLATION_CACHE_FILE,
+                        help="sqlite file of cached translations, keyed by source text, language pair and model")
+    parser.add_argument("--no-translation-cache", action="store_true", help="always call the translation API")
+    parser.add_argument("--warm-translation-cache", action="store_true",
+                        help="seed the translation cache from the existing collection's hindi_text/document pairs first")
+    parser.add_argument("--embedding-store", default=EMBEDDING_STORE_DIR,
+                        help="directory of stored embeddings, keyed by model and text hash")
+    parser.add_argument("--no-embedding-store", action="store_true", help="always call the embed endpoint")
+    args = parser.parse_args()
+    chunk_options = {
+        "window_seconds": args.chunk_window,
+        "overlap_seconds": args.chunk_overlap,
+        "boundary_slack_seconds": args.boundary_slack,
+    }
+
     if not os.path.exists(CHROMA_DB_DIR):
         os.makedirs(CHROMA_DB_DIR)
 
@@ -92,70 +262,145 @@ if __name__ == "__main__":
 
     client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
     collection = client.get_or_create_collection(
-        name="sigma_web_dev_course",
+        name=COLLECTION_NAME,
         metadata={"hnsw:space": "cosine"}
     )
 
-    doc_id_counter = collection.count()
-    print(f"Starting document ID from: {doc_id_counter}")
+    if not args.no_translation_cache:
+        translation_cache = TranslationCache(args.translation_cache, SOURCE_LANGUAGE, TARGET_LANGUAGE, TRANSLATE_MODEL)
+        if args.warm_translation_cache:
+            print(f"Warmed the translation cache with {translation_cache.warm_from_collection(collection)} translations from the collection.")
+    if not args.no_embedding_store:
+        embedding_store = EmbeddingStore(args.embedding_store, EMBED_MODEL)
+
+    # Trust the manifest only for chunks that are actually in the collection
+    manifest = load_manifest()
+    existing_ids = set(collection.get(include=[])['ids'])
+    indexed_hashes = {cid: digest for cid, digest in manifest['chunks'].items() if cid in existing_ids}
 
+    # 1. Plan: chunk every transcript and find new or changed chunks
+    expected_ids = set()
+    work = []
+    new_chunk_ids = {}  # video ID -> chunk IDs, for videos with new or changed chunks
     for video in videos:
-        print(f"\n----- Processing and embedding: {video['title']} -----")
-        
-        base_filename = video['audio_filename'].removesuffix('.mp3')
-        transcript_path = os.path.join(TRANSCRIPTS_DIR, f"{base_filename}.json")
-        
-        if not os.path.exists(transcript_path):
-            print(f"  Transcript not found, skipping.")
+        plan = plan_video(video, indexed_hashes, chunk_options)
+        if plan is None:
+            # Keep whatever was indexed before rather than deleting a video whose transcript is missing
+            expected_ids.update(manifest['videos'].get(video['video_id'], []))
             continue
+        chunk_ids, changed = plan
+        expected_ids.update(chunk_ids)
+        if changed:
+            work.append((video, changed))
+            new_chunk_ids[video['video_id']] = chunk_ids
+        else:
+            manifest['videos'][video['video_id']] = chunk_ids
 
-        with open(transcript_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+    # Chunks that no longer exist (removed videos, re-chunked boundaries, legacy numeric IDs) are deleted
+    # only after the pipeline, and a video's old chunks only once all of its new rows are written, so a
+    # failed or interrupted video keeps its previous chunks searchable
+    stale_ids = sorted(existing_ids - expected_ids)
+    remaining_rows = {video['video_id']: len(changed) for video, changed in work}
+    print(f"{sum(len(changed) for _, changed in work)} new or changed chunks in {len(work)} videos; {len(stale_ids)} stale chunks.")
 
+    def write_rows(rows):
+        collection.upsert(
+            ids=[row['id'] for row in rows],
+            embeddings=[row['embedding'] for row in rows],
+            documents=[row['document'] for row in rows],
+            metadatas=[row['metadata'] for row in rows],
+        )
+        # Only the writer thread touches manifest['chunks'] and remaining_rows while the pipeline runs
+        for row in rows:
+            manifest['chunks'][row['id']] = row['content_hash']
+            remaining_rows[video_of_chunk(row['id'])] -= 1
 
-        hindi_chunks_data = create_time_based_chunks(data['word_chunks_hindi'])
-        
-        if not hindi_chunks_data:
-            print("  No chunks found in this file, skipping.")
-            continue
-            
-        print(f"  Found {len(hindi_chunks_data)} semantic chunks to process for this video.")
+    def delete_stale_chunks():
+        """Deletes the stale chunks that can go now and updates the manifest to match. Returns how many were deleted."""
+        complete = {video_id for video_id, remaining in remaining_rows.items() if remaining == 0}
+        for video_id in complete:
+            manifest['videos'][video_id] = new_chunk_ids[video_id]
+        for video_id in set(remaining_rows) - complete:
+            # Old chunks stay until a later run completes the video; list them with the new rows written so far
+            manifest['videos'][video_id] = sorted(
+                set(manifest['videos'].get(video_id, [])) | {cid for cid in new_chunk_ids[video_id] if cid in manifest['chunks']}
+            )
+        all_complete = len(complete) == len(remaining_rows)
 
-        # (The rest of the script remains the same)
-        hindi_texts = [s['text'] for s in hindi_chunks_data]
-        english_texts = translate_text_batch(hindi_texts)
+        def can_delete(cid):
+            video_id = video_of_chunk(cid)
+            if video_id is None:
+                # Legacy IDs cannot be attributed to a video, so they go only when every video was completed
+                return all_complete
+            return video_id not in remaining_rows or video_id in complete
 
-        if not english_texts:
-            print("  Translation failed for this file, skipping.")
-            continue
+        deletable = [cid for cid in stale_ids if can_delete(cid)]
+        for start in range(0, len(deletable), WRITE_BATCH_SIZE):
+            collection.delete(ids=deletable[start:start + WRITE_BATCH_SIZE])
+        for cid in deletable:
+            manifest['chunks'].pop(cid, None)
+        known_video_ids = {video['video_id'] for video in videos}
+        manifest['videos'] = {vid: ids for vid, ids in manifest['videos'].items() if vid in known_video_ids}
+        return len(deletable)
 
-        embeddings = create_embeddings_batch(english_texts)
+    # 2. Translation of later videos overlaps embedding of earlier ones; one writer batches collection.upsert
+    pipeline_start = time.perf_counter()
+    writer = BatchingWriter(write_rows, WRITE_BATCH_SIZE, write_stats)
+    writer.start()
+    videos_done = 0
 
-        if not embeddings or len(embeddings) != len(english_texts):
-            print("  Embedding failed or mismatch in counts for this file, skipping.")
-            continue
+    try:
+        with ThreadPoolExecutor(max_workers=args.translate_workers) as translate_pool, \
+             ThreadPoolExecutor(max_workers=args.embed_workers) as embed_pool:
+            pending = {translate_pool.submit(translate_video, video, changed): "translate" for video, changed in work}
 
-        metadatas = []
-        ids = []
-        for i, chunk_data in enumerate(hindi_chunks_data):
-            start_time_seconds = int(chunk_data['start'])
-            video_url_with_timestamp = f"{video['url']}&t={start_time_seconds}s"
-            
-            metadatas.append({
-                "video_title": video['title'],
-                "video_number": video['number'],
-                "start_time": chunk_data['start'],
-                "end_time": chunk_data['end'],
-                "youtube_url": video_url_with_timestamp,
-                "hindi_text": chunk_data['text']
-            })
-            ids.append(str(doc_id_counter))
-            doc_id_counter += 1
-
-        collection.add(
-            embeddings=embeddings, documents=english_texts, metadatas=metadatas, ids=ids
-        )
-        print(f"  Successfully added {len(ids)} documents from this file to the database.")
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = pending.pop(future)
+
+                    if stage == "translate":
+                        try:
+                            video, changed, english_texts = future.result()
+                        except Exception as e:
+                            translate_stats.record_failure()
+                            print(f"  Translation failed, skipping video: {e}")
+                            continue
+                        print(f"  [{video['number']}] Translated {len(english_texts)} chunks: {video['title']}")
+                        pending[embed_pool.submit(embed_video, video, changed, english_texts)] = "embed"
+
+                    else:
+                        try:
+                            video, rows = future.result()
+                        except Exception as e:
+                            embed_stats.record_failure()
+                            print(f"  Embedding failed, skipping video: {e}")
+                            continue
+                        writer.put(rows)
+                        videos_done += 1
+                        print(f"  [{video['number']}] Embedded {len(rows)} chunks ({videos_done} videos done)")
+    finally:
+        # Record whatever was written, even if the run is interrupted
+        try:
+            writer.close()
+        finally:
+            # 3. Drop the stale chunks of completed videos, in the same step as the manifest update
+            deleted = delete_stale_chunks()
+            save_manifest(manifest)
+    wall_seconds = time.perf_counter() - pipeline_start
+    if deleted < len(stale_ids):
+        print(f"{len(stale_ids) - deleted} stale chunks kept until their videos are re-indexed successfully.")
 
+    if work or deleted:
+        build_lexical_index(collection)
+        mark_index_version()
     print(f"\n----- Embedding and Loading Complete! -----")
+    print(f"Processed {videos_done} videos in {wall_seconds:.1f}s")
+    for stats in (translate_stats, embed_stats, write_stats):
+        print(stats.report(wall_seconds))
+    if embedding_store:
+        print(embedding_store.report())
+    if translation_cache:
+        print(translation_cache.report())
+        translation_cache.close()
     print(f"Total documents in collection: {collection.count()}")
\ No newline at end of file
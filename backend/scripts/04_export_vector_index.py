@@ -0,0 +1,34 @@
+import os
+import sys
+import argparse
+import chromadb
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vector_index import write_vector_index, fetch_collection
+from retrieval import read_index_version
+
+# Configuration
+CHROMA_DB_DIR = "data/chroma_db"
+COLLECTION_NAME = "sigma_web_dev_course"
+INDEX_VERSION_FILE = os.path.join(CHROMA_DB_DIR, "index_version")
+VECTOR_INDEX_DIR = "data/vector_index"
+PAGE_SIZE = 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the Chroma collection into a memory-mapped exact-search snapshot.")
+    parser.add_argument("--output", default=VECTOR_INDEX_DIR)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32",
+                        help="float16 halves the file, but every server worker upcasts it to a private float32 copy")
+    args = parser.parse_args()
+
+    client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
+    collection = client.get_collection(name=COLLECTION_NAME)
+
+    print(f"Reading {collection.count()} chunks from '{COLLECTION_NAME}'...")
+    ids, embeddings, documents, metadatas = fetch_collection(collection, page_size=PAGE_SIZE)
+
+    print(f"Writing snapshot to {args.output} ({args.dtype})...")
+    write_vector_index(args.output, ids, embeddings, documents, metadatas, dtype=args.dtype,
+                       source_version=read_index_version(INDEX_VERSION_FILE))
+    print(f"----- Export Complete! {len(ids)} chunks written. -----")
@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import numpy as np
+from transcript_store import Transcript
+from chunking import chunk_transcript, chunk_word_dicts
+
+# Configuration
+TRANSCRIPTS_DIR = "data/transcripts_hindi"
+TRANSCRIPTS_STORE_DIR = "data/transcripts_columnar"
+
+
+def legacy_chunks(word_chunks, max_duration_seconds=45):
+    """The previous create_time_based_chunks, kept here as the baseline (including its end-time bug)."""
+    if not word_chunks:
+        return []
+    chunks = []
+    current_chunk_text = ""
+    current_chunk_start = word_chunks[0]['start']
+    for word in word_chunks:
+        current_duration = word['end'] - current_chunk_start
+        if current_duration > max_duration_seconds and current_chunk_text:
+            chunks.append({
+                "start": current_chunk_start,
+                "end": word_chunks[len(chunks)]['end'],
+                "text": current_chunk_text.strip()
+            })
+            current_chunk_text = ""
+            current_chunk_start = word['start']
+        current_chunk_text += word['text'] + " "
+    if current_chunk_text:
+        chunks.append({"start": current_chunk_start, "end": word_chunks[-1]['end'], "text": current_chunk_text.strip()})
+    return chunks
+
+
+def timed(func, inputs):
+    start = time.perf_counter()
+    outputs = [func(item) for item in inputs]
+    return time.perf_counter() - start, outputs
+
+
+def describe(name, seconds, outputs, word_chunks_list):
+    chunks = [chunk for output in outputs for chunk in output]
+    durations = np.array([c['end'] - c['start'] for c in chunks])
+    # A chunk's true end is the end of its last word: locate its first word (start time, then text, since
+    # zero-length words share a start) and count words from there
+    errors = []
+    for output, words in zip(outputs, word_chunks_list):
+        word_starts = np.round([w['start'] for w in words], 3)
+        word_ends = np.array([w['end'] for w in words])
+        for chunk in output:
+            tokens = chunk['text'].split()
+            lo, hi = np.searchsorted(word_starts, round(chunk['start'], 3), side='left'), np.searchsorted(word_starts, round(chunk['start'], 3), side='right')
+            first = next((i for i in range(lo, hi) if words[i]['text'] == tokens[0]), int(lo))
+            last = min(first + len(tokens), len(words)) - 1
+            errors.append(abs(chunk['end'] - word_ends[last]))
+    errors = np.array(errors)
+    print(f"{name:<16} {1000 * seconds:9.1f} {len(chunks):8} {durations.mean():9.1f} {durations.max():9.1f} "
+          f"{np.mean(errors > 0.001) * 100:9.1f}% {errors.max():10.1f}")
+
+
+if __name__ == "__main__":
+    names = sorted(f.removesuffix('.json') for f in os.listdir(TRANSCRIPTS_DIR) if f.endswith('.json'))
+    word_chunks_list = []
+    for name in names:
+        with open(os.path.join(TRANSCRIPTS_DIR, f"{name}.json"), 'r', encoding='utf-8') as f:
+            word_chunks_list.append(json.load(f)['word_chunks_hindi'])
+    print(f"{len(names)} transcripts, {sum(len(w) for w in word_chunks_list)} words\n")
+    print(f"{'chunker':<16} {'ms':>9} {'chunks':>8} {'mean s':>9} {'max s':>9} {'bad ends':>10} {'max err s':>10}")
+
+    describe("legacy", *timed(legacy_chunks, word_chunks_list), word_chunks_list)
+    describe("new (json)", *timed(chunk_word_dicts, word_chunks_list), word_chunks_list)
+    describe("new, 5s overlap", *timed(lambda w: chunk_word_dicts(w, overlap_seconds=5.0), word_chunks_list), word_chunks_list)
+
+    if os.path.isdir(TRANSCRIPTS_STORE_DIR):
+        transcripts = [Transcript(os.path.join(TRANSCRIPTS_STORE_DIR, f"{name}.tsc")) for name in names]
+        describe("new (columnar)", *timed(chunk_transcript, transcripts), word_chunks_list)
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import chromadb
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from retrieval import ChromaRetriever
+from vector_index import VectorIndex
+
+# Configuration
+CHROMA_DB_DIR = "data/chroma_db"
+COLLECTION_NAME = "sigma_web_dev_course"
+VECTOR_INDEX_DIR = "data/vector_index"
+
+
+def percentile_ms(samples, q):
+    return 1000 * float(np.percentile(samples, q))
+
+
+def time_backend(backend, queries, n_results, warmup=5):
+    for query in queries[:warmup]:
+        backend.query(query_embeddings=[query], n_results=n_results)
+
+    timings, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = backend.query(query_embeddings=[query], n_results=n_results)
+        timings.append(time.perf_counter() - start)
+        results.append(result['ids'][0])
+    return timings, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare Chroma and the exact NumPy index on the same queries.")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--n-results", type=int, default=7)
+    parser.add_argument("--noise", type=float, default=0.05,
+                        help="noise added to stored vectors to make query vectors")
+    args = parser.parse_args()
+
+    collection = chromadb.PersistentClient(path=CHROMA_DB_DIR).get_collection(name=COLLECTION_NAME)
+    backends = {
+        "chroma": ChromaRetriever(collection, CHROMA_DB_DIR),
+        "numpy": VectorIndex(VECTOR_INDEX_DIR),
+    }
+
+    # Perturbed copies of stored chunk vectors stand in for real query embeddings
+    rng = np.random.default_rng(0)
+    index = backends["numpy"]
+    rows = rng.integers(0, index.count(), size=args.queries)
+    queries = np.asarray(index.vectors[rows], dtype=np.float32)
+    queries += rng.normal(0, args.noise, size=queries.shape).astype(np.float32)
+    queries = queries.tolist()
+
+    print(f"{index.count()} chunks, {args.queries} queries, n_results={args.n_results}\n")
+    print(f"{'backend':<8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'qps':>9}")
+    all_results = {}
+    for name, backend in backends.items():
+        timings, all_results[name] = time_backend(backend, queries, args.n_results)
+        print(f"{name:<8} {1000 * np.mean(timings):9.3f} {percentile_ms(timings, 50):9.3f} "
+              f"{percentile_ms(timings, 95):9.3f} {percentile_ms(timings, 99):9.3f} {len(timings) / sum(timings):9.0f}")
+
+    # The NumPy index is exact, so overlap is Chroma's HNSW recall against ground truth
+    overlap = np.mean([
+        len(set(a) & set(b)) / max(len(b), 1)
+        for a, b in zip(all_results["chroma"], all_results["numpy"])
+    ])
+    print(f"\nChroma recall@{args.n_results} vs exact search: {overlap:.3f}")
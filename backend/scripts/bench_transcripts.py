@@ -0,0 +1,58 @@
+import os
+import json
+import time
+from transcript_store import Transcript
+
+# Configuration
+TRANSCRIPTS_DIR = "data/transcripts_hindi"
+TRANSCRIPTS_STORE_DIR = "data/transcripts_columnar"
+
+
+def directory_size(path, suffix):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path) if f.endswith(suffix))
+
+
+def load_json_all(names):
+    """The JSON path: parse each file and pull out the word times (what chunking needs)."""
+    total_words = 0
+    for name in names:
+        with open(os.path.join(TRANSCRIPTS_DIR, f"{name}.json"), 'r', encoding='utf-8') as f:
+            words = json.load(f)['word_chunks_hindi']
+        starts = [w['start'] for w in words]
+        total_words += len(starts)
+    return total_words
+
+
+def load_columnar_all(names):
+    """The columnar path: map each file and touch the start-time array."""
+    total_words = 0
+    for name in names:
+        transcript = Transcript(os.path.join(TRANSCRIPTS_STORE_DIR, f"{name}.tsc"))
+        total_words += int(transcript.starts.shape[0])
+        transcript.starts.sum()
+    return total_words
+
+
+def best_of(func, names, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        words = func(names)
+        timings.append(time.perf_counter() - start)
+    return min(timings), words
+
+
+if __name__ == "__main__":
+    names = sorted(f.removesuffix('.tsc') for f in os.listdir(TRANSCRIPTS_STORE_DIR) if f.endswith('.tsc'))
+    json_bytes = directory_size(TRANSCRIPTS_DIR, '.json')
+    store_bytes = directory_size(TRANSCRIPTS_STORE_DIR, '.tsc')
+
+    json_seconds, json_words = best_of(load_json_all, names, repeats=3)
+    store_seconds, store_words = best_of(load_columnar_all, names, repeats=3)
+    assert json_words == store_words, "word counts differ between formats"
+
+    print(f"{len(names)} transcripts, {json_words} words\n")
+    print(f"{'format':<10} {'disk MB':>9} {'load ms':>9}")
+    print(f"{'json':<10} {json_bytes / 2**20:9.1f} {1000 * json_seconds:9.1f}")
+    print(f"{'columnar':<10} {store_bytes / 2**20:9.1f} {1000 * store_seconds:9.1f}")
+    print(f"\nDisk: {json_bytes / store_bytes:.1f}x smaller, load: {json_seconds / store_seconds:.1f}x faster")
@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import requests
+import numpy as np
+import chromadb
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from retrieval import ChromaRetriever
+from vector_index import VectorIndex
+
+load_dotenv()
+
+# Configuration
+CHROMA_DB_DIR = "data/chroma_db"
+COLLECTION_NAME = "sigma_web_dev_course"
+VECTOR_INDEX_DIR = "data/vector_index"
+QUESTIONS_FILE = "data/relevance_questions.jsonl"
+CALIBRATION_FILE = "data/relevance_calibration.json"
+OLLAMA_EMBED_URL = os.getenv("OLLAMA_EMBED_URL")
+EMBED_MODEL = "bge-m3"
+EMBED_MAX_ITEMS = 64
+EMBED_TIMEOUT_SECONDS = 120
+
+
+def load_questions(path):
+    """Reads the labeled set: one {"question": ..., "answerable": true|false} object per line."""
+    questions = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                questions.append((row['question'], bool(row['answerable'])))
+    return questions
+
+
+def embed(texts):
+    embeddings = []
+    for start in range(0, len(texts), EMBED_MAX_ITEMS):
+        batch = texts[start:start + EMBED_MAX_ITEMS]
+        response = requests.post(OLLAMA_EMBED_URL, json={"model": EMBED_MODEL, "input": batch}, timeout=EMBED_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        embeddings.extend(response.json()["embeddings"])
+    return embeddings
+
+
+def threshold_for_recall(answerable_distances, off_topic_distances, target_recall):
+    """
+    Smallest threshold that lets at least target_recall of the answerable questions through,
+    moved halfway towards the next off-topic distance above it (which stays gated) for slack.
+    """
+    ordered = np.sort(answerable_distances)
+    index = max(math.ceil(target_recall * len(ordered)) - 1, 0)
+    threshold = float(ordered[index])
+    above = off_topic_distances[off_topic_distances > threshold]
+    if len(above):
+        threshold = (threshold + float(above.min())) / 2
+    return threshold
+
+
+def rates(threshold, answerable, off_topic):
+    recall = float(np.mean(answerable <= threshold)) if len(answerable) else 0.0
+    gated = float(np.mean(off_topic > threshold)) if len(off_topic) else 0.0
+    return recall, gated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Derive the server's relevance-gate threshold from a labeled question set."
+    )
+    parser.add_argument("--questions", default=QUESTIONS_FILE, help="JSONL of {question, answerable}")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default="chroma")
+    parser.add_argument("--chroma-dir", default=CHROMA_DB_DIR)
+    parser.add_argument("--vector-index", default=VECTOR_INDEX_DIR)
+    parser.add_argument("--target-recall", type=float, default=0.98,
+                        help="share of answerable questions that must still reach Gemini")
+    parser.add_argument("--margin", type=float, default=0.15,
+                        help="chunks farther than best distance + margin are dropped from the prompt")
+    parser.add_argument("--output", default=CALIBRATION_FILE)
+    args = parser.parse_args()
+
+    if args.backend == "numpy":
+        retriever = VectorIndex(args.vector_index)
+    else:
+        collection = chromadb.PersistentClient(path=args.chroma_dir).get_collection(name=COLLECTION_NAME)
+        retriever = ChromaRetriever(collection, args.chroma_dir)
+
+    questions = load_questions(args.questions)
+    embeddings = embed([question for question, _ in questions])
+    best = np.array([
+        retriever.query(query_embeddings=[embedding], n_results=1)['distances'][0][0]
+        for embedding in embeddings
+    ])
+    labels = np.array([answerable for _, answerable in questions])
+    answerable, off_topic = best[labels], best[~labels]
+    if not len(answerable):
+        sys.exit("The question set needs at least one answerable question.")
+
+    print(f"{len(answerable)} answerable, {len(off_topic)} off-topic questions")
+    print(f"best distance, answerable: min {answerable.min():.3f}  median {np.median(answerable):.3f}  max {answerable.max():.3f}")
+    if len(off_topic):
+        print(f"best distance, off-topic:  min {off_topic.min():.3f}  median {np.median(off_topic):.3f}  max {off_topic.max():.3f}")
+
+    print(f"\n{'threshold':>9} {'answerable kept':>16} {'off-topic gated':>16}")
+    for threshold in sorted(set(np.round(np.quantile(best, np.linspace(0, 1, 11)), 3))):
+        recall, gated = rates(threshold, answerable, off_topic)
+        print(f"{threshold:9.3f} {recall:16.1%} {gated:16.1%}")
+
+    max_distance = threshold_for_recall(answerable, off_topic, args.target_recall)
+    recall, gated = rates(max_distance, answerable, off_topic)
+    print(f"\nChosen max distance {max_distance:.4f}: keeps {recall:.1%} of answerable questions, "
+          f"gates {gated:.1%} of off-topic ones.")
+    for (question, is_answerable), distance in zip(questions, best):
+        if is_answerable and distance > max_distance:
+            print(f"  would be gated: {question!r} ({distance:.3f})")
+        elif not is_answerable and distance <= max_distance:
+            print(f"  would reach Gemini: {question!r} ({distance:.3f})")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            "model": EMBED_MODEL,
+            "max_distance": round(max_distance, 4),
+            "margin": args.margin,
+            "target_recall": args.target_recall,
+            "answerable_kept": round(recall, 4),
+            "off_topic_gated": round(gated, 4),
+            "questions": len(questions),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }, f, indent=4)
+    print(f"Calibration written to {args.output}; point RELEVANCE_CALIBRATION_FILE at it.")
@@ -0,0 +1,107 @@
+"""
+Time-window chunker over word timing arrays.
+
+Each chunk covers at most window_seconds of speech. Inside the last
+boundary_slack_seconds of the window the cut is moved to a sentence end
+(a word ending in । . ? !) or, failing that, the longest pause of at least
+min_pause_seconds, so chunks rarely stop mid-sentence. Consecutive chunks
+can share overlap_seconds of speech.
+
+All boundary searches are np.searchsorted over the start/end arrays and each
+chunk's text is built with a single join (or one slice of a columnar
+transcript), so chunking is linear in the number of words.
+"""
+import numpy as np
+
+
+SENTENCE_ENDINGS = ("।", ".", "?", "!", "॥")
+
+
+def sentence_end_mask(words):
+    """Boolean array marking words that end a sentence (every ending is a single character)."""
+    return np.array([word[-1:] in SENTENCE_ENDINGS for word in words], dtype=bool)
+
+
+def _find_boundary(starts, ends, sentence_ends, last, cut_from, min_pause_seconds):
+    """
+    Picks the exclusive end index of a chunk whose window ends at word index last.
+    Candidates are cuts after words in [cut_from, last); returns last if none qualifies.
+    """
+    sentence_cuts = np.flatnonzero(sentence_ends[cut_from:last])
+    if len(sentence_cuts):
+        return cut_from + int(sentence_cuts[-1]) + 1
+
+    if last - 1 > cut_from:
+        gaps = starts[cut_from + 1:last] - ends[cut_from:last - 1]
+        best = int(np.argmax(gaps))
+        if gaps[best] >= min_pause_seconds:
+            return cut_from + best + 1
+    return last
+
+
+def chunk_words(starts, ends, sentence_ends, text_between, window_seconds=45.0, overlap_seconds=0.0,
+                boundary_slack_seconds=5.0, min_pause_seconds=0.6):
+    """
+    Groups timed words into chunks.
+
+    starts, ends        word times in seconds (sequences or arrays of equal length)
+    sentence_ends       boolean array, True where a word ends a sentence
+    text_between(i, j)  space-joined text of words [i, j)
+
+    Returns [{"start", "end", "text"}, ...] where start is the first word's start
+    and end is the last word's end, both rounded to milliseconds.
+    """
+    # Columnar transcripts store float32 times; rounding to milliseconds makes both formats chunk identically
+    starts = np.round(np.asarray(starts, dtype=np.float64), 3)
+    ends = np.round(np.asarray(ends, dtype=np.float64), 3)
+    sentence_ends = np.asarray(sentence_ends, dtype=bool)
+    n = len(starts)
+    if n == 0:
+        return []
+    # Word ends should already be sorted; this keeps the searches valid if a transcript has a glitch
+    sorted_ends = np.maximum.accumulate(ends)
+
+    chunks = []
+    first = 0
+    while first < n:
+        chunk_start = starts[first]
+        # Every word ending within the window belongs to this chunk (always at least one word)
+        last = max(int(np.searchsorted(sorted_ends, chunk_start + window_seconds, side='right')), first + 1)
+
+        if last < n and boundary_slack_seconds > 0:
+            cut_from = max(int(np.searchsorted(sorted_ends, chunk_start + window_seconds - boundary_slack_seconds, side='left')), first + 1)
+            if cut_from < last:
+                last = _find_boundary(starts, ends, sentence_ends, last, cut_from, min_pause_seconds)
+
+        chunks.append({
+            "start": float(chunk_start),
+            "end": float(ends[last - 1]),
+            "text": text_between(first, last).strip(),
+        })
+
+        if last >= n:
+            break
+        if overlap_seconds > 0:
+            # Restart at the first word that begins inside the overlap, but always move forward
+            next_first = int(np.searchsorted(starts, ends[last - 1] - overlap_seconds, side='left'))
+            first = min(max(next_first, first + 1), last)
+        else:
+            first = last
+    return chunks
+
+
+def chunk_word_dicts(word_chunks, **options):
+    """chunk_words for the JSON transcript format (a list of {"start", "end", "text"} dicts)."""
+    texts = [w['text'] for w in word_chunks]
+    return chunk_words(
+        [w['start'] for w in word_chunks],
+        [w['end'] for w in word_chunks],
+        sentence_end_mask(texts),
+        lambda i, j: " ".join(texts[i:j]),
+        **options,
+    )
+
+
+def chunk_transcript(transcript, **options):
+    """chunk_words for a columnar transcript_store.Transcript; each chunk's text is one decoded slice."""
+    return chunk_words(transcript.starts, transcript.ends, transcript.sentence_ends(), transcript.text, **options)
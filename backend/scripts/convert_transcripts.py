@@ -0,0 +1,31 @@
+import os
+import json
+from transcript_store import write_transcript
+
+# Configuration
+TRANSCRIPTS_DIR = "data/transcripts_hindi"
+TRANSCRIPTS_STORE_DIR = "data/transcripts_columnar"
+
+
+def convert_all(source_dir=TRANSCRIPTS_DIR, target_dir=TRANSCRIPTS_STORE_DIR):
+    """Converts every JSON transcript that is missing or newer than its .tsc counterpart."""
+    os.makedirs(target_dir, exist_ok=True)
+    converted = 0
+    for filename in sorted(os.listdir(source_dir)):
+        if not filename.endswith(".json"):
+            continue
+        source_path = os.path.join(source_dir, filename)
+        target_path = os.path.join(target_dir, f"{filename.removesuffix('.json')}.tsc")
+        if os.path.exists(target_path) and os.path.getmtime(target_path) >= os.path.getmtime(source_path):
+            continue
+
+        with open(source_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        write_transcript(target_path, data['word_chunks_hindi'], data.get('full_transcript_hindi', ""))
+        converted += 1
+    return converted
+
+
+if __name__ == "__main__":
+    converted = convert_all()
+    print(f"Converted {converted} transcripts into {TRANSCRIPTS_STORE_DIR}.")
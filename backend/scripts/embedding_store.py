@@ -0,0 +1,123 @@
+"""
+Append-only, memory-mapped store of chunk embeddings for the ingest.
+
+One directory per model:
+    store.json    {"model", "dim", "dtype"}
+    vectors.f32   float32 rows of length dim, back to back
+    keys.bin      32-byte sha256(model, text) digests, row i <-> vectors row i
+
+Rows are only ever appended (vectors first, then keys), so a crash mid-write
+leaves at most a torn tail, which is trimmed on open. The hash -> row index
+is rebuilt from keys.bin in one pass when the store is opened.
+"""
+import os
+import json
+import hashlib
+import threading
+
+import numpy as np
+
+
+META_FILE = "store.json"
+VECTORS_FILE = "vectors.f32"
+KEYS_FILE = "keys.bin"
+DIGEST_SIZE = 32
+
+
+class EmbeddingStore:
+    def __init__(self, store_dir, model):
+        self.store_dir = store_dir
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+
+        meta_path = os.path.join(store_dir, META_FILE)
+        self.dim = None
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta['model'] != model:
+                raise ValueError(f"{store_dir} holds {meta['model']} embeddings, not {model}")
+            self.dim = meta['dim']
+
+        self._vectors_path = os.path.join(store_dir, VECTORS_FILE)
+        self._keys_path = os.path.join(store_dir, KEYS_FILE)
+        self._rows = {}
+        self._mapped = None
+        self.count = 0
+        if self.dim is not None:
+            self._load()
+
+    def _load(self):
+        keys = np.fromfile(self._keys_path, dtype=np.uint8) if os.path.exists(self._keys_path) else np.zeros(0, np.uint8)
+        vector_bytes = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        row_bytes = self.dim * 4
+        self.count = min(len(keys) // DIGEST_SIZE, vector_bytes // row_bytes)
+        # Trim a torn tail left by an interrupted append
+        if len(keys) != self.count * DIGEST_SIZE:
+            os.truncate(self._keys_path, self.count * DIGEST_SIZE)
+        if vector_bytes != self.count * row_bytes:
+            os.truncate(self._vectors_path, self.count * row_bytes)
+        digests = keys[:self.count * DIGEST_SIZE].tobytes()
+        self._rows = {digests[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE]: i for i in range(self.count)}
+
+    def _digest(self, text):
+        return hashlib.sha256(f"{self.model}\0{text}".encode('utf-8')).digest()
+
+    def _vectors(self):
+        """Memory map over every committed row, re-mapped after appends."""
+        if self._mapped is None or len(self._mapped) < self.count:
+            self._mapped = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(self.count, self.dim))
+        return self._mapped
+
+    def get_many(self, texts):
+        """Returns {text: embedding as a list of floats} for the texts already stored."""
+        with self._lock:
+            rows = {}
+            for text in set(texts):
+                row = self._rows.get(self._digest(text))
+                if row is not None:
+                    rows[text] = row
+            found = {}
+            if rows:
+                vectors = self._vectors()
+                order = sorted(rows.items(), key=lambda item: item[1])
+                block = vectors[[row for _, row in order]]
+                found = {text: vector.tolist() for (text, _), vector in zip(order, block)}
+            hits = sum(1 for text in texts if text in found)
+            self.hits += hits
+            self.misses += len(texts) - hits
+            return found
+
+    def put_many(self, texts, embeddings):
+        """Appends embeddings for texts not stored yet, in one write per file."""
+        with self._lock:
+            new = {}
+            for text, embedding in zip(texts, embeddings):
+                digest = self._digest(text)
+                if digest not in self._rows and digest not in new:
+                    new[digest] = embedding
+            if not new:
+                return
+            block = np.asarray(list(new.values()), dtype=np.float32)
+            if self.dim is None:
+                self.dim = int(block.shape[1])
+                with open(os.path.join(self.store_dir, META_FILE), 'w', encoding='utf-8') as f:
+                    json.dump({"model": self.model, "dim": self.dim, "dtype": "float32"}, f, indent=4)
+            elif block.shape[1] != self.dim:
+                raise ValueError(f"expected {self.dim}-dimensional embeddings, got {block.shape[1]}")
+
+            with open(self._vectors_path, 'ab') as f:
+                f.write(block.tobytes())
+            with open(self._keys_path, 'ab') as f:
+                f.write(b"".join(new))
+            for digest in new:
+                self._rows[digest] = self.count
+                self.count += 1
+
+    def report(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return f"  embedding store: {self.hits} hits, {self.misses} misses ({hit_rate:.0%}), {self.count} vectors"
@@ -0,0 +1,121 @@
+"""
+Building blocks for the pipelined ingest in 03_process_and_embed.py:
+API-limit-aware batch splitting, retries with jittered backoff,
+per-stage throughput counters and a single batching writer thread.
+"""
+import time
+import queue
+import random
+import threading
+
+
+def split_batches(texts, max_items, max_chars=None):
+    """
+    Splits texts into consecutive batches of at most max_items entries and,
+    if given, at most max_chars characters in total. A single text longer than
+    max_chars still gets a batch of its own.
+    """
+    batches = []
+    current, current_chars = [], 0
+    for text in texts:
+        too_many = len(current) >= max_items
+        too_long = max_chars is not None and current and current_chars + len(text) > max_chars
+        if too_many or too_long:
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(text)
+        current_chars += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def with_retries(func, *args, attempts=5, base_delay=1.0, max_delay=30.0, label="call"):
+    """Calls func(*args), retrying failures with exponential backoff and full jitter. Re-raises the last error."""
+    for attempt in range(1, attempts + 1):
+        try:
+            return func(*args)
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            print(f"  {label} failed ({e}); retry {attempt}/{attempts - 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+class StageStats:
+    """Thread-safe item and busy-time counters for one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.calls = 0
+        self.busy_seconds = 0.0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def record(self, items, seconds):
+        with self._lock:
+            self.items += items
+            self.calls += 1
+            self.busy_seconds += seconds
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def report(self, wall_seconds):
+        per_call = self.busy_seconds / self.calls if self.calls else 0.0
+        throughput = self.items / wall_seconds if wall_seconds else 0.0
+        return (f"  {self.name:<10} {self.items:>7} items  {self.calls:>5} calls  "
+                f"{per_call:7.2f}s/call  {throughput:8.1f} items/s  {self.failures} failed")
+
+
+class BatchingWriter(threading.Thread):
+    """
+    Single consumer that accumulates rows from worker threads and hands them
+    to write_fn in batches of up to batch_size rows. Call put() with lists of
+    rows, then close() to flush the remainder and wait for the thread.
+    """
+
+    def __init__(self, write_fn, batch_size, stats):
+        super().__init__(daemon=True)
+        self.write_fn = write_fn
+        self.batch_size = batch_size
+        self.stats = stats
+        self.error = None
+        self._queue = queue.Queue(maxsize=64)
+        self._pending = []
+
+    def put(self, rows):
+        self._queue.put(rows)
+
+    def close(self):
+        self._queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        while True:
+            rows = self._queue.get()
+            if rows is None:
+                break
+            self._pending.extend(rows)
+            while len(self._pending) >= self.batch_size:
+                self._flush(self._pending[:self.batch_size])
+                self._pending = self._pending[self.batch_size:]
+        if self._pending:
+            self._flush(self._pending)
+            self._pending = []
+
+    def _flush(self, rows):
+        if self.error is not None:
+            return
+        start = time.perf_counter()
+        try:
+            self.write_fn(rows)
+            self.stats.record(len(rows), time.perf_counter() - start)
+        except Exception as e:
+            self.stats.record_failure()
+            self.error = e
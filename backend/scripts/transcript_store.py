@@ -0,0 +1,131 @@
+"""
+Columnar, memory-mappable transcript format (.tsc).
+
+Layout of one file:
+    b"TSC1" | uint32 header length | JSON header | padding to 64 bytes | sections
+
+Sections (each 64-byte aligned, positions listed in the header):
+    starts        float32[n]   word start times (seconds)
+    ends          float32[n]   word end times (seconds)
+    word_offsets  uint32[n+1]  byte offsets of each word in `words`
+    words         UTF-8        every word followed by one space, back to back
+    full_text     UTF-8        the full Hindi transcript
+
+Because each word keeps its trailing space, the text of words [i, j) is a single
+slice of `words`, so building a chunk's text needs no per-word work.
+"""
+import os
+import json
+import mmap
+import struct
+
+import numpy as np
+
+
+MAGIC = b"TSC1"
+ALIGNMENT = 64
+
+
+def _pad(length):
+    return (-length) % ALIGNMENT
+
+
+def write_transcript(path, word_chunks, full_text=""):
+    """Writes a transcript given the JSON-style list of {"start", "end", "text"} word dicts."""
+    starts = np.fromiter((w['start'] for w in word_chunks), dtype=np.float32, count=len(word_chunks))
+    ends = np.fromiter((w['end'] for w in word_chunks), dtype=np.float32, count=len(word_chunks))
+
+    encoded = [(w['text'] + " ").encode('utf-8') for w in word_chunks]
+    word_offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    np.cumsum([len(e) for e in encoded], out=word_offsets[1:])
+    sections = [
+        ("starts", starts.tobytes()),
+        ("ends", ends.tobytes()),
+        ("word_offsets", word_offsets.tobytes()),
+        ("words", b"".join(encoded)),
+        ("full_text", (full_text or "").encode('utf-8')),
+    ]
+
+    # Section positions are relative to the end of the (padded) header
+    layout, position = {}, 0
+    for name, payload in sections:
+        layout[name] = [position, len(payload)]
+        position += len(payload) + _pad(len(payload))
+    header = json.dumps({"count": len(word_chunks), "sections": layout}).encode('utf-8')
+    preamble_length = len(MAGIC) + 4 + len(header)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(b"\0" * _pad(preamble_length))
+        for _, payload in sections:
+            f.write(payload)
+            f.write(b"\0" * _pad(len(payload)))
+    os.replace(tmp_path, path)
+
+
+class Transcript:
+    """Read-only view over a .tsc file; arrays are views into one memory map, so nothing is parsed up front."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:4] != MAGIC:
+            raise ValueError(f"{path} is not a columnar transcript file")
+        (header_length,) = struct.unpack("<I", self._map[4:8])
+        header = json.loads(self._map[8:8 + header_length])
+        base = 8 + header_length
+        base += _pad(base)
+
+        self.count = header['count']
+        self._sections = {name: (base + offset, length) for name, (offset, length) in header['sections'].items()}
+        self.starts = self._array('starts', np.float32)
+        self.ends = self._array('ends', np.float32)
+        self.word_offsets = self._array('word_offsets', np.uint32)
+
+    def _array(self, name, dtype):
+        offset, length = self._sections[name]
+        return np.frombuffer(self._map, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=offset)
+
+    def __len__(self):
+        return self.count
+
+    def _bytes(self, start, end):
+        """Bytes [start, end) of the words section."""
+        base = self._sections['words'][0]
+        return self._map[base + int(start):base + int(end)]
+
+    def word(self, i):
+        return self._bytes(self.word_offsets[i], self.word_offsets[i + 1] - 1).decode('utf-8')
+
+    def text(self, i, j):
+        """Space-joined text of words [i, j), decoded from one contiguous slice."""
+        return self._bytes(self.word_offsets[i], self.word_offsets[j]).decode('utf-8').rstrip(" ")
+
+    def full_text(self):
+        offset, length = self._sections['full_text']
+        return self._map[offset:offset + length].decode('utf-8')
+
+    def sentence_ends(self):
+        """
+        Boolean array marking words that end with . ? ! । or ॥, computed from the
+        last bytes of each word without decoding any text.
+        """
+        words = self._array('words', np.uint8)
+        last = self.word_offsets[1:].astype(np.int64) - 2  # byte before each word's trailing space
+        last_byte = words[np.maximum(last, 0)]
+        ascii_end = np.isin(last_byte, (ord('.'), ord('?'), ord('!')))
+        # । is E0 A5 A4 and ॥ is E0 A5 A5 in UTF-8
+        danda = np.isin(last_byte, (0xA4, 0xA5)) & (last >= 2)
+        danda &= (words[np.maximum(last - 1, 0)] == 0xA5) & (words[np.maximum(last - 2, 0)] == 0xE0)
+        return ascii_end | danda
+
+    def word_chunks(self):
+        """The JSON-style list of word dicts, for code that still expects it (times rounded back to milliseconds)."""
+        return [
+            {"start": round(float(self.starts[i]), 3), "end": round(float(self.ends[i]), 3), "text": self.word(i)}
+            for i in range(self.count)
+        ]
@@ -0,0 +1,100 @@
+"""
+Content-addressed cache of Cloud Translation results for the ingest.
+
+Entries are keyed by sha256(source language, target language, model, source
+text), so a chunk that comes out of the chunker with the same Hindi text is
+never sent to the API twice, whatever its ID, video or position. Everything
+lives in one sqlite file (WAL mode) that the translation worker threads share.
+"""
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+def translation_key(text, source_language, target_language, model):
+    payload = "\0".join((source_language, target_language, model, text)).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+class TranslationCache:
+    def __init__(self, db_path, source_language, target_language, model):
+        self.source_language = source_language
+        self.target_language = target_language
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS translations (
+                   key TEXT PRIMARY KEY,
+                   translated_text TEXT NOT NULL,
+                   created_at REAL NOT NULL
+               )"""
+        )
+        self._db.commit()
+
+    def key(self, text):
+        return translation_key(text, self.source_language, self.target_language, self.model)
+
+    def get_many(self, texts):
+        """Returns {source text: translation} for the texts already in the cache."""
+        keys = {self.key(text): text for text in set(texts)}
+        found = {}
+        with self._lock:
+            key_list = list(keys)
+            # Stay well under sqlite's bound-parameter limit
+            for start in range(0, len(key_list), 500):
+                batch = key_list[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, translated_text FROM translations WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, translated_text in rows:
+                    found[keys[key]] = translated_text
+            hits = sum(1 for text in texts if text in found)
+            self.hits += hits
+            self.misses += len(texts) - hits
+        return found
+
+    def put_many(self, pairs):
+        """Stores (source text, translation) pairs; existing entries are replaced."""
+        now = time.time()
+        rows = [(self.key(text), translated_text, now) for text, translated_text in pairs]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO translations (key, translated_text, created_at) VALUES (?, ?, ?)", rows)
+            self._db.commit()
+
+    def warm_from_collection(self, collection, batch_size=1000):
+        """
+        Seeds the cache from a collection whose documents are translations of
+        metadata['hindi_text'] (with this cache's language pair and model).
+        Returns the number of pairs stored.
+        """
+        total = collection.count()
+        stored = 0
+        for offset in range(0, total, batch_size):
+            data = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            pairs = [
+                (metadata['hindi_text'], document)
+                for document, metadata in zip(data['documents'], data['metadatas'])
+                if metadata and metadata.get('hindi_text') and document
+            ]
+            self.put_many(pairs)
+            stored += len(pairs)
+        return stored
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def report(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return f"  translation cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0%}), {self.count()} entries"
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,59 @@
+"""
+One-time preparation the gunicorn master runs (in a child process) before forking workers.
+
+init_db() runs here once, since workers creating the tables concurrently race
+on a fresh database.
+
+Every worker opening its own chromadb.PersistentClient would load its own copy
+of the HNSW index and contend on the same sqlite files. prepare_snapshot()
+instead exports the Chroma collection into the memory-mapped vector_index
+snapshot if that is missing, stale (exported from another index_version) or
+float16. Workers then serve RETRIEVAL_BACKEND=numpy, and since the vectors,
+records and BM25 postings are mapped read-only they share one copy in the page
+cache, so memory per replica stays flat as workers are added.
+"""
+import os
+import time
+
+from retrieval import read_index_version
+from vector_index import fetch_collection, read_manifest, write_vector_index
+
+
+def snapshot_is_current(snapshot_dir, source_version):
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None:
+        return False
+    # float16 snapshots are upcast to a private float32 copy in every worker, which defeats sharing
+    return manifest.get("dtype") == "float32" and manifest.get("source_version") == source_version
+
+
+def prepare_snapshot(chroma_dir, collection_name, snapshot_dir, version_filename="index_version"):
+    """
+    Exports the collection to snapshot_dir unless an up-to-date float32 snapshot is already there.
+    Returns True if a new snapshot was written.
+    """
+    if not os.path.isdir(chroma_dir):
+        if read_manifest(snapshot_dir) is None:
+            print(f"No Chroma collection at {chroma_dir} and no snapshot at {snapshot_dir}.")
+        return False
+
+    source_version = read_index_version(os.path.join(chroma_dir, version_filename))
+    if snapshot_is_current(snapshot_dir, source_version):
+        print(f"Vector index snapshot at {snapshot_dir} is up to date (index version {source_version or 'unset'}).")
+        return False
+
+    import chromadb  # only the master needs it, and only when exporting
+
+    started = time.perf_counter()
+    collection = chromadb.PersistentClient(path=chroma_dir).get_collection(name=collection_name)
+    ids, embeddings, documents, metadatas = fetch_collection(collection)
+    write_vector_index(snapshot_dir, ids, embeddings, documents, metadatas, source_version=source_version)
+    print(f"Exported {len(ids)} chunks to {snapshot_dir} in {time.perf_counter() - started:.1f}s.")
+    return True
+
+
+def prepare_workers(chroma_dir, collection_name, snapshot_dir, export_snapshot=True):
+    import database
+    database.init_db()
+    if export_snapshot:
+        prepare_snapshot(chroma_dir, collection_name, snapshot_dir)
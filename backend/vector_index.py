@@ -0,0 +1,166 @@
+import os
+import json
+import uuid
+import shutil
+
+import numpy as np
+
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+RECORDS_FILE = "records.bin"
+OFFSETS_FILE = "offsets.npy"
+IDS_FILE = "ids.json"
+
+
+def write_vector_index(index_dir, ids, embeddings, documents, metadatas, dtype="float32", source_version=None):
+    """
+    Writes an exact-search index snapshot:
+      vectors.npy  - L2-normalized embedding matrix (float32 or float16)
+      records.bin  - one UTF-8 JSON record per chunk ({"document", "metadata"}), back to back
+      offsets.npy  - int64 byte offsets into records.bin (len = count + 1)
+      ids.json     - chunk ids in row order
+      manifest.json (source_version records the Chroma index_version it was exported from)
+    The snapshot is written to a temporary directory and swapped in, so a server never sees half of it.
+    """
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = (vectors / norms).astype(dtype)
+
+    tmp_dir = f"{index_dir.rstrip('/')}.tmp-{uuid.uuid4().hex[:8]}"
+    os.makedirs(tmp_dir)
+
+    np.save(os.path.join(tmp_dir, VECTORS_FILE), vectors)
+
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    with open(os.path.join(tmp_dir, RECORDS_FILE), 'wb') as f:
+        for i, (document, metadata) in enumerate(zip(documents, metadatas)):
+            record = json.dumps({"document": document, "metadata": metadata}, ensure_ascii=False).encode('utf-8')
+            f.write(record)
+            offsets[i + 1] = offsets[i] + len(record)
+    np.save(os.path.join(tmp_dir, OFFSETS_FILE), offsets)
+
+    with open(os.path.join(tmp_dir, IDS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(list(ids), f)
+
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            "count": len(ids),
+            "dim": int(vectors.shape[1]) if len(ids) else 0,
+            "dtype": str(vectors.dtype),
+            "version": uuid.uuid4().hex,
+            "source_version": source_version,
+        }, f, indent=4)
+
+    if os.path.exists(index_dir):
+        old_dir = f"{index_dir.rstrip('/')}.old-{uuid.uuid4().hex[:8]}"
+        os.rename(index_dir, old_dir)
+        os.rename(tmp_dir, index_dir)
+        shutil.rmtree(old_dir)
+    else:
+        os.rename(tmp_dir, index_dir)
+
+
+def fetch_collection(collection, page_size=1000):
+    """Reads every chunk's id, embedding, document and metadata from a Chroma collection, page by page."""
+    ids, embeddings, documents, metadatas = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=page_size,
+            offset=offset,
+        )
+        if not page['ids']:
+            break
+        ids.extend(page['ids'])
+        embeddings.extend(page['embeddings'])
+        documents.extend(page['documents'])
+        metadatas.extend(page['metadatas'])
+        offset += len(page['ids'])
+    return ids, embeddings, documents, metadatas
+
+
+def read_manifest(index_dir):
+    """The snapshot's manifest, or None if there is no snapshot in index_dir."""
+    try:
+        with open(os.path.join(index_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class VectorIndex:
+    """
+    Exact cosine top-k over a memory-mapped snapshot written by write_vector_index.
+
+    The vector matrix and the record store are mapped read-only, so several
+    worker processes opening the same snapshot share one copy in the page cache.
+    query() returns results in the same shape as chromadb's Collection.query,
+    with cosine distances.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        with open(os.path.join(index_dir, IDS_FILE), 'r', encoding='utf-8') as f:
+            self.ids = json.load(f)
+        self._row_by_id = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+
+        vectors = np.load(os.path.join(index_dir, VECTORS_FILE), mmap_mode='r')
+        # float16 snapshots halve the file, but BLAS only runs on float32, so upcast them once here
+        self.vectors = vectors if vectors.dtype == np.float32 else np.asarray(vectors, dtype=np.float32)
+        self.offsets = np.load(os.path.join(index_dir, OFFSETS_FILE), mmap_mode='r')
+        self._records = np.memmap(os.path.join(index_dir, RECORDS_FILE), dtype=np.uint8, mode='r') if self.offsets[-1] else None
+
+    def count(self):
+        return len(self.ids)
+
+    def fingerprint(self):
+        return f"{self.count()}:{self.manifest['version']}"
+
+    def record(self, row):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._records[start:end].tobytes().decode('utf-8'))
+
+    def top_k(self, query_embedding, n_results):
+        """Returns (rows, cosine distances) of the n_results nearest chunks, best first."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        scores = self.vectors @ query
+        k = min(n_results, scores.shape[0])
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if k < scores.shape[0]:
+            rows = np.argpartition(-scores, k - 1)[:k]
+        else:
+            rows = np.arange(k)
+        rows = rows[np.argsort(-scores[rows])]
+        return rows, 1.0 - scores[rows]
+
+    def query(self, query_embeddings, n_results=10, include=None):
+        """Mirror of chromadb Collection.query for the fields the server reads."""
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query_embedding in query_embeddings:
+            rows, distances = self.top_k(query_embedding, n_results)
+            records = [self.record(row) for row in rows]
+            result["ids"].append([self.ids[row] for row in rows])
+            result["documents"].append([r["document"] for r in records])
+            result["metadatas"].append([r["metadata"] for r in records])
+            result["distances"].append([float(d) for d in distances])
+        return result
+
+    def get(self, ids):
+        """Mirror of chromadb Collection.get(ids=...); unknown ids are skipped."""
+        rows = [self._row_by_id[chunk_id] for chunk_id in ids if chunk_id in self._row_by_id]
+        records = [self.record(row) for row in rows]
+        return {
+            "ids": [self.ids[row] for row in rows],
+            "documents": [r["document"] for r in records],
+            "metadatas": [r["metadata"] for r in records],
+        }
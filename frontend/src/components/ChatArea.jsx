@@ -6,15 +6,18 @@ import { FiSend, FiMenu } from 'react-icons/fi';
 import { motion } from 'framer-motion';
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_BASE_URL;
+const HISTORY_PAGE_SIZE = 50;
 
 export default function ChatArea({ conversationId, onNewConversationStarted, onNewChatClick , toggleSidebar}) {
     const [messages, setMessages] = useState([]);
     const [input, setInput] = useState('');
     const [isLoading, setIsLoading] = useState(false);
     const [isHistoryLoading, setIsHistoryLoading] = useState(false);
+    const [olderCursor, setOlderCursor] = useState(null);
     const [user, setUser] = useState(null);
     const [showLoginModal, setShowLoginModal] = useState(false); 
     const messagesEndRef = useRef(null);
+    const keepScrollRef = useRef(false);
 
     useEffect(() => {
         const fetchUser = async () => {
@@ -25,13 +28,24 @@ export default function ChatArea({ conversationId, onNewConversationStarted, onN
         fetchUser();
     }, []);
 
+    const fetchMessagesPage = async (before) => {
+        const params = new URLSearchParams({ limit: HISTORY_PAGE_SIZE });
+        if (before) params.set('before', before);
+        const res = await fetch(`${API_BASE_URL}/conversations/${conversationId}?${params}`, { credentials: 'include' });
+        return res.ok ? res.json() : null;
+    };
+
     useEffect(() => {
         const fetchMessages = async () => {
+            setOlderCursor(null);
             if (conversationId) {
                 setIsHistoryLoading(true); 
                 setMessages([]);
-                const res = await fetch(`${API_BASE_URL}/conversations/${conversationId}`, { credentials: 'include' });
-                if (res.ok) setMessages(await res.json());
+                const page = await fetchMessagesPage(null);
+                if (page) {
+                    setMessages(page.messages);
+                    setOlderCursor(page.next_cursor);
+                }
                 setIsHistoryLoading(false); 
             } else {
                 setMessages([]);
@@ -40,7 +54,21 @@ export default function ChatArea({ conversationId, onNewConversationStarted, onN
         if (user) fetchMessages();
     }, [conversationId, user]);
 
+    const handleLoadOlder = async () => {
+        const page = await fetchMessagesPage(olderCursor);
+        if (page) {
+            // Earlier messages go above the current view; don't jump to the bottom
+            keepScrollRef.current = true;
+            setMessages(prev => [...page.messages, ...prev]);
+            setOlderCursor(page.next_cursor);
+        }
+    };
+
     useEffect(() => {
+        if (keepScrollRef.current) {
+            keepScrollRef.current = false;
+            return;
+        }
         messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
     }, [messages, isLoading]);
 
@@ -60,20 +88,70 @@ export default function ChatArea({ conversationId, onNewConversationStarted, onN
         setIsLoading(true);
 
         try {
-            const res = await fetch(`${API_BASE_URL}/ask`, {
+            const res = await fetch(`${API_BASE_URL}/ask/stream`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 credentials: 'include',
                 body: JSON.stringify({ query: currentInput, conversation_id: conversationId })
             });
-            if (!res.ok) throw new Error("API response was not ok.");
-            const data = await res.json();
-            const botMessage = { role: 'bot', content: data.answer, sources: data.sources };
-            setMessages(prev => [...prev, botMessage]);
-            if (!conversationId) onNewConversationStarted(data.conversation_id);
+            if (!res.ok || !res.body) throw new Error("API response was not ok.");
+
+            // The bot message is added on the first event and then updated in place
+            const updateBotMessage = (patch) => {
+                setMessages(prev => {
+                    const last = prev[prev.length - 1];
+                    const base = last?.isStreaming ? last : { role: 'bot', content: '', sources: [], isStreaming: true };
+                    const updated = { ...base, ...(typeof patch === 'function' ? patch(base) : patch) };
+                    return last?.isStreaming ? [...prev.slice(0, -1), updated] : [...prev, updated];
+                });
+            };
+
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let done = null;
+
+            while (true) {
+                const { value, done: streamDone } = await reader.read();
+                if (streamDone) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                // Server-Sent Events are separated by a blank line
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const rawEvent = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+
+                    let eventName = 'message';
+                    let eventData = '';
+                    for (const line of rawEvent.split('\n')) {
+                        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                        else if (line.startsWith('data:')) eventData += line.slice(5).trim();
+                    }
+                    const payload = eventData ? JSON.parse(eventData) : {};
+
+                    if (eventName === 'sources') {
+                        updateBotMessage({ sources: payload.sources });
+                    } else if (eventName === 'token') {
+                        updateBotMessage(last => ({ content: (last?.content || '') + payload.text }));
+                    } else if (eventName === 'done') {
+                        done = payload;
+                        updateBotMessage({ content: payload.answer, sources: payload.sources, isStreaming: false });
+                    } else if (eventName === 'error') {
+                        throw new Error(payload.error);
+                    }
+                }
+            }
+
+            if (!done) throw new Error("Stream ended unexpectedly.");
+            if (!conversationId) onNewConversationStarted(done.conversation_id);
         } catch (error) {
             const errorMessage = { role: 'bot', content: 'Sorry, something went wrong. Please try again.' };
-            setMessages(prev => [...prev, errorMessage]);
+            setMessages(prev => {
+                // Replace a partially streamed answer rather than leaving it above the error
+                const base = prev[prev.length - 1]?.isStreaming ? prev.slice(0, -1) : prev;
+                return [...base, errorMessage];
+            });
         } finally {
             setIsLoading(false);
         }
@@ -106,6 +184,14 @@ export default function ChatArea({ conversationId, onNewConversationStarted, onN
                     {isHistoryLoading ? <LoadingSpinner /> 
                       :
                     (<div className="flex flex-col gap-4 max-w-4xl mx-auto">
+                        {olderCursor && (
+                            <button
+                                onClick={handleLoadOlder}
+                                className="self-center px-4 py-2 text-xs text-[#9CA3AF] rounded-2xl hover:bg-[#8B949E]/10"
+                            >
+                                Load earlier messages
+                            </button>
+                        )}
                         {messages.length === 0 && !isLoading && (
                             <Message message={{
                                 role: 'bot',
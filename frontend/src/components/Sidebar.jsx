@@ -5,23 +5,37 @@ import { motion, AnimatePresence } from 'framer-motion';
 import toast from 'react-hot-toast';
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_BASE_URL;
+const PAGE_SIZE = 30;
 
 export default function Sidebar({ onSelectConversation, activeConversationId, onNewChat, refreshTrigger, isOpen, setIsOpen }) {
     const [user, setUser] = useState(null);
     const [conversations, setConversations] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [isLoadingMore, setIsLoadingMore] = useState(false);
     const [isClearing, setIsClearing] = useState(false);
 
+    const fetchConversationsPage = async (cursor) => {
+        const params = new URLSearchParams({ limit: PAGE_SIZE });
+        if (cursor) params.set('cursor', cursor);
+        const res = await fetch(`${API_BASE_URL}/conversations?${params}`, { credentials: 'include' });
+        return res.ok ? res.json() : null;
+    };
+
     const fetchData = async () => {
         try {
             const userRes = await fetch(`${API_BASE_URL}/api/me`, { credentials: 'include' });
             if (userRes.ok) {
                 const userData = await userRes.json();
                 setUser(userData);
-                const convoRes = await fetch(`${API_BASE_URL}/conversations`, { credentials: 'include' });
-                if (convoRes.ok) setConversations(await convoRes.json());
+                const page = await fetchConversationsPage(null);
+                if (page) {
+                    setConversations(page.conversations);
+                    setNextCursor(page.next_cursor);
+                }
             } else {
                 setUser(null);
                 setConversations([]);
+                setNextCursor(null);
             }
         } catch (error) {
             console.error("Failed to fetch data:", error);
@@ -32,6 +46,22 @@ export default function Sidebar({ onSelectConversation, activeConversationId, on
         fetchData();
     }, [refreshTrigger]);
 
+    const handleLoadMore = async () => {
+        if (!nextCursor || isLoadingMore) return;
+        setIsLoadingMore(true);
+        try {
+            const page = await fetchConversationsPage(nextCursor);
+            if (page) {
+                setConversations(prev => [...prev, ...page.conversations]);
+                setNextCursor(page.next_cursor);
+            }
+        } catch (error) {
+            console.error("Failed to load more conversations:", error);
+        } finally {
+            setIsLoadingMore(false);
+        }
+    };
+
     const handleDelete = async (convoId) => {
         try {
             await fetch(`${API_BASE_URL}/conversations/${convoId}`, {
@@ -170,6 +200,15 @@ export default function Sidebar({ onSelectConversation, activeConversationId, on
                         </motion.div>
                     ))
                      )}
+                    {nextCursor && (
+                        <button
+                            onClick={handleLoadMore}
+                            disabled={isLoadingMore}
+                            className="w-full p-2 text-xs text-[#9CA3AF] rounded-2xl hover:bg-blue-300/10 disabled:opacity-50"
+                        >
+                            {isLoadingMore ? 'Loading...' : 'Load older conversations'}
+                        </button>
+                    )}
                 </div>
                 <div className="pt-4 border-t border-[#8B949E]/20">
                     {user ? (